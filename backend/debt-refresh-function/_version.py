@@ -0,0 +1 @@
+__version__ = "v5.5.0"
\ No newline at end of file
@@ -0,0 +1,163 @@
+# debt-refresh-function/main.py (v1.0.0)
+# 每日排程：以 collection group 查詢分頁讀取所有用戶的 liabilities，
+# 透過向量化攤還引擎 (loan_schedule.py，與前端同一份程式) 一次重算剩餘本金與月付金，
+# 並只將有變動的欄位以分批 (chunked) batch 寫回 Firestore。
+# 以 BATCH_SIZE 筆為一頁分頁查詢：每頁重算並寫回後才查詢下一頁，記憶體用量不隨債務總數成長。
+
+import datetime
+import firebase_admin
+from firebase_admin import firestore
+import numpy as np
+import pandas as pd
+import functions_framework
+import traceback
+from typing import Iterator
+import pytz
+from _version import __version__
+from loan_schedule import (
+    liabilities_to_arrays, outstanding_balances, normalize_rate_segments,
+    segmented_loan_state, loan_param_hash, persistable_schedule
+)
+
+# --- 初始化 Firebase App ---
+try:
+    firebase_admin.initialize_app()
+except ValueError:
+    pass
+
+BATCH_SIZE = 400  # Firestore 單一 batch 上限為 500 筆寫入
+REFRESH_FIELDS = ["outstanding_balance", "monthly_payment", "grace_period_payment_val", "interest_rate"]
+
+
+# --- 數據加載 ---
+def stream_all_liabilities(db_client, chunk_size: int = BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    以 collection group 查詢分頁讀取所有用戶的 liabilities 文件，每頁 chunk_size 筆回傳一個 DataFrame。
+    每頁都是獨立的查詢 (依文件路徑排序，從上一頁最後一筆之後開始)，不會在重算與寫回期間保持長時間開啟的串流。
+    """
+    query = db_client.collection_group('liabilities').order_by('__name__').limit(chunk_size)
+    last_doc = None
+    while True:
+        page = list((query.start_after(last_doc) if last_doc is not None else query).stream())
+        if not page:
+            return
+        last_doc = page[-1]
+        rows = []
+        for doc in page:
+            data = doc.to_dict()
+            if not data or data.get('start_date') is None:
+                continue
+            data['_ref'] = doc.reference
+            rows.append(data)
+        if rows:
+            yield pd.DataFrame(rows)
+        if len(page) < chunk_size:
+            return
+
+
+# --- 向量化計算 ---
+def calculate_loan_payments_vectorized(principal, annual_rate, years, grace_period_years):
+    """與前端 utils.calculate_loan_payments 相同的規則，一次計算所有貸款的寬限期與本息月付金。"""
+    principal = np.nan_to_num(np.asarray(principal, dtype=float))
+    annual_rate = np.nan_to_num(np.asarray(annual_rate, dtype=float))
+    years = np.nan_to_num(np.asarray(years, dtype=float))
+    grace_period_years = np.nan_to_num(np.asarray(grace_period_years, dtype=float))
+
+    valid = (annual_rate > 0) & (years > 0) & (principal > 0)
+    monthly_rate = np.where(valid, annual_rate / 100 / 12, 1.0)
+    repayment_months = years * 12 - grace_period_years * 12
+
+    grace_payment = np.where(valid & (grace_period_years > 0), np.round(principal * monthly_rate), 0.0)
+    safe_months = np.where(repayment_months > 0, repayment_months, 1.0)
+    regular_payment = np.round(principal * monthly_rate / (1 - (1 + monthly_rate) ** -safe_months))
+    regular_payment = np.where(valid & (repayment_months > 0), regular_payment, 0.0)
+    return grace_payment, regular_payment
+
+
+def recompute_liabilities(liabilities_df: pd.DataFrame, today: datetime.datetime) -> pd.DataFrame:
+    """回傳與 liabilities_df 同列順序的最新 outstanding_balance / monthly_payment / grace_period_payment_val / interest_rate。"""
+    arrays = liabilities_to_arrays(liabilities_df)
+    grace_payment, regular_payment = calculate_loan_payments_vectorized(
+        arrays['principal'], arrays['annual_rate'],
+        arrays['total_months'] / 12, arrays['grace_months'] / 12
+    )
+    months_passed = (today.year * 12 + today.month - 1) - arrays['start_month_index']
+    balances = outstanding_balances(
+        arrays['principal'], arrays['annual_rate'], arrays['total_months'],
+        arrays['grace_months'], regular_payment, months_passed
+    )
+    result = pd.DataFrame({
+        "outstanding_balance": balances,
+        "monthly_payment": regular_payment,
+        "grace_period_payment_val": grace_payment,
+        "interest_rate": arrays['annual_rate'],
+    }, index=liabilities_df.index)
+
+    # 機動利率貸款：逐段 (O(分段數)) 重新攤還
+    if 'rate_history' in liabilities_df.columns:
+        for i, (idx, loan) in enumerate(liabilities_df.iterrows()):
+            history = loan.get('rate_history')
+            if not isinstance(history, list) or not history:
+                continue
+            segments = normalize_rate_segments(loan['start_date'], history, loan.get('interest_rate', 0.0))
+            state = segmented_loan_state(arrays['principal'][i], segments, arrays['total_months'][i], arrays['grace_months'][i], months_passed[i])
+            result.loc[idx] = [state['outstanding_balance'], state['regular_payment'], state['grace_period_payment'], state['current_rate']]
+    return result
+
+
+def changed_fields(loan: pd.Series, latest: pd.Series) -> dict:
+    """只挑出與文件現值不同的欄位；攤還表快取僅在參數雜湊改變時重建。"""
+    updates = {}
+    for field in REFRESH_FIELDS:
+        new_value = float(latest[field])
+        old_value = loan.get(field)
+        if old_value is None or pd.isna(old_value) or abs(float(old_value) - new_value) > 1e-6:
+            updates[field] = new_value
+
+    if updates:
+        merged = {**loan.drop(labels=['_ref']).to_dict(), **updates}
+        cached = loan.get('schedule_cache')
+        if not isinstance(cached, dict) or cached.get('schedule_hash') != loan_param_hash(merged):
+            updates['schedule_cache'] = persistable_schedule(merged)
+    return updates
+
+
+# --- Cloud Function 主執行函數 ---
+@functions_framework.cloud_event
+def refresh_all_debt_balances(cloud_event):
+    """[v1.0.0] 每日為所有用戶重算債務剩餘本金與月付金，只寫回有變動的欄位。"""
+    print(f"--- 每日債務狀況更新服務 ({__version__}) 開始執行 ---")
+
+    try:
+        db = firestore.client()
+        taipei_tz = pytz.timezone('Asia/Taipei')
+        today = datetime.datetime.now(taipei_tz)
+
+        # 每頁最多 BATCH_SIZE 筆，變動的文件恰好可在單一 batch 內寫回
+        total, written = 0, 0
+        for liabilities_df in stream_all_liabilities(db):
+            latest_df = recompute_liabilities(liabilities_df, today)
+            batch, pending = db.batch(), 0
+            for idx, loan in liabilities_df.iterrows():
+                updates = changed_fields(loan, latest_df.loc[idx])
+                if not updates:
+                    continue
+                updates['balance_refreshed_at'] = firestore.SERVER_TIMESTAMP
+                batch.update(loan['_ref'], updates)
+                pending += 1
+            if pending:
+                batch.commit()
+            total += len(liabilities_df)
+            written += pending
+            print(f"  > 已處理 {total} 筆債務 (累計 {written} 筆有變動)")
+
+        if total == 0:
+            print("  > 資料庫中沒有任何債務，結束執行。")
+            return "OK"
+        print(f"--- ✅ 債務狀況更新完畢：{written} / {total} 筆有變動並已寫回 ---")
+        return "OK"
+
+    except Exception as e:
+        print(f"❌ [嚴重錯誤] 執行 refresh_all_debt_balances 時發生未預期錯誤！")
+        print(traceback.format_exc())
+        raise
@@ -0,0 +1,193 @@
+# file: backend/scraper-function/indicators.py (v5.5.0)
+# 技術指標計算：KDJ 全量重算 (單一市場與全市場向量化版本，驗證用) 與可持久化的遞迴 (串流) 版本。
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+KDJ_WINDOW = 9       # RSV 的高低點視窗 (期數)
+KDJ_COM = 2          # K、D 平滑參數 (ewm com=2，即 alpha = 1/3)
+KDJ_HISTORY = 3      # 狀態中保留的已收盤期數 (供輸出最近幾期)
+KDJ_ALPHA = 1 / (1 + KDJ_COM)
+
+
+def _normalize_ohlc(price_data):
+    """將單一市場的價格表欄位統一為小寫的 open/high/low/close。"""
+    df = price_data.copy()
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = [col[0].lower() for col in df.columns]
+    else:
+        df.columns = [col.lower() for col in df.columns]
+    return df
+
+
+def calculate_kdj(price_data, time_period='W-FRI'):
+    """以完整歷史重算 KDJ (週線 'W-FRI'、月線 'ME')，回傳含 K、D、J 欄位的 DataFrame。"""
+    try:
+        df = _normalize_ohlc(price_data)
+        period_df = df.resample(time_period).agg({'high': 'max', 'low': 'min', 'close': 'last', 'open': 'first'})
+        low_min = period_df['low'].rolling(window=KDJ_WINDOW, min_periods=1).min()
+        high_max = period_df['high'].rolling(window=KDJ_WINDOW, min_periods=1).max()
+        rsv = (period_df['close'] - low_min) / (high_max - low_min) * 100
+        rsv.dropna(inplace=True)
+        k = rsv.ewm(com=KDJ_COM, adjust=False).mean(); d = k.ewm(com=KDJ_COM, adjust=False).mean(); j = 3 * k - 2 * d
+        return pd.DataFrame({'K': k, 'D': d, 'J': j}).dropna()
+    except Exception as e:
+        print(f"  - ❌ 計算 {time_period} KDJ 時發生錯誤: {e}"); return None
+
+
+def resample_ohlc(price_frame, time_period, tickers):
+    """[v5.5.0 新增] 將 (欄位, ticker) 格式的日線一次重取樣為週期的高、低、收 (各為 週期 × ticker 的 DataFrame)。"""
+    high = price_frame['High'].reindex(columns=tickers).resample(time_period).max()
+    low = price_frame['Low'].reindex(columns=tickers).resample(time_period).min()
+    close = price_frame['Close'].reindex(columns=tickers).resample(time_period).last()
+    return high, low, close
+
+
+def calculate_kdj_frame(price_frame, time_period='W-FRI', tickers=None):
+    """
+    [v5.5.0 新增] 對所有市場一次全量計算 KDJ：逐欄 (ticker) 的滾動高低點與 EWM 皆在同一張表上完成。
+    各欄的 RSV 缺值位置不同，以 ignore_na=True 略過缺值，結果等同逐一市場 dropna 後計算 (calculate_kdj)。
+
+    Returns:
+        {ticker: pd.DataFrame}: 含 K、D、J 欄位。
+    """
+    tickers = list(price_frame['Close'].columns) if tickers is None else list(tickers)
+    high, low, close = resample_ohlc(price_frame, time_period, tickers)
+    low_min = low.rolling(window=KDJ_WINDOW, min_periods=1).min()
+    high_max = high.rolling(window=KDJ_WINDOW, min_periods=1).max()
+    rsv = (close - low_min) / (high_max - low_min) * 100
+    valid = rsv.notna()
+    k = rsv.ewm(com=KDJ_COM, adjust=False, ignore_na=True).mean().where(valid)
+    d = k.ewm(com=KDJ_COM, adjust=False, ignore_na=True).mean().where(valid)
+    j = 3 * k - 2 * d
+    return {t: pd.DataFrame({'K': k[t], 'D': d[t], 'J': j[t]}).dropna() for t in tickers}
+
+
+class StreamingKDJ:
+    """
+    [v5.5.0 新增] 遞迴式 KDJ：每個 (市場, 週期) 只保存最後一期已收盤的 K、D、最近 KDJ_WINDOW 期的高低點與最近幾期輸出。
+    每次執行只讀取最後收盤期之後的日線：已收盤的新週期逐期併入狀態 (每期 O(1))，
+    尚未收盤的當期則以暫時值計算、不寫入狀態，結果與全量重算 (calculate_kdj_frame) 一致。
+    verify=True 時同時全量重算並比對，誤差超過 tolerance 即以全量結果重建狀態。
+    """
+
+    def __init__(self, state_store, verify=False, tolerance=1e-6):
+        self.store = state_store
+        self.verify = verify
+        self.tolerance = tolerance
+
+    @staticmethod
+    def _window_start(label, offset):
+        return label - (KDJ_WINDOW - 1) * offset
+
+    @staticmethod
+    def _step(state, label, high, low, close, offset):
+        """將一期 (高、低、收) 併入狀態並回傳新的 (K, D, J, 視窗)；RSV 無法計算時沿用前值 (對應全量版的 dropna)。"""
+        window_start = StreamingKDJ._window_start(label, offset)
+        window = [w for w in state['window'] if pd.Timestamp(w[0]) >= window_start] + [[label.strftime('%Y-%m-%d'), float(high), float(low)]]
+        highs = [w[1] for w in window if w[1] is not None and not np.isnan(w[1])]
+        lows = [w[2] for w in window if w[2] is not None and not np.isnan(w[2])]
+        k, d = state['K'], state['D']
+        if highs and lows and close is not None and not np.isnan(close) and max(highs) != min(lows):
+            rsv = (close - min(lows)) / (max(highs) - min(lows)) * 100
+            k = rsv if k is None else (1 - KDJ_ALPHA) * k + KDJ_ALPHA * rsv
+            d = k if d is None else (1 - KDJ_ALPHA) * d + KDJ_ALPHA * k
+            return k, d, 3 * k - 2 * d, window
+        return k, d, None, window
+
+    def _fold(self, state, label, high, low, close, offset):
+        """將一個已收盤的週期永久併入狀態。"""
+        k, d, j, window = self._step(state, label, high, low, close, offset)
+        state.update({'K': k, 'D': d, 'window': window, 'last_closed': label.strftime('%Y-%m-%d')})
+        if j is not None:
+            state['history'] = (state['history'] + [[label.strftime('%Y-%m-%d'), k, d, j]])[-KDJ_HISTORY:]
+
+    def _rebuild(self, high, low, close, time_period, offset):
+        """以完整歷史 (單一市場的週期高低收) 重建狀態：最後一期視為未收盤，其餘逐期併入。"""
+        state = {'timeframe': time_period, 'K': None, 'D': None, 'window': [], 'history': [], 'last_closed': None}
+        valid = high.notna() | low.notna() | close.notna()
+        labels = valid[valid].index
+        for label in labels[:-1]:
+            self._fold(state, label, high[label], low[label], close[label], offset)
+        return state
+
+    def update(self, price_frame, tickers, time_period):
+        """
+        以最新日線 (yf.download 格式的 (欄位, ticker) MultiIndex 價格表) 一次更新所有市場在指定週期的 KDJ 狀態。
+        [v5.5.0 修正] 所有市場共用一次週期重取樣，不再逐一切片市場。
+
+        Returns:
+            {ticker: pd.DataFrame}: 最近幾期已收盤與當期 (暫時值) 的 K、D、J，索引為週期標籤。
+        """
+        try:
+            return self._update(price_frame, tickers, time_period)
+        except Exception as e:
+            print(f"  - ❌ 更新 {time_period} KDJ 狀態時發生錯誤: {e}")
+            return {t: None for t in tickers}
+
+    def _update(self, price_frame, tickers, time_period):
+        offset = to_offset(time_period)
+        keys = {t: f"{t}__{time_period}" for t in tickers}
+        states = {t: self.store.load(keys[t]) for t in tickers}
+
+        missing = [t for t in tickers if states[t] is None or states[t].get('last_closed') is None]
+        if missing:
+            high, low, close = resample_ohlc(price_frame, time_period, missing)
+            for t in missing:
+                states[t] = self._rebuild(high[t], low[t], close[t], time_period, offset)
+        self._fold_new_periods(states, price_frame, time_period, offset)
+        results = self._output(states, price_frame, time_period, offset)
+
+        if self.verify:
+            full = calculate_kdj_frame(price_frame, time_period, tickers)
+            high = low = close = None
+            for t in tickers:
+                diff = (results[t] - full[t].reindex(results[t].index)).abs().max().max()
+                if not diff <= self.tolerance:
+                    print(f"  - 注意：{t} {time_period} KDJ 狀態與全量重算相差 {diff}，重建狀態。")
+                    if high is None:
+                        high, low, close = resample_ohlc(price_frame, time_period, tickers)
+                    states[t] = self._rebuild(high[t], low[t], close[t], time_period, offset)
+                    results[t] = self._output({t: states[t]}, price_frame, time_period, offset)[t]
+
+        for t in tickers:
+            self.store.save(keys[t], states[t])
+        return results
+
+    @staticmethod
+    def _tail_periods(states, price_frame, time_period):
+        """只對「所有市場中最早的最後收盤期」之後的日線做一次重取樣 (以二分搜尋定位，不複製完整歷史)。"""
+        starts = [pd.Timestamp(s['last_closed']) for s in states.values() if s['last_closed']]
+        first = price_frame.index.searchsorted(min(starts), side='right') if len(starts) == len(states) else 0
+        return resample_ohlc(price_frame.iloc[first:], time_period, list(states))
+
+    def _fold_new_periods(self, states, price_frame, time_period, offset):
+        """將各市場上次收盤期之後、最新一期之前的週期併入狀態。"""
+        high, low, close = self._tail_periods(states, price_frame, time_period)
+        for t, state in states.items():
+            labels = self._new_labels(state, high[t], low[t], close[t])
+            for label in labels[:-1]:
+                self._fold(state, label, high.at[label, t], low.at[label, t], close.at[label, t], offset)
+
+    @staticmethod
+    def _new_labels(state, high, low, close):
+        valid = high.notna() | low.notna() | close.notna()
+        if state['last_closed']:
+            valid &= valid.index > pd.Timestamp(state['last_closed'])
+        return valid[valid].index
+
+    def _output(self, states, price_frame, time_period, offset):
+        """組合各市場最近幾期已收盤的 KDJ 與當期暫時值 (不寫入狀態)。"""
+        high, low, close = self._tail_periods(states, price_frame, time_period)
+        results = {}
+        for t, state in states.items():
+            rows = list(state['history'])
+            labels = self._new_labels(state, high[t], low[t], close[t])
+            if len(labels):
+                label = labels[-1]
+                k, d, j, _ = self._step(state, label, high.at[label, t], low.at[label, t], close.at[label, t], offset)
+                if j is not None:
+                    rows.append([label.strftime('%Y-%m-%d'), k, d, j])
+            results[t] = pd.DataFrame([r[1:] for r in rows], index=pd.to_datetime([r[0] for r in rows]), columns=['K', 'D', 'J'])
+        return results
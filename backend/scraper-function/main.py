@@ -5,12 +5,18 @@ import firebase_admin
 from firebase_admin import firestore
 from fredapi import Fred
 import yfinance as yf
-from dbnomics import fetch_series
+import requests
+import bisect
 import pandas as pd
 import datetime
 import pytz
 import functions_framework
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from _version import __version__
+from series_store import SeriesStore, FrameStore, StateStore
+from indicators import StreamingKDJ
+from series_codec import encode_series
 
 # --- 初始化 ---
 try:
@@ -20,39 +26,133 @@ except ValueError: pass
 FRED_API_KEY = os.environ.get('FRED_API_KEY')
 pd.set_option('display.float_format', lambda x: '%.2f' % x)
 
+# [v5.5.0 新增] 各數據源的並行上限與逾時秒數
+SOURCE_CONCURRENCY = {"mag7": 4, "fred": 5, "dbnomics": 4}
+SOURCE_TIMEOUTS = {"yfinance": 120, "mag7": 90, "fred": 60, "dbnomics": 60}
+# [v5.5.0 新增] 設為 1 時 KDJ 狀態每次都與全量重算比對 (驗證模式)
+KDJ_VERIFY = os.environ.get('KDJ_VERIFY', '0') == '1'
+# [v5.5.0 新增] 每日模型數據的明細子集合名稱
+MODEL_DETAIL_COLLECTION = 'details'
+
+
+# --- [v5.5.0 新增] 並行抓取工具 ---
+
+def map_concurrently(fn, items, max_workers):
+    """以執行緒池並行執行 fn(item)，回傳 {item: 結果}；個別失敗時記錄並略過該項。"""
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        futures = {pool.submit(fn, item): item for item in items}
+        for future, item in futures.items():
+            try:
+                results[item] = future.result()
+            except Exception as e:
+                print(f"  - 注意：{item} 抓取失敗: {e}")
+    return results
+
+def fetch_sources_concurrently(sources, timeouts, defaults):
+    """
+    同時啟動所有數據源的抓取工作，各自套用逾時秒數並記錄耗時。
+    逾時或失敗的數據源回傳 defaults 中的預設值 (背景執行緒無法強制中止，但不再等待其結果)。
+    """
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=len(sources))
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            print(f"  ⏱️ [{name}] 耗時 {time.perf_counter() - t0:.2f} 秒")
+
+    futures = {name: pool.submit(timed, name, fn) for name, fn in sources.items()}
+    results = {}
+    for name, future in futures.items():
+        remaining = max(0.0, timeouts.get(name, 60) - (time.perf_counter() - started))
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            print(f"  ❌ [{name}] 超過 {timeouts.get(name, 60)} 秒未完成，改用預設值。")
+            results[name] = defaults.get(name)
+        except Exception as e:
+            print(f"  ❌ [{name}] 抓取時發生錯誤: {e}")
+            results[name] = defaults.get(name)
+    pool.shutdown(wait=False, cancel_futures=True)
+    print(f"  ⏱️ [全部數據源] 總耗時 {time.perf_counter() - started:.2f} 秒")
+    return results
 
 # --- 數據抓取與計算函式庫 ---
 
-def get_yfinance_data(tickers, period="10y"):
+PRICE_FIELDS = ['Open', 'High', 'Low', 'Close']
+PRICE_HISTORY_YEARS = 10
+# [v5.5.0 新增] 增量更新時往回重抓的天數 (覆蓋盤中暫時值與來源端修正)
+PRICE_REFRESH_DAYS = 7
+
+def _download_prices(tickers, **kwargs):
+    """下載日線並整理成 {ticker: OHLC DataFrame}，去除全為空值的列。"""
+    data = yf.download(tickers, auto_adjust=True, progress=False, group_by='column', **kwargs)
+    if data is None or data.empty:
+        return {}
+    if not isinstance(data.columns, pd.MultiIndex):
+        data.columns = pd.MultiIndex.from_product([data.columns, tickers[:1]])
+    data.index = pd.to_datetime(data.index).tz_localize(None)
+    available = set(data.columns.get_level_values(1))
+    return {t: data.xs(t, axis=1, level=1)[PRICE_FIELDS].dropna(how='all') for t in tickers if t in available}
+
+def get_yfinance_data(tickers, db_client=None):
+    """
+    [v5.5.0 修正] 從 OHLC 價格儲存讀取日線，只向 yfinance 下載「最後觀測日前 PRICE_REFRESH_DAYS 天」之後的資料再合併回去；
+    尚無歷史的市場才下載完整的 PRICE_HISTORY_YEARS 年。回傳格式與 yf.download 相同 (欄位為 (欄位, ticker) 的 MultiIndex)。
+    """
     print(f"\n> [yfinance] 正在抓取 {len(tickers)} 個市場的數據...")
-    try:
-        data = yf.download(tickers, period=period, auto_adjust=True, progress=False)
-        if data.empty: raise ValueError("yfinance 未返回任何數據")
-        print(f"  ✅ [yfinance] 成功抓取數據。")
-        return data
-    except Exception as e:
-        print(f"  ❌ [yfinance] 抓取時發生錯誤: {e}"); return None
+    store = FrameStore('prices', db_client)
+    keep_since = pd.Timestamp.now().normalize() - pd.DateOffset(years=PRICE_HISTORY_YEARS)
+    last_observations = {t: store.last_observation(t) for t in tickers}
+    stale = [t for t in tickers if last_observations[t] is not None]
+    missing = [t for t in tickers if last_observations[t] is None]
 
-def calculate_kdj(price_data, time_period='W-FRI'):
+    downloaded = {}
     try:
-        df = price_data.copy()
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = [col[0].lower() for col in df.columns]
-        else:
-            df.columns = [col.lower() for col in df.columns]
-        period_df = df.resample(time_period).agg({'high': 'max', 'low': 'min', 'close': 'last', 'open': 'first'})
-        low_min = period_df['low'].rolling(window=9, min_periods=1).min()
-        high_max = period_df['high'].rolling(window=9, min_periods=1).max()
-        rsv = (period_df['close'] - low_min) / (high_max - low_min) * 100
-        rsv.dropna(inplace=True)
-        k = rsv.ewm(com=2, adjust=False).mean(); d = k.ewm(com=2, adjust=False).mean(); j = 3 * k - 2 * d
-        return pd.DataFrame({'K': k, 'D': d, 'J': j}).dropna()
+        if stale:
+            start = min(last_observations[t] for t in stale) - pd.Timedelta(days=PRICE_REFRESH_DAYS)
+            downloaded.update(_download_prices(stale, start=start.strftime('%Y-%m-%d')))
+        if missing:
+            downloaded.update(_download_prices(missing, period=f"{PRICE_HISTORY_YEARS}y"))
     except Exception as e:
-        print(f"  - ❌ 計算 {time_period} KDJ 時發生錯誤: {e}"); return None
-
-def get_fred_data(fred_instance):
+        print(f"  ❌ [yfinance] 抓取時發生錯誤: {e}，改用已儲存的價格。")
+
+    frames = {}
+    for ticker in tickers:
+        if ticker in downloaded:
+            frames[ticker], _ = store.merge(ticker, downloaded[ticker], keep_since=keep_since)
+        elif store.load(ticker) is not None:
+            frames[ticker] = store.load(ticker)
+    if not frames:
+        print("  ❌ [yfinance] 無任何可用的價格數據。"); return None
+
+    data = pd.concat(frames, axis=1, sort=True).swaplevel(axis=1).sort_index(axis=1)
+    rows = sum(len(df) for df in downloaded.values())
+    print(f"  ✅ [yfinance] 成功取得數據 (本次下載 {rows} 列，新增市場: {missing or '無'})。")
+    return data
+
+# 衍生指標定義：名稱 -> (原始指標名稱, 計算方式)
+FRED_DERIVED = {
+    "核心 PCE 物價指數年增率 (%)": ("核心 PCE 物價指數", lambda s: (s.pct_change(periods=12) * 100).round(2)),
+    "美國零售銷售年增率 (%)": ("零售銷售", lambda s: (s.pct_change(periods=12) * 100).round(2)),
+    "實質個人消費支出年增率 (%)": ("實質個人消費支出", lambda s: (s.pct_change(periods=12) * 100).round(2)),
+    "非農就業人數變化 (萬人)": ("非農就業人數", lambda s: (s.diff() / 10).round(2)),
+    "初領失業救濟金人數 (萬人)": ("初領失業救濟金人數", lambda s: (s / 10000).round(2)),
+}
+
+# [v5.5.0 新增] 增量抓取時往回重抓的期間 (涵蓋發布後的修正值)；整段重抓的序列 (日期為未來預測年度，無法以最後觀測日判斷)
+FRED_REVISION_LOOKBACK = pd.DateOffset(months=12)
+FRED_FULL_REFRESH = {"FEDTARMD"}
+
+def get_fred_data(fred_instance, db_client=None):
     """
     [最終整合版] 從 FRED 統一抓取並計算所有模型需要的總經指標。
+    [v5.5.0 修正] 改為增量抓取：每條序列只請求「上次最後觀測日往前 FRED_REVISION_LOOKBACK」之後的資料並合併進序列儲存
+    (同日期以新值覆寫，涵蓋非農、GDP 二次/三次估計、密大終值等修正)；FRED_FULL_REFRESH 中的序列 (日期為未來預測年度的
+    FOMC 點陣圖) 每次重抓整段視窗並整段取代。衍生指標 (年增率、月變動、單位轉換) 只對有新增或被修正資料點的序列重新計算。
     """
     print("\n> [FRED] 正在抓取所有總經指標...")
     
@@ -66,32 +166,51 @@ def get_fred_data(fred_instance):
     }
     
     raw_results = {}
+    updated = set()
     start_date = pd.to_datetime('today') - pd.DateOffset(years=2)
+    raw_store = SeriesStore('fred', db_client)
+    derived_store = SeriesStore('fred_derived', db_client)
     
-    # 步驟 1: 先抓取所有原始數據
-    for name, ticker_id in fred_tickers.items():
+    # 步驟 1: 只抓取每條序列最後觀測日之前一段回溯期之後的資料，合併進序列儲存 ([v5.5.0] 各序列並行抓取)
+    def fetch_one(name):
+        ticker_id = fred_tickers[name]
         try:
-            raw_results[name] = fred_instance.get_series(ticker_id, observation_start=start_date).dropna()
+            if ticker_id in FRED_FULL_REFRESH:
+                new_points = fred_instance.get_series(ticker_id, observation_start=start_date).dropna()
+                new_points.index = pd.to_datetime(new_points.index)
+                stored = raw_store.load(ticker_id)
+                has_new = stored is None or not new_points.sort_index().equals(stored[stored.index >= start_date])
+                if has_new:
+                    raw_store.save(ticker_id, new_points)
+                return raw_store.load(ticker_id), has_new
+            last_observation = raw_store.last_observation(ticker_id)
+            observation_start = start_date if last_observation is None else max(start_date, last_observation - FRED_REVISION_LOOKBACK)
+            new_points = fred_instance.get_series(ticker_id, observation_start=observation_start).dropna()
+            return raw_store.merge(ticker_id, new_points, keep_since=start_date)
         except Exception as e:
             print(f"  - ❌ 抓取 FRED 指標 {name} 失敗: {e}")
+            cached = raw_store.load(ticker_id)
+            return (cached[cached.index >= start_date], False) if cached is not None else (None, False)
+
+    for name, (series, has_new) in map_concurrently(fetch_one, list(fred_tickers), SOURCE_CONCURRENCY["fred"]).items():
+        if series is not None:
+            raw_results[name] = series
+        if has_new:
+            updated.add(name)
+    print(f"  > [FRED] {len(updated)} / {len(fred_tickers)} 個指標有新增或修正的資料: {sorted(updated)}")
             
-    # 步驟 2: 根據原始數據，計算我們需要的最終指標
+    # 步驟 2: 根據原始數據，計算我們需要的最終指標 (無新增或修正資料的序列直接沿用已儲存的衍生結果)
     final_results = {}
-    
-    # 需要計算年增率的指標
-    for name, raw_name in [("核心 PCE 物價指數年增率 (%)", "核心 PCE 物價指數"), 
-                           ("美國零售銷售年增率 (%)", "零售銷售"),
-                           ("實質個人消費支出年增率 (%)", "實質個人消費支出")]:
-        if raw_name in raw_results:
-            final_results[name] = (raw_results[raw_name].pct_change(periods=12) * 100).round(2)
-
-    # 需要計算月變動的指標
-    if "非農就業人數" in raw_results:
-        final_results["非農就業人數變化 (萬人)"] = (raw_results["非農就業人數"].diff() / 10).round(2)
-
-    # 需要轉換單位的指標
-    if "初領失業救濟金人數" in raw_results:
-        final_results["初領失業救濟金人數 (萬人)"] = (raw_results["初領失業救濟金人數"] / 10000).round(2)
+    for name, (raw_name, compute) in FRED_DERIVED.items():
+        if raw_name not in raw_results:
+            continue
+        cached = derived_store.load(name)
+        if raw_name in updated or cached is None:
+            derived = compute(raw_results[raw_name])
+            derived_store.save(name, derived.dropna())
+        else:
+            derived = cached
+        final_results[name] = derived[derived.index >= start_date]
 
     # 不需任何計算的指標，直接沿用
     for name in ["失業率", "密大消費者信心指數", "實質GDP季增年率(SAAR)", "聯邦基金利率", "FOMC利率點陣圖中位數"]:
@@ -105,9 +224,41 @@ def get_fred_data(fred_instance):
     print(f"  ✅ [FRED] 成功處理了 {len(final_results)} 個最終指標。")
     return final_results
 
-def get_dbnomics_data():
+DBNOMICS_API_URL = "https://api.db.nomics.world/v22"
+
+def fetch_dbnomics_window(series_id, since, known_indexed_at=None):
+    """
+    [v5.5.0 新增] 以 DBnomics REST API 讀取單一序列，只解析 since 之後的觀測值 (呼叫端傳入整段視窗起點，以取得修正值)。
+    先以不含觀測值的輕量請求比對來源端的 indexed_at，未更新時直接回傳 (None, indexed_at)，不下載觀測值。
+
+    Returns:
+        (pd.Series 或 None, indexed_at)
+    """
+    url = f"{DBNOMICS_API_URL}/series/{series_id}"
+    if known_indexed_at:
+        meta_resp = requests.get(url, params={"observations": 0, "format": "json"}, timeout=20)
+        meta_resp.raise_for_status()
+        docs = meta_resp.json().get('series', {}).get('docs', [])
+        indexed_at = docs[0].get('indexed_at') if docs else None
+        if indexed_at and indexed_at == known_indexed_at:
+            return None, indexed_at
+
+    resp = requests.get(url, params={"observations": 1, "format": "json"}, timeout=30)
+    resp.raise_for_status()
+    doc = resp.json()['series']['docs'][0]
+    periods = doc.get('period_start_day') or doc.get('period')
+    values = doc.get('value', [])
+    # 期間字串為 ISO 格式且已排序，直接以二分搜尋切出視窗，只轉換需要的尾段
+    first = bisect.bisect_left(periods, pd.Timestamp(since).strftime('%Y-%m-%d'))
+    tail = pd.Series(pd.to_numeric(pd.Series(values[first:]), errors='coerce').to_numpy(),
+                     index=pd.to_datetime(periods[first:]), dtype=float).dropna()
+    return tail, doc.get('indexed_at')
+
+def get_dbnomics_data(db_client=None):
     """
     [v5.4.0 修正版] 從 DBnomics 抓取 ISM & OECD 指標，並確保日期索引為 datetime 格式。
+    [v5.5.0 修正] 來源端未更新 (indexed_at 相同) 時只發送不含觀測值的輕量請求並沿用本機/Firestore 序列快取；
+    來源端重新索引 (通常是發布修正值，例如 OECD CLI 每次都會修正近幾個月) 時，解析最近兩年的完整視窗並合併，覆寫被修正的數值。
     """
     print("\n> [DBnomics] 正在抓取 ISM & OECD 指標...")
     series_map = {
@@ -115,39 +266,134 @@ def get_dbnomics_data():
         "OECD 美國領先指標": "OECD/DSD_STES@DF_CLI/USA.M.LI.IX._Z.AA.IX._Z.H"
     }
     results = {}
+    store = SeriesStore('dbnomics', db_client)
 
     # 定義我們要抓取的起始日期 (兩年前)
     start_date = pd.to_datetime('today') - pd.DateOffset(years=2)
 
-    for name, series_id in series_map.items():
+    def fetch_one(name):
+        series_id = series_map[name]
         try:
-            df = fetch_series(series_id)
-            series = df.set_index('original_period')['value'].rename(name)        
-            series.index = pd.to_datetime(series.index)
-
-            # 在收到完整數據後，只選取在 start_date 之後的數據
-            series = series[series.index >= start_date]
-
-            results[name] = series
+            last_observation = store.last_observation(series_id)
+            known_indexed_at = store.load_meta(series_id).get('indexed_at') if last_observation is not None else None
+            new_points, indexed_at = fetch_dbnomics_window(series_id, start_date, known_indexed_at)
+            if new_points is None:
+                series = store.load(series_id)
+            else:
+                series, _ = store.merge(series_id, new_points, keep_since=start_date, meta={"indexed_at": indexed_at})
+            return series[series.index >= start_date].rename(name)
         except Exception:
             print(f"  - 注意：抓取 {name} ({series_id}) 失敗，跳過。")
+            cached = store.load(series_id)
+            return cached[cached.index >= start_date].rename(name) if cached is not None else None
+
+    # [v5.5.0] 各序列並行抓取
+    for name, series in map_concurrently(fetch_one, list(series_map), SOURCE_CONCURRENCY["dbnomics"]).items():
+        if series is not None:
+            results[name] = series
     print(f"  ✅ [DBnomics] 成功處理了 {len(results)} 個指標。")
     return results    
 
-def get_mag7_financials():
+MAG7_SYMBOLS = ['MSFT', 'AAPL', 'NVDA', 'GOOGL', 'AMZN', 'TSLA', 'META', 'TSM']
+# [v5.5.0 新增] 財報快取：超過此天數一律重抓；財報日後寬限天數 (等待 yfinance 更新)；無財報日資訊時以季末 + 此天數估計
+MAG7_CACHE_MAX_AGE_DAYS = int(os.environ.get('MAG7_CACHE_MAX_AGE_DAYS', '35'))
+EARNINGS_GRACE_DAYS = 1
+EARNINGS_REPORT_LAG_DAYS = 45
+MAG7_KEEP_YEARS = 3
+
+def estimate_next_earnings(latest_quarter, calendar_date=None):
+    """[v5.5.0 新增] 下一次財報日：優先採用晚於最新季末的行事曆日期，否則以「下一季季末 + 公布時差」估計。"""
+    latest_quarter = pd.Timestamp(latest_quarter)
+    if calendar_date is not None and pd.Timestamp(calendar_date) > latest_quarter:
+        return pd.Timestamp(calendar_date).normalize()
+    return (latest_quarter + pd.offsets.QuarterEnd(1) + pd.Timedelta(days=EARNINGS_REPORT_LAG_DAYS)).normalize()
+
+def mag7_refetch_due(meta, today):
+    """
+    [v5.5.0 新增] 判斷某公司的財報快取是否需要重抓：
+    無快取、快取超過 MAG7_CACHE_MAX_AGE_DAYS 天，或已過 meta 記錄的下一次財報日 (含寬限天數) 時回傳 True。
+    """
+    if not meta or not meta.get('fetched_at') or not meta.get('latest_quarter'):
+        return True
+    if today - pd.Timestamp(meta['fetched_at']) > pd.Timedelta(days=MAG7_CACHE_MAX_AGE_DAYS):
+        return True
+    next_earnings = estimate_next_earnings(meta['latest_quarter'], meta.get('next_earnings'))
+    return today >= next_earnings + pd.Timedelta(days=EARNINGS_GRACE_DAYS)
+
+def _calendar_earnings_date(ticker):
+    """從 yfinance 財報行事曆取出下一次財報日，取不到時回傳 None。"""
+    try:
+        calendar = ticker.calendar
+        dates = calendar.get('Earnings Date') if isinstance(calendar, dict) else None
+        return pd.Timestamp(dates[0]) if dates else None
+    except Exception:
+        return None
+
+def _statement_row(statement, row):
+    """取出財報中的單一列並轉為依日期遞增的序列；缺少該列時回傳空序列。"""
+    if statement is None or statement.empty or row not in statement.index:
+        return pd.Series(dtype=float)
+    series = pd.to_numeric(statement.loc[row], errors='coerce').dropna()
+    series.index = pd.to_datetime(series.index)
+    return series.sort_index()
+
+def get_mag7_financials(db_client=None):
+    """
+    抓取 Mag7 & TSM 的季度營收與資本支出。
+    [v5.5.0 修正] 改為依財報日更新的快取：每家公司只保留精簡的營收/資本支出序列 (依日期遞增)，
+    並在 meta 記錄最新季別、抓取時間與下一次財報日；只有到了新一季財報日，或快取超過
+    MAG7_CACHE_MAX_AGE_DAYS 天時才重新向 yfinance 請求財報。
+    財報日以 yfinance 財報行事曆 (ticker.calendar) 為準，於每次抓取財報時一併寫入 meta 的 next_earnings
+    (next_earnings_source 記錄來源)；行事曆取不到時才以「下一季季末 + 公布時差」估計。
+
+    Returns:
+        {symbol: {'revenue': pd.Series, 'capex': pd.Series, 'latest_quarter': str}}
+    """
     print("\n> [yfinance] 正在抓取 Mag7 & TSM 財報數據...")
-    mag7_symbols = ['MSFT', 'AAPL', 'NVDA', 'GOOGL', 'AMZN', 'TSLA', 'META', 'TSM']
-    financial_data = {}
-    for symbol in mag7_symbols:
+    store = SeriesStore('mag7_financials', db_client)
+    today = pd.Timestamp.now().normalize()
+    keep_since = today - pd.DateOffset(years=MAG7_KEEP_YEARS)
+
+    def cached(symbol):
+        revenue, capex = store.load(f"{symbol}_revenue"), store.load(f"{symbol}_capex")
+        if revenue is None or revenue.empty:
+            return None
+        return {'revenue': revenue, 'capex': capex if capex is not None else pd.Series(dtype=float),
+                'latest_quarter': store.load_meta(f"{symbol}_revenue").get('latest_quarter')}
+
+    def fetch_one(symbol):
+        meta = store.load_meta(f"{symbol}_revenue")
+        if not mag7_refetch_due(meta, today):
+            return cached(symbol), False
         try:
             ticker = yf.Ticker(symbol)
-            financial_data[symbol] = {
-                'quarterly_financials': ticker.quarterly_financials,
-                'quarterly_cashflow': ticker.quarterly_cashflow
+            revenue = _statement_row(ticker.quarterly_financials, "Total Revenue")
+            capex = _statement_row(ticker.quarterly_cashflow, "Capital Expenditure")
+            if revenue.empty:
+                raise ValueError("財報缺少 Total Revenue")
+            latest_quarter = revenue.index.max()
+            calendar_date = _calendar_earnings_date(ticker)
+            calendar_date = calendar_date.normalize() if calendar_date is not None else None
+            next_earnings = estimate_next_earnings(latest_quarter, calendar_date)
+            meta = {
+                "latest_quarter": latest_quarter.strftime('%Y-%m-%d'),
+                "fetched_at": today.strftime('%Y-%m-%d'),
+                "next_earnings": next_earnings.strftime('%Y-%m-%d'),
+                "next_earnings_source": "calendar" if next_earnings == calendar_date else "estimate",
             }
-        except Exception:
-            print(f"  - 注意：抓取 {symbol} 財報失敗，跳過。")
-    print(f"  ✅ [yfinance] 成功抓取了 {len(financial_data)} 家公司的財報。")
+            store.merge(f"{symbol}_capex", capex, keep_since=keep_since)
+            store.merge(f"{symbol}_revenue", revenue, keep_since=keep_since, meta=meta)
+            return cached(symbol), True
+        except Exception as e:
+            print(f"  - 注意：抓取 {symbol} 財報失敗 ({e})，改用快取。")
+            return cached(symbol), False
+
+    # [v5.5.0] 各公司並行處理，並保持原本的公司順序
+    fetched = map_concurrently(fetch_one, MAG7_SYMBOLS, SOURCE_CONCURRENCY["mag7"])
+    financial_data = {symbol: fetched[symbol][0] for symbol in MAG7_SYMBOLS if fetched.get(symbol, (None,))[0] is not None}
+    refetched = sorted(symbol for symbol, (_, was_fetched) in fetched.items() if was_fetched)
+    print(f"  > [yfinance] 重新抓取財報: {refetched or '無 (皆使用快取)'}")
+    print(f"  ✅ [yfinance] 成功取得了 {len(financial_data)} 家公司的財報。")
     return financial_data
 
 # --- 模型計算函式 ---
@@ -183,9 +429,9 @@ def run_tech_model(financials, fred_data, dbnomics_data):
         # 1. Mag7營收
         total_curr_rev, total_prev_rev = 0, 0
         for s in ['MSFT', 'AAPL', 'NVDA', 'GOOGL', 'AMZN', 'TSLA', 'META']:
-            if s in financials and "Total Revenue" in financials[s]['quarterly_financials'].index:
-                rev = financials[s]['quarterly_financials'].loc["Total Revenue"]
-                if len(rev) >= 5: total_curr_rev += rev.iloc[0]; total_prev_rev += rev.iloc[4]
+            if s in financials:
+                rev = financials[s]['revenue']
+                if len(rev) >= 5: total_curr_rev += rev.iloc[-1]; total_prev_rev += rev.iloc[-5]
         data['mag7_agg_revenue_growth'] = (total_curr_rev - total_prev_rev) / total_prev_rev if total_prev_rev > 0 else 0
         rev_rating = "營收衰退"
         if data['mag7_agg_revenue_growth'] >= 0.15: scores['Mag7營收年增率'] = 30; rev_rating = "強勁成長"
@@ -196,9 +442,9 @@ def run_tech_model(financials, fred_data, dbnomics_data):
         # 2. 資本支出
         total_curr_capex, total_prev_capex = 0, 0
         for s in ['MSFT', 'AAPL', 'NVDA', 'GOOGL', 'AMZN', 'TSLA', 'META']:
-             if s in financials and "Capital Expenditure" in financials[s]['quarterly_cashflow'].index:
-                capex = financials[s]['quarterly_cashflow'].loc["Capital Expenditure"]
-                if len(capex) >= 5: total_curr_capex += abs(capex.iloc[0]); total_prev_capex += abs(capex.iloc[4])
+             if s in financials:
+                capex = financials[s]['capex']
+                if len(capex) >= 5: total_curr_capex += abs(capex.iloc[-1]); total_prev_capex += abs(capex.iloc[-5])
         data['mag7_agg_capex_growth'] = (total_curr_capex - total_prev_capex) / total_prev_capex if total_prev_capex > 0 else 0
         capex_rating = "削減投資"
         if data['mag7_agg_capex_growth'] >= 0.25: scores['資本支出增長率'] = 20; capex_rating = "積極擴張"
@@ -209,9 +455,9 @@ def run_tech_model(financials, fred_data, dbnomics_data):
         # 3. 關鍵領先指標
         tsm_score, oecd_score, ism_diff_score = 0, 0, 0
         tsm_rating, oecd_rating, ism_diff_rating = "N/A", "N/A", "N/A"
-        if 'TSM' in financials and "Total Revenue" in financials['TSM']['quarterly_financials'].index:
-            rev = financials['TSM']['quarterly_financials'].loc["Total Revenue"]
-            data['tsm_growth'] = (rev.iloc[0] - rev.iloc[4]) / rev.iloc[4] if len(rev) >= 5 else 0
+        if 'TSM' in financials:
+            rev = financials['TSM']['revenue']
+            data['tsm_growth'] = (rev.iloc[-1] - rev.iloc[-5]) / rev.iloc[-5] if len(rev) >= 5 else 0
             if data['tsm_growth'] > 0.20: tsm_rating = "高端需求強勁"
             elif data['tsm_growth'] > 0.10: tsm_rating = "需求穩健"
             elif data['tsm_growth'] >= 0: tsm_rating = "需求放緩"
@@ -360,28 +606,60 @@ def run_tech_model(financials, fred_data, dbnomics_data):
                                "rating": f"零售銷售:{retail_rating}, 實質個人消費支出:{pce_rating}"}
         }
     }
+# [v5.5.0 新增] 每日評分歸檔：model_score_archive/{年份}，每日一列 (欄位名稱 → 數值的 map)，以合併寫入只追加當日列。
+# 每列自帶欄位名稱，年中新增因子或市場時舊列不受影響。
+SCORE_ARCHIVE_COLLECTION = 'model_score_archive'
+SCORE_ARCHIVE_FACTORS = ["Mag7營收年增率", "資本支出增長率", "關鍵領先指標", "資金面與流動性", "GDP季增率", "ISM製造業PMI", "美國消費需求綜合"]
+SCORE_ARCHIVE_SIGNALS = ["mid_term_pullback", "inventory_cycle"]
+
+def build_score_archive_row(tech_model, j_vix_signals, latest_vix, market_names):
+    """
+    [v5.5.0 新增] 將當日的總分、情境、各因子分數、VIX 與各市場 J 值訊號壓成一列。
+
+    Returns:
+        dict {欄位名稱: 數值}：訊號欄位名稱為 '{市場}|{訊號}'，值為 0/1。
+    """
+    breakdown = tech_model.get('scores_breakdown', {})
+    row = {"total_score": float(tech_model.get('total_score', 0)), "scenario": tech_model.get('scenario'),
+           "position": tech_model.get('position')}
+    row.update({f: float(breakdown.get(f, {}).get('score', 0)) for f in SCORE_ARCHIVE_FACTORS})
+    row["latest_vix"] = float(latest_vix) if latest_vix is not None else None
+    for market in market_names:
+        for signal in SCORE_ARCHIVE_SIGNALS:
+            row[f"{market}|{signal}"] = int(bool(j_vix_signals.get(market, {}).get(signal, False)))
+    return row
+
 @functions_framework.http
 def run_scraper(request):
     print(f"--- 數據與模型引擎 (v{__version__}) 開始執行 ---")
     
-    # 1. 數據抓取
+    # 1. 數據抓取 ([v5.5.0] 四個數據源同時抓取，總耗時接近最慢的單一來源)
     market_tickers = {"台股加權指數": "^TWII", "標普500指數": "^GSPC", "納斯達克100指數": "^IXIC", "費城半導體指數": "^SOX"}
-    yfinance_data = get_yfinance_data(list(market_tickers.values()) + ['^VIX'])
-    financial_data = get_mag7_financials()
+    db = firestore.client()
     fred = Fred(api_key=FRED_API_KEY)
-    fred_data = get_fred_data(fred)
-    dbnomics_data = get_dbnomics_data()
+    fetched = fetch_sources_concurrently(
+        {
+            "yfinance": lambda: get_yfinance_data(list(market_tickers.values()) + ['^VIX'], db),
+            "mag7": lambda: get_mag7_financials(db),
+            "fred": lambda: get_fred_data(fred, db),
+            "dbnomics": lambda: get_dbnomics_data(db),
+        },
+        SOURCE_TIMEOUTS,
+        defaults={"yfinance": None, "mag7": {}, "fred": {}, "dbnomics": {}}
+    )
+    yfinance_data, financial_data = fetched["yfinance"], fetched["mag7"]
+    fred_data, dbnomics_data = fetched["fred"], fetched["dbnomics"]
 
     # 2. 指標計算
+    # [v5.5.0 修正] KDJ 改為遞迴更新：只將上次收盤期之後的日線併入已儲存的狀態
+    # [v5.5.0 修正] 所有市場在同一張價格表上一次重取樣 (不再逐一切片市場)
     kdj_indicators = {}
+    kdj_engine = StreamingKDJ(StateStore('kdj_state', db), verify=KDJ_VERIFY)
     if yfinance_data is not None:
-        for name, ticker in market_tickers.items():
-            market_price_df = yfinance_data.loc[:, (slice(None), ticker)]
-            market_price_df.dropna(how='all', inplace=True)
-            kdj_indicators[name] = {
-                "weekly": calculate_kdj(market_price_df, 'W-FRI'),
-                "monthly": calculate_kdj(market_price_df, 'ME')
-            }
+        tickers = list(market_tickers.values())
+        weekly = kdj_engine.update(yfinance_data, tickers, 'W-FRI')
+        monthly = kdj_engine.update(yfinance_data, tickers, 'ME')
+        kdj_indicators = {name: {"weekly": weekly[ticker], "monthly": monthly[ticker]} for name, ticker in market_tickers.items()}
 
     # 3. 模型運算
     signals_j_vix = run_j_vix_model(kdj_indicators, yfinance_data['Close'])
@@ -392,35 +670,44 @@ def run_scraper(request):
     corporate_financials = {}
     if financial_data:
         for symbol, data in financial_data.items():
-            try:
-                revenue = data['quarterly_financials'].loc['Total Revenue'].head(5) # 取最近5季
-                capex = data['quarterly_cashflow'].loc['Capital Expenditure'].head(5)
-                corporate_financials[symbol] = {
-                    "revenue": {d.strftime('%Y-%m'): v for d, v in revenue.to_dict().items()},
-                    "capex": {d.strftime('%Y-%m'): v for d, v in capex.to_dict().items()}
-                }
-            except KeyError:
-                print(f"  - 注意：{symbol} 的財報數據不完整，跳過。")
+            revenue = data['revenue'].tail(5) # 取最近5季
+            capex = data['capex'].tail(5)
+            corporate_financials[symbol] = {
+                "revenue": encode_series(revenue, 'f8'),
+                "capex": encode_series(capex, 'f8')
+            }
                     
+    kdj_tails = {m: {"weekly": {d.strftime('%Y-%m-%d'): v for d, v in k['weekly'].tail(3).to_dict('index').items()}, "monthly": {d.strftime('%Y-%m-%d'): v for d, v in k['monthly'].tail(3).to_dict('index').items()}} for m, k in kdj_indicators.items() if k.get('weekly') is not None and k.get('monthly') is not None}
+    # [v5.5.0 修正] 摘要文件只放訊號與評分 (含各市場最新一期 KDJ)，原始數據依類別拆成獨立的明細文件
     final_data_to_store = {
-        "j_vix_model": {"signals": signals_j_vix, "latest_vix": yfinance_data['Close']['^VIX'].dropna().iloc[-1] if '^VIX' in yfinance_data['Close'].columns else None},
+        "j_vix_model": {"signals": signals_j_vix, "latest_vix": yfinance_data['Close']['^VIX'].dropna().iloc[-1] if '^VIX' in yfinance_data['Close'].columns else None,
+                        "latest_kdj": {m: {tf: dict(list(rows.items())[-1:]) for tf, rows in k.items()} for m, k in kdj_tails.items()}},
         "tech_model": signals_tech_model,
-        "raw_data": {
-            "kdj": {m: {"weekly": {d.strftime('%Y-%m-%d'): v for d, v in k['weekly'].tail(3).to_dict('index').items()}, "monthly": {d.strftime('%Y-%m-%d'): v for d, v in k['monthly'].tail(3).to_dict('index').items()}} for m, k in kdj_indicators.items() if k.get('weekly') is not None and k.get('monthly') is not None},
-            "fred": {k: {d.strftime('%Y-%m-%d'): val for d, val in v.to_dict().items()} for k, v in fred_data.items() if v is not None},
-            "dbnomics": {k: {d.strftime('%Y-%m-%d'): val for d, val in v.to_dict().items()} for k, v in dbnomics_data.items() if v is not None},
-            "corporate_financials": corporate_financials # <-- [v5.4.0-rc4 新增]
-        }
+    }
+    detail_data = {
+        "kdj": kdj_tails,
+        # [v5.5.0 修正] 序列改以精簡編碼 (起始日/頻率 + base64 數值陣列) 儲存，前端以 utils.decode_series 解碼
+        # 空序列不寫入 (前端以「存在即有資料」判斷)
+        "fred": {k: encode_series(v) for k, v in fred_data.items() if v is not None and not v.empty},
+        "dbnomics": {k: encode_series(v) for k, v in dbnomics_data.items() if v is not None and not v.empty},
+        "corporate_financials": corporate_financials # <-- [v5.4.0-rc4 新增]
     }
     
-    # 5. 統一寫入 Firestore
-    db = firestore.client()
+    # 5. 統一寫入 Firestore (摘要: daily_model_data/{date}；明細: daily_model_data/{date}/details/{類別}，以同一批次寫入)
+    # 注意：明細子集合需另外為 collection group 'details' 設定 expireAt 的 TTL 政策
     taipei_tz = pytz.timezone('Asia/Taipei')
     doc_id = datetime.datetime.now(taipei_tz).strftime("%Y-%m-%d")
     doc_ref = db.collection('daily_model_data').document(doc_id)
     expire_at_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=7)
-    firestore_document = { "updated_at": firestore.SERVER_TIMESTAMP, "expireAt": expire_at_time, "version": __version__, "data": final_data_to_store }
-    doc_ref.set(firestore_document)
+    batch = db.batch()
+    for family, family_data in detail_data.items():
+        batch.set(doc_ref.collection(MODEL_DETAIL_COLLECTION).document(family), {"updated_at": firestore.SERVER_TIMESTAMP, "expireAt": expire_at_time, "data": family_data})
+    firestore_document = { "updated_at": firestore.SERVER_TIMESTAMP, "expireAt": expire_at_time, "version": __version__, "data": final_data_to_store, "detail_families": list(detail_data) }
+    batch.set(doc_ref, firestore_document)
+    # [v5.5.0 新增] 評分與訊號另外追加到不過期的年度歸檔 (同日重跑會覆寫當日列)
+    archive_row = build_score_archive_row(signals_tech_model, signals_j_vix, final_data_to_store['j_vix_model']['latest_vix'], list(market_tickers))
+    batch.set(db.collection(SCORE_ARCHIVE_COLLECTION).document(doc_id[:4]), {"rows": {doc_id: archive_row}, "updated_at": firestore.SERVER_TIMESTAMP}, merge=True)
+    batch.commit()
     
     print(f"--- 成功將所有模型數據寫入 Firestore 文件 '{doc_id}' ---")
     return {"status": "success", "version": __version__}
\ No newline at end of file
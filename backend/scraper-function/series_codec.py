@@ -0,0 +1,54 @@
+# file: backend/scraper-function/series_codec.py (v5.5.0)
+# 精簡序列編碼：以起始日 + 固定間隔 (規則序列) 或日差向量 (不規則序列) 表示日期，數值打包成 base64 浮點數陣列。
+# 前端解碼對應 utils.decode_series_arrays / decode_series，格式變更時兩邊需同步修改。
+
+import base64
+import numpy as np
+import pandas as pd
+
+SERIES_CODEC_VERSION = 1
+DEFAULT_VALUE_DTYPE = 'f4'  # 前端僅供顯示，float32 (約 7 位有效數字) 已足夠；需要完整精度時傳入 'f8'
+
+
+def _pack(array, dtype):
+    return base64.b64encode(np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()).decode('ascii')
+
+
+def _regular_step(days):
+    """
+    判斷日期是否為固定間隔，回傳間隔代碼 (不依賴 pandas 頻率字串，前後端版本不同也能解碼)：
+    'D{k}' 每 k 天、'MS{k}' 每 k 個月的月初、'ME{k}' 每 k 個月的月底；不規則時回傳 None。
+    """
+    if len(days) < 2:
+        return None
+    day_steps = np.diff(days)
+    if (day_steps == day_steps[0]).all() and day_steps[0] > 0:
+        return f"D{int(day_steps[0])}"
+    dates = days.astype('datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    month_steps = np.diff(months.astype(np.int64))
+    if not ((month_steps == month_steps[0]).all() and month_steps[0] > 0):
+        return None
+    if (dates == months.astype('datetime64[D]')).all():
+        return f"MS{int(month_steps[0])}"
+    if (dates == (months + 1).astype('datetime64[D]') - 1).all():
+        return f"ME{int(month_steps[0])}"
+    return None
+
+
+def encode_series(series, dtype=DEFAULT_VALUE_DTYPE):
+    """
+    [v5.5.0 新增] 將以日期為索引的序列編碼為精簡格式：
+        {"v": 1, "n": 筆數, "dtype": "f4"/"f8", "values": base64, "start": "YYYY-MM-DD",
+         "step": 固定間隔代碼 (規則序列) 或 "deltas": base64 int32 日差 (不規則序列)}
+    """
+    series = series.dropna().sort_index()
+    days = pd.to_datetime(series.index).normalize().to_numpy().astype('datetime64[D]').astype(np.int64)
+    encoded = {"v": SERIES_CODEC_VERSION, "n": int(len(series)), "dtype": dtype, "values": _pack(series.to_numpy(), dtype),
+               "start": str(days[0].astype('datetime64[D]')) if len(days) else None}
+    step = _regular_step(days)
+    if step is not None:
+        encoded["step"] = step
+    else:
+        encoded["deltas"] = _pack(np.diff(days, prepend=days[:1]), 'i4')
+    return encoded
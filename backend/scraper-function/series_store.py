@@ -0,0 +1,266 @@
+# file: backend/scraper-function/series_store.py (v5.5.0)
+# 時間序列增量儲存：本機 (/tmp，Cloud Function 暖啟動期間有效) + Firestore 雙層快取。
+# 每條序列記錄最後觀測日期，抓取端只需請求該日期之後的新資料再合併回來。
+# FrameStore 以相同方式儲存多欄位資料表 (例如 OHLC 日線)，StateStore 則儲存小型 JSON 狀態。
+
+import os
+import json
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+
+LOCAL_STORE_DIR = os.environ.get('SERIES_STORE_DIR', '/tmp/series_store')
+STORE_COLLECTION = 'series_store'
+
+
+class SeriesStore:
+    """
+    以 (namespace, series_id) 為鍵的時間序列儲存。
+    讀取順序：記憶體 → 本機 CSV → Firestore 文件 (series_store/{namespace}__{series_id})。
+    """
+
+    def __init__(self, namespace: str, db_client=None, local_dir: str = LOCAL_STORE_DIR):
+        self.namespace = namespace
+        self.db = db_client
+        self.local_dir = os.path.join(local_dir, namespace)
+        self._memory = {}
+        self._meta = {}
+
+    def _key(self, series_id: str) -> str:
+        return series_id.replace('/', '_').replace('@', '_').replace('.', '_')
+
+    def _local_path(self, series_id: str) -> str:
+        return os.path.join(self.local_dir, f"{self._key(series_id)}.csv")
+
+    def _meta_path(self, series_id: str) -> str:
+        return os.path.join(self.local_dir, f"{self._key(series_id)}.meta.json")
+
+    def _doc_ref(self, series_id: str):
+        return self.db.collection(STORE_COLLECTION).document(f"{self.namespace}__{self._key(series_id)}")
+
+    def load(self, series_id: str) -> Optional[pd.Series]:
+        """讀取已儲存的序列，不存在時回傳 None。"""
+        if series_id in self._memory:
+            return self._memory[series_id]
+
+        series = None
+        path = self._local_path(series_id)
+        if os.path.exists(path):
+            series = pd.read_csv(path, index_col=0, parse_dates=True).iloc[:, 0]
+        elif self.db is not None:
+            try:
+                doc = self._doc_ref(series_id).get()
+                if doc.exists:
+                    data = doc.to_dict()
+                    series = pd.Series(data.get('values', []), index=pd.to_datetime(data.get('dates', [])), dtype=float)
+                    self._meta[series_id] = data.get('meta') or {}
+                    self._write_local(series_id, series, self._meta[series_id])
+            except Exception as e:
+                print(f"  - 注意：讀取序列快取 {self.namespace}/{series_id} 失敗: {e}")
+
+        if series is not None:
+            series.index.name = 'date'
+            self._memory[series_id] = series
+        return series
+
+    def load_meta(self, series_id: str) -> dict:
+        """讀取序列的附加資訊 (例如來源端的更新時間)，不存在時回傳空 dict。"""
+        if series_id not in self._meta:
+            path = self._meta_path(series_id)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    self._meta[series_id] = json.load(f)
+            else:
+                self.load(series_id)  # 可能從 Firestore 一併取得
+        return self._meta.get(series_id, {})
+
+    def last_observation(self, series_id: str) -> Optional[pd.Timestamp]:
+        series = self.load(series_id)
+        return series.index.max() if series is not None and not series.empty else None
+
+    def _write_local(self, series_id: str, series: pd.Series, meta: Optional[dict] = None):
+        os.makedirs(self.local_dir, exist_ok=True)
+        series.rename('value').to_csv(self._local_path(series_id))
+        if meta is not None:
+            with open(self._meta_path(series_id), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+    def save(self, series_id: str, series: pd.Series, meta: Optional[dict] = None):
+        """同時寫入記憶體、本機與 Firestore；meta 為選填的附加資訊 (未提供時沿用既有值)。"""
+        series = series.sort_index()
+        meta = self.load_meta(series_id) if meta is None else meta
+        self._memory[series_id] = series
+        self._meta[series_id] = meta
+        self._write_local(series_id, series, meta)
+        if self.db is not None:
+            try:
+                self._doc_ref(series_id).set({
+                    "namespace": self.namespace, "series_id": series_id,
+                    "dates": [d.strftime('%Y-%m-%d') for d in series.index],
+                    "values": [float(v) for v in series.values],
+                    "last_observation": series.index.max().strftime('%Y-%m-%d') if not series.empty else None,
+                    "meta": meta,
+                    "updated_at": datetime.datetime.now(datetime.timezone.utc),
+                })
+            except Exception as e:
+                print(f"  - 注意：寫入序列快取 {self.namespace}/{series_id} 失敗: {e}")
+
+    def merge(self, series_id: str, new_points: pd.Series, keep_since=None, meta: Optional[dict] = None) -> Tuple[pd.Series, bool]:
+        """
+        將新抓到的資料點合併進已儲存的序列 (同日期以新值為準)，並只保留 keep_since 之後的資料。
+
+        Returns:
+            (合併後序列, 是否有新的或數值被修正的資料點)
+        """
+        stored = self.load(series_id)
+        new_points = new_points.dropna()
+        new_points.index = pd.to_datetime(new_points.index)
+        if stored is None or stored.empty:
+            merged, has_new = new_points.sort_index(), not new_points.empty
+        else:
+            # 新日期，或既有日期的數值被修正 (來源端發布修正值)
+            has_new = bool((~new_points.index.isin(stored.index)).any() or
+                           not np.allclose(new_points.to_numpy(dtype=float), stored.reindex(new_points.index).to_numpy(dtype=float), rtol=0, atol=1e-12))
+            merged = pd.concat([stored[~stored.index.isin(new_points.index)], new_points]).sort_index()
+        if keep_since is not None:
+            merged = merged[merged.index >= pd.to_datetime(keep_since)]
+        if has_new or stored is None or len(merged) != len(stored) or meta is not None:
+            self.save(series_id, merged, meta)
+        return merged, has_new
+
+
+class FrameStore(SeriesStore):
+    """
+    [v5.5.0 新增] 多欄位時間序列 (例如 OHLC 日線) 的增量儲存，分層與鍵值規則同 SeriesStore。
+    Firestore 文件以欄位為單位存成精簡的浮點數陣列：{dates: [...], columns: {欄位: [...]}}。
+    """
+
+    def load(self, frame_id: str) -> Optional[pd.DataFrame]:
+        """讀取已儲存的資料表，不存在時回傳 None。"""
+        if frame_id in self._memory:
+            return self._memory[frame_id]
+
+        frame = None
+        path = self._local_path(frame_id)
+        if os.path.exists(path):
+            frame = pd.read_csv(path, index_col=0, parse_dates=True)
+        elif self.db is not None:
+            try:
+                doc = self._doc_ref(frame_id).get()
+                if doc.exists:
+                    data = doc.to_dict()
+                    frame = pd.DataFrame(data.get('columns', {}), index=pd.to_datetime(data.get('dates', [])), dtype=float)
+                    self._meta[frame_id] = data.get('meta') or {}
+                    self._write_local(frame_id, frame, self._meta[frame_id])
+            except Exception as e:
+                print(f"  - 注意：讀取資料表快取 {self.namespace}/{frame_id} 失敗: {e}")
+
+        if frame is not None:
+            frame.index.name = 'date'
+            self._memory[frame_id] = frame
+        return frame
+
+    def _write_local(self, frame_id: str, frame: pd.DataFrame, meta: Optional[dict] = None):
+        os.makedirs(self.local_dir, exist_ok=True)
+        frame.to_csv(self._local_path(frame_id))
+        if meta is not None:
+            with open(self._meta_path(frame_id), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+    def save(self, frame_id: str, frame: pd.DataFrame, meta: Optional[dict] = None):
+        """同時寫入記憶體、本機與 Firestore；meta 為選填的附加資訊 (未提供時沿用既有值)。"""
+        frame = frame.sort_index()
+        meta = self.load_meta(frame_id) if meta is None else meta
+        self._memory[frame_id] = frame
+        self._meta[frame_id] = meta
+        self._write_local(frame_id, frame, meta)
+        if self.db is not None:
+            try:
+                self._doc_ref(frame_id).set({
+                    "namespace": self.namespace, "frame_id": frame_id,
+                    "dates": [d.strftime('%Y-%m-%d') for d in frame.index],
+                    "columns": {col: [float(v) for v in frame[col].values] for col in frame.columns},
+                    "last_observation": frame.index.max().strftime('%Y-%m-%d') if not frame.empty else None,
+                    "meta": meta,
+                    "updated_at": datetime.datetime.now(datetime.timezone.utc),
+                })
+            except Exception as e:
+                print(f"  - 注意：寫入資料表快取 {self.namespace}/{frame_id} 失敗: {e}")
+
+    def merge(self, frame_id: str, new_rows: pd.DataFrame, keep_since=None, meta: Optional[dict] = None) -> Tuple[pd.DataFrame, bool]:
+        """
+        將新抓到的列合併進已儲存的資料表 (同日期以新值為準，可用於修正盤中暫時值)，並只保留 keep_since 之後的資料。
+
+        Returns:
+            (合併後資料表, 是否有新的或被修正的列)
+        """
+        stored = self.load(frame_id)
+        new_rows = new_rows.dropna(how='all').astype(float)
+        new_rows.index = pd.to_datetime(new_rows.index)
+        if stored is None or stored.empty:
+            merged, has_new = new_rows.sort_index(), not new_rows.empty
+        else:
+            has_new = bool((~new_rows.index.isin(stored.index)).any() or
+                           not new_rows.equals(stored.reindex(index=new_rows.index, columns=new_rows.columns)))
+            merged = pd.concat([stored[~stored.index.isin(new_rows.index)], new_rows]).sort_index()
+        if keep_since is not None:
+            merged = merged[merged.index >= pd.to_datetime(keep_since)]
+        if has_new or stored is None or len(merged) != len(stored) or meta is not None:
+            self.save(frame_id, merged, meta)
+        return merged, has_new
+
+
+class StateStore:
+    """
+    [v5.5.0 新增] 小型 JSON 狀態儲存 (例如指標的遞迴狀態)，分層同 SeriesStore：
+    記憶體 → 本機 JSON → Firestore 文件 (series_store/{namespace}__{key})。
+    """
+
+    def __init__(self, namespace: str, db_client=None, local_dir: str = LOCAL_STORE_DIR):
+        self.namespace = namespace
+        self.db = db_client
+        self.local_dir = os.path.join(local_dir, namespace)
+        self._memory = {}
+
+    def _key(self, key: str) -> str:
+        return key.replace('/', '_').replace('@', '_').replace('.', '_')
+
+    def _local_path(self, key: str) -> str:
+        return os.path.join(self.local_dir, f"{self._key(key)}.json")
+
+    def _doc_ref(self, key: str):
+        return self.db.collection(STORE_COLLECTION).document(f"{self.namespace}__{self._key(key)}")
+
+    def load(self, key: str) -> Optional[dict]:
+        """讀取已儲存的狀態，不存在時回傳 None。"""
+        if key in self._memory:
+            return self._memory[key]
+        state = None
+        path = self._local_path(key)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+        elif self.db is not None:
+            try:
+                doc = self._doc_ref(key).get()
+                if doc.exists:
+                    state = doc.to_dict().get('state')
+            except Exception as e:
+                print(f"  - 注意：讀取狀態 {self.namespace}/{key} 失敗: {e}")
+        if state is not None:
+            self._memory[key] = state
+        return state
+
+    def save(self, key: str, state: dict):
+        """同時寫入記憶體、本機與 Firestore。"""
+        self._memory[key] = state
+        os.makedirs(self.local_dir, exist_ok=True)
+        with open(self._local_path(key), 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        if self.db is not None:
+            try:
+                self._doc_ref(key).set({"namespace": self.namespace, "key": key, "state": state,
+                                        "updated_at": datetime.datetime.now(datetime.timezone.utc)})
+            except Exception as e:
+                print(f"  - 注意：寫入狀態 {self.namespace}/{key} 失敗: {e}")
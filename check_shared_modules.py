@@ -0,0 +1,50 @@
+# check_shared_modules.py (v5.5.0)
+# 後端排程服務各自獨立部署，無法 import 專案根目錄的模組，因此部分共用模組以複本放在服務目錄中。
+# 本腳本比對根目錄的正本與各複本，內容不一致時以非零狀態碼結束 (部署前或 CI 中執行)；
+# 加上 --fix 則以正本覆寫複本。
+#
+#   python check_shared_modules.py         # 檢查
+#   python check_shared_modules.py --fix   # 同步
+
+import filecmp
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 正本 (相對於專案根目錄) -> 複本清單
+SHARED_MODULES = {
+    "loan_schedule.py": ["backend/debt-refresh-function/loan_schedule.py"],
+}
+
+
+def find_out_of_sync():
+    """回傳 (正本, 複本) 中內容不一致或複本不存在的組合。"""
+    mismatched = []
+    for source, copies in SHARED_MODULES.items():
+        source_path = os.path.join(ROOT, source)
+        for copy in copies:
+            copy_path = os.path.join(ROOT, copy)
+            if not os.path.exists(copy_path) or not filecmp.cmp(source_path, copy_path, shallow=False):
+                mismatched.append((source, copy))
+    return mismatched
+
+
+def main(argv):
+    mismatched = find_out_of_sync()
+    if not mismatched:
+        print("✅ 共用模組的複本皆與正本一致。")
+        return 0
+    if "--fix" in argv:
+        for source, copy in mismatched:
+            shutil.copyfile(os.path.join(ROOT, source), os.path.join(ROOT, copy))
+            print(f"  > 已以 {source} 覆寫 {copy}")
+        return 0
+    for source, copy in mismatched:
+        print(f"❌ {copy} 與 {source} 不一致 (執行 python check_shared_modules.py --fix 同步)")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,135 @@
+# debt_strategy.py (v5.5.0)
+# 提前還款與還款策略模擬引擎：一次比較多組策略 (雪崩法 / 雪球法 / 額外月付 / 單筆提前還款)。
+# 所有策略與所有貸款以 (策略數 × 貸款數) 的矩陣同時推進，逐月只做陣列運算。
+
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Sequence
+
+from loan_schedule import normalize_rate_segments
+
+STRATEGY_METHODS = {"baseline": "原始合約", "avalanche": "雪崩法 (高利率優先)", "snowball": "雪球法 (低餘額優先)"}
+
+
+def loans_for_strategy(liabilities_df: pd.DataFrame, today: datetime = None) -> Dict[str, np.ndarray]:
+    """
+    從 liabilities DataFrame 取出策略模擬所需的「目前」狀態：
+    剩餘本金、目前年利率、合約月付金與剩餘寬限期月數。
+    """
+    today = pd.to_datetime(today or datetime.now())
+    balances, rates, payments, grace_left, names = [], [], [], [], []
+    for _, loan in liabilities_df.iterrows():
+        start = pd.to_datetime(loan.get('start_date'))
+        months_passed = (today.year - start.year) * 12 + (today.month - start.month)
+        history = loan.get('rate_history')
+        rate = float(loan.get('interest_rate', 0.0) or 0.0)
+        if isinstance(history, list) and history:
+            segments = normalize_rate_segments(start, history, rate)
+            rate = [r for offset, r in segments if offset <= max(months_passed, 0)][-1]
+        balances.append(float(loan.get('outstanding_balance', 0.0) or 0.0))
+        rates.append(rate)
+        payments.append(float(loan.get('monthly_payment', 0.0) or 0.0))
+        grace_left.append(max(0, int(loan.get('grace_period_years', 0) or 0) * 12 - months_passed))
+        names.append(loan.get('custom_name') or loan.get('debt_type', ''))
+    return {
+        "balance": np.array(balances), "annual_rate": np.array(rates),
+        "min_payment": np.array(payments), "grace_months_left": np.array(grace_left),
+        "names": np.array(names, dtype=object),
+    }
+
+
+def build_strategy_grid(extra_monthly_options: Sequence[float], lump_sum_options: Sequence[float] = (0,),
+                        methods: Sequence[str] = ("avalanche", "snowball"), lump_sum_month: int = 0) -> pd.DataFrame:
+    """
+    產生策略組合表 (第一列固定為原始合約基準)。
+    欄位: method, extra_monthly, lump_sum, lump_sum_month
+    """
+    rows = [{"method": "baseline", "extra_monthly": 0.0, "lump_sum": 0.0, "lump_sum_month": 0}]
+    for method in methods:
+        for extra in extra_monthly_options:
+            for lump in lump_sum_options:
+                rows.append({"method": method, "extra_monthly": float(extra), "lump_sum": float(lump), "lump_sum_month": int(lump_sum_month)})
+    return pd.DataFrame(rows)
+
+
+def simulate_payoff_strategies(loans: Dict[str, np.ndarray], strategies: pd.DataFrame,
+                               max_months: int = 600, today: datetime = None) -> pd.DataFrame:
+    """
+    以向量化方式同時模擬所有策略的逐月還款。
+
+    每月先依合約繳付各貸款的最低月付金 (寬限期內為利息)，
+    剩餘預算 (額外月付 + 單筆提前還款 + 已清償貸款釋出的月付金) 再依策略的優先順序灌注到各貸款：
+    雪崩法依利率由高到低，雪球法依剩餘本金由小到大。
+    「原始合約」基準不會把已清償貸款釋出的月付金轉投其他貸款。
+
+    Returns:
+        pd.DataFrame: 每個策略一列，含 total_interest, interest_saved, payoff_months, payoff_date
+                      以及各貸款的清償月數 (payoff_months_by_loan)
+    """
+    today = pd.to_datetime(today or datetime.now())
+    balance0 = np.asarray(loans['balance'], dtype=float)
+    n_loans, n_strategies = balance0.size, len(strategies)
+    monthly_rate = np.asarray(loans['annual_rate'], dtype=float)[None, :] / 100 / 12
+    min_payment = np.asarray(loans['min_payment'], dtype=float)[None, :]
+    grace_left = np.asarray(loans['grace_months_left'], dtype=float)[None, :]
+
+    method = strategies['method'].to_numpy()
+    rollover = (method != "baseline")[:, None]
+    extra = strategies['extra_monthly'].to_numpy(dtype=float)
+    lump_sum = strategies['lump_sum'].to_numpy(dtype=float)
+    lump_month = strategies['lump_sum_month'].to_numpy(dtype=int)
+
+    balance = np.repeat(balance0[None, :], n_strategies, axis=0)
+    total_interest = np.zeros(n_strategies)
+    payoff_month = np.where(balance > 0.5, -1, 0)
+    originally_active = balance0[None, :] > 0.5
+
+    # 雪崩法的優先順序固定 (依利率)；雪球法每月依剩餘本金重新排序
+    avalanche_order = np.argsort(-monthly_rate[0], kind='stable')
+    is_snowball = (method == "snowball")[:, None]
+    row_idx = np.arange(n_strategies)[:, None]
+
+    for month in range(max_months):
+        active = balance > 0.5
+        if not active.any():
+            break
+        interest = np.where(active, balance * monthly_rate, 0.0)
+        total_interest += interest.sum(axis=1)
+        balance = balance + interest
+
+        in_grace = month < grace_left
+        due = np.where(in_grace, interest, min_payment)
+        paid = np.where(active, np.minimum(due, balance), 0.0)
+        balance = balance - paid
+
+        # 可分配的額外金額
+        lump = np.where(lump_month == month, lump_sum, 0.0)
+        # 轉投預算：所有原始貸款本月的合約應繳金額 (已清償者的月付金亦計入)
+        contract_due = np.where(originally_active, np.where(in_grace, interest, min_payment), 0.0).sum(axis=1)
+        budget = np.where(rollover[:, 0], contract_due, paid.sum(axis=1)) + extra + lump
+        surplus = np.clip(budget - paid.sum(axis=1), 0, None)
+
+        if surplus.any():
+            snowball_order = np.argsort(np.where(balance > 0.5, balance, np.inf), axis=1, kind='stable')
+            order = np.where(is_snowball, snowball_order, avalanche_order[None, :])
+            ordered_balance = balance[row_idx, order]
+            # 依優先順序逐筆還清：前面貸款吃完後才輪到下一筆
+            already_used = np.cumsum(ordered_balance, axis=1) - ordered_balance
+            allocation = np.clip(surplus[:, None] - already_used, 0, ordered_balance)
+            balance[row_idx, order] = ordered_balance - allocation
+
+        newly_paid = (payoff_month < 0) & (balance <= 0.5)
+        payoff_month = np.where(newly_paid, month + 1, payoff_month)
+
+    payoff_month = np.where(payoff_month < 0, max_months, payoff_month)
+    payoff_months = payoff_month.max(axis=1) if n_loans else np.zeros(n_strategies, dtype=int)
+
+    result = strategies.copy()
+    result['method_label'] = result['method'].map(STRATEGY_METHODS)
+    result['total_interest'] = total_interest
+    result['interest_saved'] = total_interest[0] - total_interest if n_strategies else total_interest
+    result['payoff_months'] = payoff_months
+    result['payoff_date'] = [(today + pd.DateOffset(months=int(m))).strftime('%Y-%m') for m in payoff_months]
+    result['payoff_months_by_loan'] = list(payoff_month)
+    return result
@@ -0,0 +1,474 @@
+# loan_schedule.py (v5.5.0)
+# 向量化貸款攤還引擎：一次為所有貸款建立 (貸款數 × 月數) 的攤還矩陣。
+# 本模組只依賴 numpy / pandas，可同時被前端 (utils.py、債務頁) 與後端排程服務共用。
+# backend/debt-refresh-function/loan_schedule.py 為本檔的部署複本，修改後執行 python check_shared_modules.py --fix 同步。
+
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+def _as_float_array(values) -> np.ndarray:
+    return np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+
+
+def _annuity_balance(principal: np.ndarray, monthly_rate: np.ndarray,
+                     regular_payment: np.ndarray, paid_months: np.ndarray) -> np.ndarray:
+    """
+    本息攤還的封閉解：已繳 n 期後的剩餘本金
+    B_n = B_0 * (1+r)^n - P * ((1+r)^n - 1) / r  (r = 0 時退化為 B_0 - P * n)
+    所有參數皆可廣播。
+    """
+    growth = (1 + monthly_rate) ** paid_months
+    safe_rate = np.where(monthly_rate > 0, monthly_rate, 1.0)
+    annuity = np.where(monthly_rate > 0, (growth - 1) / safe_rate, paid_months)
+    return principal * growth - regular_payment * annuity
+
+
+def outstanding_balances(principal, annual_rate, total_months, grace_months,
+                         regular_payment, months_elapsed) -> np.ndarray:
+    """
+    以封閉解直接計算每筆貸款在經過 months_elapsed 個月後的剩餘本金，不需逐月模擬。
+    寬限期內只繳利息，本金不變；尚未開始的貸款 (months_elapsed < 0) 視為未攤還。
+
+    Returns:
+        np.ndarray: 每筆貸款的剩餘本金 (已截斷為不小於 0)
+    """
+    principal = _as_float_array(principal)
+    monthly_rate = _as_float_array(annual_rate) / 100 / 12
+    total_months = _as_float_array(total_months)
+    grace_months = _as_float_array(grace_months)
+    regular_payment = _as_float_array(regular_payment)
+
+    months_done = np.clip(_as_float_array(months_elapsed), 0, total_months)
+    paid_months = np.clip(months_done - grace_months, 0, None)
+    balance = _annuity_balance(principal, monthly_rate, regular_payment, paid_months)
+    return np.maximum(balance, 0)
+
+
+def build_amortization_matrix(principal, annual_rate, total_months, grace_months,
+                              regular_payment, grace_payment=None) -> Dict[str, np.ndarray]:
+    """
+    一次向量化地建立所有貸款的逐月攤還表。
+
+    Args:
+        principal: 各貸款的原始本金
+        annual_rate: 年利率 (%)
+        total_months: 總期數 (月)
+        grace_months: 寬限期月數
+        regular_payment: 本息攤還期的每月還款
+        grace_payment: 寬限期每月還款，缺值時以當月利息代替
+
+    Returns:
+        dict: 形狀皆為 (貸款數, 最長期數) 的矩陣
+              'payment', 'interest', 'principal', 'balance' (月末剩餘本金, 已截斷為不小於 0)
+              與布林矩陣 'active' (該月是否仍在貸款期間內)
+    """
+    principal = _as_float_array(principal)
+    monthly_rate = _as_float_array(annual_rate) / 100 / 12
+    total_months = _as_float_array(total_months).astype(int)
+    grace_months = _as_float_array(grace_months).astype(int)
+    regular_payment = _as_float_array(regular_payment)
+    if grace_payment is None:
+        grace_payment = principal * monthly_rate
+    else:
+        grace_payment = np.asarray(grace_payment, dtype=float)
+        grace_payment = np.where(np.isnan(grace_payment), principal * monthly_rate, grace_payment)
+
+    n_months = int(total_months.max()) if total_months.size else 0
+    month_idx = np.arange(n_months)[None, :]
+    active = month_idx < total_months[:, None]
+    in_grace = month_idx < grace_months[:, None]
+
+    # 月末已繳的本息攤還期數 (寬限期內為 0)
+    paid_months = np.clip(month_idx + 1 - grace_months[:, None], 0, None)
+    raw_balance = _annuity_balance(principal[:, None], monthly_rate[:, None],
+                                   regular_payment[:, None], paid_months)
+    opening_balance = np.concatenate([principal[:, None], raw_balance[:, :-1]], axis=1)
+
+    interest = opening_balance * monthly_rate[:, None]
+    payment = np.where(in_grace, grace_payment[:, None], regular_payment[:, None])
+    principal_paid = np.where(in_grace, 0.0, payment - interest)
+
+    return {
+        "payment": np.where(active, payment, 0.0),
+        "interest": np.where(active, interest, 0.0),
+        "principal": np.where(active, principal_paid, 0.0),
+        "balance": np.where(active, np.maximum(raw_balance, 0), 0.0),
+        "active": active,
+    }
+
+
+# --- [v5.5.0 新增] 機動利率：依利率歷史分段重新攤還 ---
+
+def _level_payment(balance: float, monthly_rate: float, n_months: int) -> float:
+    """剩餘本金在剩餘期數內以固定月付金攤還所需的月付金 (與 calculate_loan_payments 相同取整)。"""
+    if n_months <= 0 or balance <= 0:
+        return 0.0
+    if monthly_rate <= 0:
+        return float(round(balance / n_months))
+    return float(round(balance * monthly_rate / (1 - (1 + monthly_rate) ** -n_months)))
+
+
+def normalize_rate_segments(start_date, rate_history: Optional[List[Dict]], default_rate: float) -> List[Tuple[int, float]]:
+    """
+    將 liabilities 文件中的 rate_history [{effective_date, rate}, ...] 轉為
+    依「相對起始月份」排序的 [(month_offset, annual_rate), ...]。
+    第一段一律從第 0 期開始；沒有利率歷史時，退化為單一段的 default_rate。
+    """
+    if not isinstance(rate_history, list) or not rate_history:
+        return [(0, float(default_rate or 0.0))]
+
+    start = pd.to_datetime(start_date)
+    segments = {}
+    for item in rate_history:
+        if not isinstance(item, dict) or item.get('effective_date') is None or item.get('rate') is None:
+            continue
+        effective = pd.to_datetime(item['effective_date'])
+        offset = max(0, (effective.year - start.year) * 12 + (effective.month - start.month))
+        segments[offset] = float(item['rate'])  # 同一月份多筆時，以最後一筆為準
+
+    if not segments:
+        return [(0, float(default_rate or 0.0))]
+    ordered = sorted(segments.items())
+    if ordered[0][0] > 0:
+        ordered.insert(0, (0, ordered[0][1]))
+    return ordered
+
+
+def _segment_pieces(segments: List[Tuple[int, float]], total_months: int, grace_months: int):
+    """將利率分段再以寬限期結束點切開，回傳 [(起始期, 結束期, 年利率), ...]。"""
+    starts = [offset for offset, _ in segments if offset < total_months]
+    rates = [rate for offset, rate in segments if offset < total_months]
+    if 0 < grace_months < total_months and grace_months not in starts:
+        idx = np.searchsorted(starts, grace_months)
+        starts.insert(idx, grace_months)
+        rates.insert(idx, rates[idx - 1])
+    ends = starts[1:] + [total_months]
+    return list(zip(starts, ends, rates))
+
+
+def segmented_loan_state(principal: float, segments: List[Tuple[int, float]], total_months: int,
+                         grace_months: int, months_elapsed: int) -> Dict:
+    """
+    逐段 (而非逐月) 以封閉解推進機動利率貸款：每次利率變動時，
+    以當時剩餘本金與剩餘期數重新計算月付金。計算量為 O(分段數)。
+
+    Returns:
+        dict: outstanding_balance, regular_payment (目前利率下的本息月付金),
+              grace_period_payment (寬限期月付金), current_rate (目前年利率)
+    """
+    total_months, grace_months = int(total_months), int(grace_months)
+    months_elapsed = int(np.clip(months_elapsed, 0, total_months))
+    balance = float(principal)
+    regular_payment, current_rate = 0.0, segments[0][1]
+
+    for start, end, rate in _segment_pieces(segments, total_months, grace_months):
+        monthly_rate = rate / 100 / 12
+        if start > months_elapsed:
+            break
+        current_rate = rate
+        n = min(end, months_elapsed) - start
+        if start < grace_months:
+            continue  # 寬限期只繳利息，本金不變
+        regular_payment = _level_payment(balance, monthly_rate, total_months - start)
+        balance = float(_annuity_balance(balance, monthly_rate, regular_payment, n))
+
+    if regular_payment == 0 and months_elapsed < total_months:
+        # 尚未進入本息攤還期：以目前利率預估寬限期結束後的月付金
+        regular_payment = _level_payment(balance, current_rate / 100 / 12, total_months - max(months_elapsed, grace_months))
+
+    return {
+        "outstanding_balance": max(0.0, balance),
+        "regular_payment": regular_payment,
+        "grace_period_payment": round(principal * current_rate / 100 / 12) if grace_months > 0 else 0,
+        "current_rate": current_rate,
+    }
+
+
+def segmented_schedule_row(principal: float, segments: List[Tuple[int, float]], total_months: int,
+                           grace_months: int, n_months: int) -> Dict[str, np.ndarray]:
+    """
+    產生機動利率貸款的逐月攤還列 (長度 n_months)，每段內以向量化封閉解填值，
+    欄位與 build_amortization_matrix 的單列相同。
+    """
+    total_months, grace_months = int(total_months), int(grace_months)
+    row = {key: np.zeros(n_months) for key in ('payment', 'interest', 'principal', 'balance')}
+    row['active'] = np.arange(n_months) < total_months
+    balance = float(principal)
+
+    for start, end, rate in _segment_pieces(segments, total_months, grace_months):
+        monthly_rate = rate / 100 / 12
+        k = np.arange(1, end - start + 1)
+        if start < grace_months:
+            row['payment'][start:end] = balance * monthly_rate
+            row['interest'][start:end] = balance * monthly_rate
+            row['balance'][start:end] = max(balance, 0)
+            continue
+        payment = _level_payment(balance, monthly_rate, total_months - start)
+        closing = _annuity_balance(balance, monthly_rate, payment, k)
+        opening = np.concatenate([[balance], closing[:-1]])
+        row['payment'][start:end] = payment
+        row['interest'][start:end] = opening * monthly_rate
+        row['principal'][start:end] = payment - opening * monthly_rate
+        row['balance'][start:end] = np.maximum(closing, 0)
+        balance = float(closing[-1])
+
+    return row
+
+
+def liabilities_to_arrays(liabilities_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """將 Firestore 讀出的 liabilities DataFrame 轉為引擎所需的欄位陣列。"""
+    def column(name, default=0.0):
+        if name in liabilities_df.columns:
+            return pd.to_numeric(liabilities_df[name], errors='coerce').to_numpy(dtype=float)
+        return np.full(len(liabilities_df), default, dtype=float)
+
+    start_dates = pd.to_datetime(liabilities_df['start_date'].tolist())
+    years = column('loan_period_years')
+    grace_years = column('grace_period_years')
+    return {
+        "principal": column('total_amount'),
+        "annual_rate": column('interest_rate'),
+        "total_months": np.nan_to_num(years) * 12,
+        "grace_months": np.nan_to_num(grace_years) * 12,
+        "regular_payment": column('monthly_payment'),
+        "grace_payment": column('grace_period_payment_val', np.nan),
+        "start_month_index": np.asarray(start_dates.year * 12 + start_dates.month - 1, dtype=int),
+    }
+
+
+def summarize_by_year(schedule: Dict[str, np.ndarray], start_month_index: np.ndarray) -> pd.DataFrame:
+    """
+    將攤還矩陣依「日曆年」匯總 (以 bincount 於年度索引上累加)。
+
+    Args:
+        schedule: build_amortization_matrix 的輸出
+        start_month_index: 各貸款起始月份的絕對索引 (year * 12 + month - 1)
+
+    Returns:
+        pd.DataFrame: 欄位 year, annual_debt_payment, annual_interest, annual_principal,
+                      year_end_liabilities_nominal (每筆貸款取當年最後一個有效月份的餘額後加總)
+    """
+    columns = ['year', 'annual_debt_payment', 'annual_interest', 'annual_principal', 'year_end_liabilities_nominal']
+    active = schedule['active']
+    if active.size == 0 or not active.any():
+        return pd.DataFrame(columns=columns)
+
+    n_months = active.shape[1]
+    calendar_month = start_month_index[:, None] + np.arange(n_months)[None, :]
+    base_year = int(start_month_index.min()) // 12
+    year_idx = calendar_month // 12 - base_year
+
+    # 每筆貸款在每個年度的最後一個有效月份 (12 月或貸款最後一期)
+    next_active = np.concatenate([active[:, 1:], np.zeros((active.shape[0], 1), dtype=bool)], axis=1)
+    is_year_end = active & ((calendar_month % 12 == 11) | ~next_active)
+
+    idx = year_idx[active]
+    n_years = int(idx.max()) + 1
+    month_count = np.bincount(idx, minlength=n_years)
+    summary = pd.DataFrame({
+        'year': np.arange(n_years) + base_year,
+        'annual_debt_payment': np.bincount(idx, weights=schedule['payment'][active], minlength=n_years),
+        'annual_interest': np.bincount(idx, weights=schedule['interest'][active], minlength=n_years),
+        'annual_principal': np.bincount(idx, weights=schedule['principal'][active], minlength=n_years),
+        'year_end_liabilities_nominal': np.bincount(year_idx[is_year_end], weights=schedule['balance'][is_year_end], minlength=n_years),
+    })
+    return summary[month_count > 0].reset_index(drop=True)
+
+
+def _build_schedule_matrix(liabilities_df: pd.DataFrame, arrays: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """以單一向量化步驟建立 liabilities_df 中所有貸款的攤還矩陣 (機動利率貸款改以分段結果覆寫)。"""
+    schedule = build_amortization_matrix(
+        arrays['principal'], arrays['annual_rate'], arrays['total_months'],
+        arrays['grace_months'], arrays['regular_payment'], arrays['grace_payment']
+    )
+
+    # 有利率歷史的貸款，改以分段重新攤還的結果覆寫該列
+    if 'rate_history' in liabilities_df.columns:
+        n_months = schedule['active'].shape[1]
+        for i, (_, loan) in enumerate(liabilities_df.iterrows()):
+            history = loan.get('rate_history')
+            if not isinstance(history, list) or not history:
+                continue
+            segments = normalize_rate_segments(loan['start_date'], history, loan.get('interest_rate', 0.0))
+            row = segmented_schedule_row(arrays['principal'][i], segments, arrays['total_months'][i], arrays['grace_months'][i], n_months)
+            for key, values in row.items():
+                schedule[key][i] = values
+    return schedule
+
+
+# --- [v5.5.0 新增] 攤還表記憶化：以貸款參數雜湊為鍵，行程內 LRU + 選擇性寫回 liabilities 文件 ---
+
+SCHEDULE_CACHE_SIZE = 256
+_SCHEDULE_FIELDS = ('year', 'payment', 'interest', 'principal', 'year_end_balance')
+_schedule_cache: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+
+
+def _date_str(value) -> Optional[str]:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    return pd.to_datetime(value).strftime('%Y-%m-%d')
+
+
+def _number(value) -> float:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(value) else value
+
+
+def loan_param_hash(loan) -> str:
+    """
+    以決定攤還表的參數 (總額、利率、年限、寬限期、起始日、月付金、利率歷史) 計算穩定的雜湊值。
+    只要這些參數未被編輯，雜湊值就不會改變。
+    """
+    history = loan.get('rate_history')
+    params = {
+        "total_amount": _number(loan.get('total_amount')),
+        "interest_rate": _number(loan.get('interest_rate')),
+        "loan_period_years": _number(loan.get('loan_period_years')),
+        "grace_period_years": _number(loan.get('grace_period_years')),
+        "start_date": _date_str(loan.get('start_date')),
+        "monthly_payment": _number(loan.get('monthly_payment')),
+        "grace_period_payment_val": _number(loan.get('grace_period_payment_val')),
+        "rate_history": sorted(
+            (_date_str(item.get('effective_date')), _number(item.get('rate')))
+            for item in history if isinstance(item, dict)
+        ) if isinstance(history, list) else [],
+    }
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def clear_schedule_cache():
+    _schedule_cache.clear()
+
+
+def _remember(param_hash: str, table: Dict[str, np.ndarray]):
+    _schedule_cache[param_hash] = table
+    _schedule_cache.move_to_end(param_hash)
+    while len(_schedule_cache) > SCHEDULE_CACHE_SIZE:
+        _schedule_cache.popitem(last=False)
+
+
+def _persisted_table(loan, param_hash: str) -> Optional[Dict[str, np.ndarray]]:
+    """讀取寫回在 liabilities 文件上的 schedule_cache，雜湊不符時視為過期。"""
+    persisted = loan.get('schedule_cache')
+    if not isinstance(persisted, dict) or persisted.get('schedule_hash') != param_hash:
+        return None
+    try:
+        return {field: np.asarray(persisted[field], dtype=int if field == 'year' else float) for field in _SCHEDULE_FIELDS}
+    except KeyError:
+        return None
+
+
+def loan_yearly_schedules(liabilities_df: pd.DataFrame) -> List[Dict[str, np.ndarray]]:
+    """
+    回傳每筆貸款的逐年攤還表 ({year, payment, interest, principal, year_end_balance})。
+    依序查詢行程內 LRU 快取與文件上的 schedule_cache；
+    只有參數被編輯過 (雜湊不符) 的貸款才會重新建立，且所有未命中的貸款在同一次向量化運算中完成。
+    """
+    hashes = [loan_param_hash(loan) for _, loan in liabilities_df.iterrows()]
+    tables: List[Optional[Dict[str, np.ndarray]]] = [None] * len(hashes)
+
+    for i, (param_hash, (_, loan)) in enumerate(zip(hashes, liabilities_df.iterrows())):
+        if param_hash in _schedule_cache:
+            _schedule_cache.move_to_end(param_hash)
+            tables[i] = _schedule_cache[param_hash]
+        else:
+            tables[i] = _persisted_table(loan, param_hash)
+            if tables[i] is not None:
+                _remember(param_hash, tables[i])
+
+    misses = [i for i, table in enumerate(tables) if table is None]
+    if misses:
+        miss_df = liabilities_df.iloc[misses]
+        arrays = liabilities_to_arrays(miss_df)
+        schedule = _build_schedule_matrix(miss_df, arrays)
+        for row, i in enumerate(misses):
+            single = {key: values[row:row + 1] for key, values in schedule.items()}
+            summary = summarize_by_year(single, arrays['start_month_index'][row:row + 1])
+            table = {
+                "year": summary['year'].to_numpy(dtype=int),
+                "payment": summary['annual_debt_payment'].to_numpy(dtype=float),
+                "interest": summary['annual_interest'].to_numpy(dtype=float),
+                "principal": summary['annual_principal'].to_numpy(dtype=float),
+                "year_end_balance": summary['year_end_liabilities_nominal'].to_numpy(dtype=float),
+            }
+            _remember(hashes[i], table)
+            tables[i] = table
+    return tables
+
+
+def persistable_schedule(loan) -> Dict:
+    """產生可直接寫入 liabilities 文件 schedule_cache 欄位的精簡逐年攤還表 (含參數雜湊)。"""
+    table = loan_yearly_schedules(pd.DataFrame([dict(loan)]))[0]
+    persisted = {field: [int(v) if field == 'year' else float(v) for v in table[field]] for field in _SCHEDULE_FIELDS}
+    persisted['schedule_hash'] = loan_param_hash(loan)
+    return persisted
+
+
+def build_yearly_debt_summary(liabilities_df: pd.DataFrame) -> pd.DataFrame:
+    """從 liabilities DataFrame 產生所有貸款合併後的逐年攤還摘要 (各貸款攤還表經由記憶化取得)。"""
+    columns = ['year', 'annual_debt_payment', 'annual_interest', 'annual_principal', 'year_end_liabilities_nominal']
+    if liabilities_df is None or liabilities_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    tables = [t for t in loan_yearly_schedules(liabilities_df) if len(t['year'])]
+    if not tables:
+        return pd.DataFrame(columns=columns)
+
+    years = np.concatenate([t['year'] for t in tables])
+    base_year = int(years.min())
+    idx = years - base_year
+    n_years = int(idx.max()) + 1
+
+    def total(field):
+        return np.bincount(idx, weights=np.concatenate([t[field] for t in tables]), minlength=n_years)
+
+    summary = pd.DataFrame({
+        'year': np.arange(n_years) + base_year,
+        'annual_debt_payment': total('payment'),
+        'annual_interest': total('interest'),
+        'annual_principal': total('principal'),
+        'year_end_liabilities_nominal': total('year_end_balance'),
+    })
+    return summary[np.bincount(idx, minlength=n_years) > 0].reset_index(drop=True)
+
+
+# --- [v5.5.0 新增] 月度對齊：供月解析度現金流引擎使用 ---
+
+def build_monthly_debt_series(liabilities_df: pd.DataFrame, first_month_index: int, n_months: int) -> Dict:
+    """
+    將所有貸款的攤還矩陣對齊到日曆月份 (first_month_index 起共 n_months 個月)，並以 bincount 合計。
+
+    Returns:
+        dict: 'payment' / 'balance' (長度 n_months 的陣列)，
+              'loan_events' (各貸款的開始、寬限期結束、結清月份，month_offset 相對於 first_month_index)
+    """
+    payment = np.zeros(n_months)
+    balance = np.zeros(n_months)
+    if liabilities_df is None or liabilities_df.empty:
+        return {"payment": payment, "balance": balance, "loan_events": []}
+
+    arrays = liabilities_to_arrays(liabilities_df)
+    schedule = _build_schedule_matrix(liabilities_df, arrays)
+    start_offset = arrays['start_month_index'] - first_month_index
+    pos = start_offset[:, None] + np.arange(schedule['active'].shape[1])[None, :]
+    valid = schedule['active'] & (pos >= 0) & (pos < n_months)
+    payment = np.bincount(pos[valid], weights=schedule['payment'][valid], minlength=n_months)
+    balance = np.bincount(pos[valid], weights=schedule['balance'][valid], minlength=n_months)
+
+    loan_events = []
+    for i, (_, loan) in enumerate(liabilities_df.iterrows()):
+        name = loan.get('custom_name') or loan.get('debt_type', '')
+        loan_events.append({"month_offset": int(start_offset[i]), "type": "loan_start", "label": name})
+        if arrays['grace_months'][i] > 0:
+            loan_events.append({"month_offset": int(start_offset[i] + arrays['grace_months'][i]), "type": "grace_end", "label": name})
+        loan_events.append({"month_offset": int(start_offset[i] + arrays['total_months'][i]), "type": "loan_end", "label": name})
+    return {"payment": payment, "balance": balance, "loan_events": loan_events}
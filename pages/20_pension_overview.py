@@ -8,7 +8,7 @@ import plotly.express as px
 from datetime import datetime
 from firebase_admin import firestore
 # --- [v5.0.0 修正] 從 utils 引用所有核心函數 ---
-from utils import init_firebase, get_full_retirement_analysis, load_retirement_plan, load_pension_data, render_sidebar, RetirementCalculator
+from utils import init_firebase, get_retirement_analysis, load_retirement_plan, load_pension_data, render_sidebar, RetirementCalculator
 
 render_sidebar()
 
@@ -108,7 +108,8 @@ with st.expander("✏️ 編輯或輸入您的退休金規劃參數", expanded=n
             # 2. 呼叫計算引擎進行分析
             with st.spinner("正在為您計算退休金流..."):
                 # 注意：直接將收集到的 plan_data 傳遞給計算函數
-                analysis_results = get_full_retirement_analysis(plan_data) 
+                # [v5.5.0] 本頁需顯示逐年累積明細，明確要求建立 contribution_details
+                analysis_results = get_retirement_analysis(plan_data, saved_results, include_details=True)
             
             # 3. 將輸入與結果都存入 session state，以便立即顯示
             st.session_state['pension_plan_inputs'] = plan_data
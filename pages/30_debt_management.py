@@ -4,9 +4,12 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 from firebase_admin import firestore
 from utils import init_firebase, load_user_liabilities, calculate_loan_payments, render_sidebar, calculate_current_debt_snapshot, recalculate_single_loan
+from loan_schedule import build_yearly_debt_summary, loan_param_hash, persistable_schedule
+from debt_strategy import loans_for_strategy, build_strategy_grid, simulate_payoff_strategies, STRATEGY_METHODS
 
 render_sidebar()
 
@@ -32,6 +35,16 @@ def update_all_debt_balances():
     with st.spinner("正在重新計算所有債務的剩餘本金與月付金..."):
         updated_data = calculate_current_debt_snapshot(liabilities_to_update)
         
+        # 只有參數 (含重新計算後的月付金) 改變的貸款，才重建並寫回攤還表快取
+        for _, loan in liabilities_to_update.iterrows():
+            data = updated_data.get(loan['doc_id'])
+            if data is None:
+                continue
+            merged = {**loan.to_dict(), **data}
+            cached = loan.get('schedule_cache')
+            if not isinstance(cached, dict) or cached.get('schedule_hash') != loan_param_hash(merged):
+                data['schedule_cache'] = persistable_schedule(merged)
+
         batch = db.batch()
         for doc_id, data in updated_data.items():
             doc_ref = db.collection('users').document(user_id).collection('liabilities').document(doc_id)
@@ -90,6 +103,23 @@ def debt_form(mode='add', existing_data=None):
             s['grace_period_years'] = st.number_input("寬限期年數 (無則填0)", 0, 10, value=int(s.get('grace_period_years', 0)))
             s['start_date'] = st.date_input("貸款起始日期", value=pd.to_datetime(s.get('start_date')).date() if s.get('start_date') else datetime.now().date())
 
+        # --- [v5.5.0 新增] 機動利率：利率變動歷史 ---
+        st.markdown("##### 利率變動歷史 (選填)")
+        st.caption("若您的貸款為機動利率，請依序填入每次利率調整的「生效日期」與「調整後年利率」。填寫後，系統將依各段利率重新攤還，並以最新一段利率作為目前利率。")
+        rate_history_df = pd.DataFrame(
+            [{"生效日期": pd.to_datetime(item.get('effective_date')).date(), "年利率 (%)": float(item.get('rate', 0.0))}
+             for item in (s.get('rate_history') if isinstance(s.get('rate_history'), list) else [])],
+            columns=["生效日期", "年利率 (%)"]
+        )
+        edited_rate_history = st.data_editor(
+            rate_history_df, num_rows="dynamic", use_container_width=True, hide_index=True,
+            key=f"widget_{mode}_rate_history_editor",
+            column_config={
+                "生效日期": st.column_config.DateColumn("生效日期", format="YYYY-MM-DD", required=True),
+                "年利率 (%)": st.column_config.NumberColumn("年利率 (%)", min_value=0.0, max_value=20.0, step=0.01, format="%.3f", required=True)
+            }
+        )
+
         st.markdown("---")
         
         col_calc_btn, col_grace, col_regular = st.columns([1, 2, 2])
@@ -110,12 +140,17 @@ def debt_form(mode='add', existing_data=None):
 
             form_data = st.session_state[state_key].copy()
             form_data['start_date'] = datetime.combine(form_data['start_date'], datetime.min.time())
+            form_data['rate_history'] = [
+                {"effective_date": datetime.combine(pd.to_datetime(r["生效日期"]).date(), datetime.min.time()), "rate": float(r["年利率 (%)"])}
+                for _, r in edited_rate_history.dropna().sort_values("生效日期").iterrows()
+            ]
             
             with st.spinner("正在為您計算最新的債務狀況..."):
                 recalculated_data = recalculate_single_loan(form_data)
             
             final_data = form_data.copy()
             final_data.update(recalculated_data)
+            final_data['schedule_cache'] = persistable_schedule(final_data)
 
             if mode == 'add':
                 final_data["created_at"] = firestore.SERVER_TIMESTAMP
@@ -148,6 +183,19 @@ if not liabilities_df.empty:
     col1, col2 = st.columns(2)
     col1.metric("總剩餘負債 (TWD)", f"${total_outstanding:,.0f}")
     col2.metric("總月付金 (TWD)", f"${total_monthly_payment:,.0f}")
+
+    # --- [v5.5.0 新增] 所有貸款合併的逐年還款摘要 ---
+    with st.expander("📅 查看未來逐年還款摘要"):
+        yearly_summary = build_yearly_debt_summary(liabilities_df)
+        if not yearly_summary.empty:
+            chart_df = yearly_summary.set_index('year')[['annual_interest', 'annual_principal']]
+            chart_df.columns = ['年度利息', '年度本金']
+            st.bar_chart(chart_df, height=250)
+            display_df = yearly_summary.rename(columns={
+                'year': '年度', 'annual_debt_payment': '年度總還款', 'annual_interest': '年度利息',
+                'annual_principal': '年度本金', 'year_end_liabilities_nominal': '年末剩餘本金'
+            })
+            st.dataframe(display_df.style.format({c: "{:,.0f}" for c in display_df.columns if c != '年度'}), use_container_width=True, hide_index=True)
 else:
     st.info("您目前沒有建立任何債務資料。")
 
@@ -177,7 +225,7 @@ st.markdown("---")
 # 債務列表
 if not liabilities_df.empty:
     st.subheader("我的負債列表")
-    st.info("ℹ️ 溫馨提醒：「剩餘本金」為系統根據您的貸款參數，從頭回測至今日的**估算值**。此估算基於您設定的**目前利率**，若您過去的利率有變動，可能與銀行實際數字有輕微誤差。")
+    st.info("ℹ️ 溫馨提醒：「剩餘本金」為系統根據您的貸款參數，從頭回測至今日的**估算值**。若未填寫**利率變動歷史**，此估算僅基於您設定的**目前利率**；若您過去的利率有變動，請於編輯時補上各段利率，以減少與銀行實際數字的誤差。")
 
     debt_categories = ["房屋貸款", "信用貸款", "汽車貸款", "就學貸款", "其他"]
     existing_categories = [cat for cat in debt_categories if cat in liabilities_df['debt_type'].unique()]
@@ -226,4 +274,49 @@ if not liabilities_df.empty:
                             detail_cols[1].markdown(f"**總貸款年限**<br>{row.get('loan_period_years', 0)} 年", unsafe_allow_html=True)
                             detail_cols[2].markdown(f"**寬限期年數**<br>{row.get('grace_period_years', 0)} 年", unsafe_allow_html=True)
                             start_date_str = pd.to_datetime(row.get('start_date')).strftime('%Y-%m-%d') if row.get('start_date') else 'N/A'
-                            detail_cols[3].markdown(f"**貸款起始日期**<br>{start_date_str}", unsafe_allow_html=True)
\ No newline at end of file
+                            detail_cols[3].markdown(f"**貸款起始日期**<br>{start_date_str}", unsafe_allow_html=True)
+                            rate_history = row.get('rate_history')
+                            if isinstance(rate_history, list) and rate_history:
+                                st.markdown("**利率變動歷史**")
+                                st.dataframe(pd.DataFrame([
+                                    {"生效日期": pd.to_datetime(item.get('effective_date')).strftime('%Y-%m-%d'), "年利率 (%)": item.get('rate')}
+                                    for item in rate_history
+                                ]), hide_index=True)
+
+# --- [v5.5.0 新增] 提前還款與還款策略模擬 ---
+if not liabilities_df.empty:
+    st.markdown("---")
+    st.subheader("🧮 提前還款與還款策略模擬")
+    st.caption("以目前的剩餘本金與月付金為起點，比較「雪崩法 (高利率優先)」與「雪球法 (低餘額優先)」在不同額外還款金額下，可節省的總利息與全部清償的時間。已清償貸款釋出的月付金，會自動轉投到下一筆貸款。")
+
+    sc1, sc2, sc3 = st.columns(3)
+    extra_monthly = sc1.slider("每月額外還款金額", 0, 100000, 10000, 1000)
+    lump_sum = sc2.number_input("單筆提前還款金額", min_value=0, value=0, step=100000)
+    lump_sum_month = sc3.slider("單筆提前還款時間 (幾個月後)", 0, 60, 0)
+
+    strategy_loans = loans_for_strategy(liabilities_df)
+    extra_options = np.unique(np.append(np.linspace(0, max(extra_monthly * 2, 20000), 11), extra_monthly))
+    strategy_grid = build_strategy_grid(extra_options, sorted({0, lump_sum}), lump_sum_month=lump_sum_month)
+    strategy_results = simulate_payoff_strategies(strategy_loans, strategy_grid)
+
+    baseline = strategy_results.iloc[0]
+    selected = strategy_results[(strategy_results['extra_monthly'] == float(extra_monthly)) & (strategy_results['lump_sum'] == float(lump_sum))]
+
+    metric_cols = st.columns(3)
+    metric_cols[0].metric(STRATEGY_METHODS['baseline'], f"總利息 ${baseline['total_interest']:,.0f}", delta=f"清償於 {baseline['payoff_date']}", delta_color="off")
+    for col, (_, res) in zip(metric_cols[1:], selected.iterrows()):
+        col.metric(res['method_label'], f"省下利息 ${res['interest_saved']:,.0f}",
+                   delta=f"提早 {int(baseline['payoff_months'] - res['payoff_months'])} 個月，清償於 {res['payoff_date']}")
+
+    chart_df = strategy_results[(strategy_results['method'] != 'baseline') & (strategy_results['lump_sum'] == float(lump_sum))]
+    chart_df = chart_df.pivot(index='extra_monthly', columns='method_label', values='interest_saved')
+    chart_df.index.name = '每月額外還款'
+    st.line_chart(chart_df, height=250)
+
+    with st.expander("查看各貸款清償時間"):
+        payoff_table = pd.DataFrame(
+            {res['method_label']: res['payoff_months_by_loan'] for _, res in pd.concat([strategy_results.iloc[[0]], selected]).iterrows()},
+            index=strategy_loans['names']
+        )
+        payoff_table.index.name = '貸款'
+        st.dataframe(payoff_table.map(lambda m: f"{m} 個月"), use_container_width=True)
@@ -4,14 +4,22 @@
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+from datetime import date
 from utils import (
     render_sidebar,    
     init_firebase,
     load_user_assets_from_firestore,
     load_retirement_plan,
     load_user_liabilities,
-    get_holistic_financial_projection # 引入我們的終極計算引擎
+    get_holistic_financial_projection, # 引入我們的終極計算引擎
+    get_monte_carlo_projection,
+    get_sensitivity_grid,
+    solve_retirement_goal,
+    get_historical_backtest,
+    get_monthly_financial_projection
 )
 
 render_sidebar()
@@ -130,6 +138,22 @@ if 'final_analysis_results' in st.session_state:
         st.metric("...換算為每月所得 (名目價值)", f"NT$ {summary.get('first_month_disposable_income_nominal', 0):,.0f} /月")
         st.metric("...換算為每月所得 (今日購買力)", f"NT$ {summary.get('first_month_disposable_income_real_value', 0):,.0f} /月")
 
+    # --- [v5.5.0 新增] 目標反推 ---
+    with st.expander("🎯 目標反推：需要投資多少？最早何時可以退休？"):
+        st.caption("設定退休後每月想要的可支配所得 (今日購買力)，系統會直接反推答案，無需反覆調整表單。")
+        t1, t2 = st.columns(2)
+        target_income = t1.number_input("目標月可支配所得 (今日購買力)", min_value=0, value=50000, step=5000)
+        solve_label = t2.radio("求解目標", ["最低每年投資金額", "最早退休年齡"], horizontal=True)
+        if st.button("開始反推", use_container_width=True):
+            solve_for = "retirement_age" if solve_label == "最早退休年齡" else "annual_investment"
+            goal = solve_retirement_goal(user_id, target_income, solve_for=solve_for)
+            if not goal['feasible']:
+                st.warning("在目前的假設下無法達成此目標，請調整報酬率、提領率或目標金額。")
+            elif solve_for == "retirement_age":
+                st.success(f"最早可於 **{goal['retirement_age']} 歲** 退休，退休首月可支配所得約 NT$ {goal['monthly_income_real']:,.0f} (今日購買力)。")
+            else:
+                st.success(f"退休前每年至少需投資 **NT$ {goal['annual_investment']:,.0f}**，退休首月可支配所得約 NT$ {goal['monthly_income_real']:,.0f} (今日購買力)。")
+
     # [v5.0.0 建議 3] 資產與負債圖表 (含切換)
     st.markdown("---")
     st.subheader("資產與負債長期走勢")
@@ -139,26 +163,18 @@ if 'final_analysis_results' in st.session_state:
         asset_col = 'year_end_assets_real_value' if chart_type_asset == '實質購買力' else 'year_end_assets_nominal'
         liability_col = 'year_end_liabilities_real_value' if chart_type_asset == '實質購買力' else 'year_end_liabilities_nominal'
 
-        df_to_plot_assets = projection_df.melt(
-            id_vars=['age', 'investment_gain_nominal', 'annual_investment_nominal'], 
-            value_vars=[asset_col, liability_col],
-            var_name='項目',
-            value_name='金額'
-        )
-
+        # [v5.5.0] 引擎回傳欄式結果，直接以寬表繪圖，不再需要 melt
         label_mapping_assets = {asset_col: '總資產價值', liability_col: '總負債餘額'}
-        df_to_plot_assets['項目'] = df_to_plot_assets['項目'].map(label_mapping_assets)
 
         fig_assets = px.line(
-            df_to_plot_assets,
+            projection_df,
             x="age",
-            y="金額",
-            color="項目",
+            y=[asset_col, liability_col],
             title=f"資產與負債模擬曲線 ({chart_type_asset})",
-            labels={"age": "年齡", "金額": f"金額 (TWD, {chart_type_asset})"},
-            # [修正] custom_data 直接使用正確的欄位名稱
+            labels={"age": "年齡", "value": f"金額 (TWD, {chart_type_asset})", "variable": "項目"},
             custom_data=['investment_gain_nominal', 'annual_investment_nominal']
         )
+        fig_assets.for_each_trace(lambda t: t.update(name=label_mapping_assets[t.name]))
 
         fig_assets.update_traces(
             hovertemplate="<b>年齡: %{x}</b><br>" +
@@ -184,25 +200,18 @@ if 'final_analysis_results' in st.session_state:
         income_source_vars = ['asset_income_real_value', 'pension_income_real_value'] if chart_type_cashflow == '實質購買力' else ['asset_income_nominal', 'pension_income_nominal']
         total_income_var = 'total_income_real_value' if chart_type_cashflow == '實質購買力' else 'total_income_nominal'
 
-        cashflow_df = retirement_df.melt(
-            id_vars=['age', total_income_var],
-            value_vars=income_source_vars,
-            var_name='收入來源',
-            value_name='年度分項收入'
-        )
-        # ... (中文標籤映射不變) ...
         label_mapping_cashflow = {
             'asset_income_real_value': '資產被動收入', 'pension_income_real_value': '退休金收入',
             'asset_income_nominal': '資產被動收入', 'pension_income_nominal': '退休金收入'
         }
-        cashflow_df['收入來源'] = cashflow_df['收入來源'].map(label_mapping_cashflow)
 
         fig_cashflow = px.bar(
-            cashflow_df, x="age", y="年度分項收入", color="收入來源",
+            retirement_df, x="age", y=income_source_vars,
             title=f"退休後年度總收入來源分析 ({chart_type_cashflow})",
-            labels={"age": "年齡", "年度分項收入": f"年度收入 ({chart_type_cashflow})", "收入來源": "收入來源"}, # <-- [修正] 新增圖例標籤
+            labels={"age": "年齡", "value": f"年度收入 ({chart_type_cashflow})", "variable": "收入來源"},
             custom_data=[total_income_var]
         )
+        fig_cashflow.for_each_trace(lambda t: t.update(name=label_mapping_cashflow[t.name]))
 
         fig_cashflow.update_traces(
             hovertemplate="<b>年齡: %{x}</b><br><br>" +
@@ -245,4 +254,217 @@ if 'final_analysis_results' in st.session_state:
 
         st.plotly_chart(fig_disposable, use_container_width=True)
     else:
-        st.info("無退休後數據可供分析。")
\ No newline at end of file
+        st.info("無退休後數據可供分析。")
+
+
+    # --- [v5.5.0 新增] 蒙地卡羅模式 ---
+    st.markdown("---")
+    st.subheader("🎲 蒙地卡羅模擬 (報酬與通膨的不確定性)")
+    st.caption("以上述假設為平均值，隨機產生數千條年報酬率與通膨率路徑，觀察結果的分布區間 (P10 / P50 / P90)。")
+
+    with st.form("monte_carlo_form"):
+        m1, m2, m3, m4, m5 = st.columns(5)
+        mc_paths = m1.select_slider("模擬路徑數", options=[1000, 2000, 5000, 10000, 20000], value=10000)
+        mc_return_vol = m2.slider("報酬率年化波動度 (%)", 0.0, 30.0, 15.0, 0.5)
+        mc_inflation_vol = m3.slider("通膨率年化波動度 (%)", 0.0, 5.0, 1.0, 0.1)
+        mc_correlation = m4.slider("報酬與通膨相關係數", -1.0, 1.0, 0.0, 0.1)
+        mc_seed = m5.number_input("亂數種子 (相同種子可重現結果)", min_value=0, value=42, step=1)
+        mc_submitted = st.form_submit_button("執行蒙地卡羅模擬", use_container_width=True)
+
+    if mc_submitted:
+        with st.spinner(f"正在模擬 {mc_paths:,} 條路徑..."):
+            st.session_state['monte_carlo_results'] = get_monte_carlo_projection(
+                user_id, n_paths=mc_paths, return_volatility=mc_return_vol,
+                inflation_volatility=mc_inflation_vol, correlation=mc_correlation, seed=int(mc_seed)
+            )
+
+    if 'monte_carlo_results' in st.session_state:
+        mc = st.session_state['monte_carlo_results']
+        p10, p50, p90 = mc['assets_at_retirement_real_bands']
+
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("退休時資產 P10 (今日購買力)", f"NT$ {p10:,.0f}")
+        k2.metric("退休時資產 P50 (今日購買力)", f"NT$ {p50:,.0f}")
+        k3.metric("退休時資產 P90 (今日購買力)", f"NT$ {p90:,.0f}")
+        k4.metric("資產耗盡機率", f"{mc['depletion_probability']:.1%}",
+                  help=f"退休後任一年實質資產低於 NT$ {mc['depletion_floor']:,.0f} (約退休首年可支配所得) 的路徑比例")
+
+        def band_chart(bands, title, y_label):
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=mc['age'], y=bands[2], name="P90", line=dict(width=0), showlegend=False))
+            fig.add_trace(go.Scatter(x=mc['age'], y=bands[0], name="P10 ~ P90", fill='tonexty', line=dict(width=0)))
+            fig.add_trace(go.Scatter(x=mc['age'], y=bands[1], name="P50 (中位數)", line=dict(width=2)))
+            fig.add_vline(x=user_retirement_age, line_dash="dash", annotation_text="退休")
+            fig.update_layout(title=title, xaxis_title="年齡", yaxis_title=y_label, hovermode="x unified")
+            return fig
+
+        st.plotly_chart(band_chart(mc['assets_real_bands'], f"總資產分布區間 ({mc['n_paths']:,} 條路徑, 今日購買力)", "總資產 (TWD)"), use_container_width=True)
+        st.plotly_chart(band_chart(mc['disposable_income_real_bands'], "年度可支配所得分布區間 (今日購買力)", "年度可支配所得 (TWD)"), use_container_width=True)
+
+
+    # --- [v5.5.0 新增] 多維敏感度網格 ---
+    st.markdown("---")
+    st.subheader("🗺️ 多維敏感度分析 (報酬率 × 提領率 × 通膨率 × 退休年齡)")
+    st.caption("一次計算所有參數組合，並以熱力圖比較退休時資產與退休首年可支配所得 (皆為今日購買力)。")
+
+    with st.form("sensitivity_grid_form"):
+        g1, g2, g3, g4 = st.columns(4)
+        grid_return = g1.slider("報酬率範圍 (%)", 0.0, 15.0, (3.0, 10.0), 0.5)
+        grid_withdrawal = g2.slider("提領率範圍 (%)", 1.0, 10.0, (3.0, 6.0), 0.5)
+        grid_inflation = g3.slider("通膨率範圍 (%)", 0.0, 5.0, (1.0, 3.0), 0.5)
+        current_age = plan.get('current_age', 35)
+        grid_age = g4.slider("退休年齡範圍", int(current_age) + 1, 75,
+                             (max(int(current_age) + 1, user_retirement_age - 5), min(75, user_retirement_age + 5)), 1)
+        grid_submitted = st.form_submit_button("計算敏感度網格", use_container_width=True)
+
+    if grid_submitted:
+        with st.spinner("正在計算敏感度網格..."):
+            st.session_state['sensitivity_grid_results'] = get_sensitivity_grid(
+                user_id,
+                np.arange(grid_return[0], grid_return[1] + 1e-9, 0.5),
+                np.arange(grid_withdrawal[0], grid_withdrawal[1] + 1e-9, 0.5),
+                np.arange(grid_inflation[0], grid_inflation[1] + 1e-9, 0.5),
+                np.arange(grid_age[0], grid_age[1] + 1)
+            )
+
+    if 'sensitivity_grid_results' in st.session_state:
+        grid = st.session_state['sensitivity_grid_results']
+        dimension_labels = {
+            "return_rate": "報酬率 (%)", "withdrawal_rate": "提領率 (%)",
+            "inflation_rate": "通膨率 (%)", "retirement_age": "退休年齡",
+        }
+        dimensions = list(dimension_labels.keys())
+
+        h1, h2 = st.columns(2)
+        x_dim = h1.selectbox("熱力圖 X 軸", dimensions, index=0, format_func=dimension_labels.get)
+        y_options = [d for d in dimensions if d != x_dim]
+        y_dim = h2.selectbox("熱力圖 Y 軸", y_options, index=0, format_func=dimension_labels.get)
+
+        # 其餘兩個維度固定在使用者選擇的值
+        fixed_dims = [d for d in dimensions if d not in (x_dim, y_dim)]
+        fixed_cols = st.columns(len(fixed_dims))
+        index = [slice(None)] * len(dimensions)
+        for col, dim in zip(fixed_cols, fixed_dims):
+            values = list(grid[dim])
+            chosen = col.select_slider(f"固定{dimension_labels[dim]}", options=values, value=values[len(values) // 2])
+            index[dimensions.index(dim)] = values.index(chosen)
+
+        def grid_heatmap(metric_key, title):
+            matrix = grid[metric_key][tuple(index)]
+            # 切片後剩餘的兩軸依原順序排列；確保列為 Y 軸、欄為 X 軸
+            if dimensions.index(x_dim) < dimensions.index(y_dim):
+                matrix = matrix.T
+            fig = px.imshow(
+                matrix, x=[f"{v:g}" for v in grid[x_dim]], y=[f"{v:g}" for v in grid[y_dim]],
+                labels={"x": dimension_labels[x_dim], "y": dimension_labels[y_dim], "color": "TWD"},
+                color_continuous_scale="RdYlGn", aspect="auto", origin="lower", title=title
+            )
+            fig.update_traces(hovertemplate=f"{dimension_labels[x_dim]}: %{{x}}<br>{dimension_labels[y_dim]}: %{{y}}<br><b>%{{z:,.0f}}</b><extra></extra>")
+            return fig
+
+        st.plotly_chart(grid_heatmap("assets_at_retirement_real_value", "退休時總資產 (今日購買力)"), use_container_width=True)
+        st.plotly_chart(grid_heatmap("first_year_disposable_income_real_value", "退休首年可支配所得 (今日購買力)"), use_container_width=True)
+
+
+    # --- [v5.5.0 新增] 歷史報酬序列回測 ---
+    st.markdown("---")
+    st.subheader("📜 歷史回測 (報酬順序風險)")
+    st.caption("以台股加權指數與標普500指數的實際歷年報酬 (加上預期股息率) 重播您的計畫，比較不同起始年度的結果。歷史價格僅於首次使用時下載並存於本機。")
+
+    with st.form("historical_backtest_form"):
+        twii_weight = st.slider("台股加權指數權重 (%) (其餘為標普500指數)", 0, 100, 50, 5)
+        backtest_submitted = st.form_submit_button("執行歷史回測", use_container_width=True)
+
+    if backtest_submitted:
+        with st.spinner("正在回測所有歷史起始年度..."):
+            st.session_state['historical_backtest_results'] = get_historical_backtest(
+                user_id, {"^TWII": twii_weight / 100, "^GSPC": 1 - twii_weight / 100}
+            )
+
+    if 'historical_backtest_results' in st.session_state:
+        backtest = st.session_state['historical_backtest_results']
+        if not backtest:
+            st.warning("無法取得指數歷史價格，請稍後再試。")
+        elif backtest.get('insufficient_history'):
+            st.warning(f"指數歷史僅有 {backtest['history_years']} 個完整年度，不足以涵蓋目前至退休首年的 "
+                       f"{backtest['required_years']} 年，無法以實際歷史報酬回測。")
+        else:
+            st.caption(f"每條路徑皆為實際發生過的連續 {len(backtest['age'])} 年報酬 (目前年齡至 {backtest['horizon_end_age']} 歲)；"
+                       "為避免拼接不存在的報酬序列，回測只涵蓋至退休後數年，且不超過指數歷史長度。")
+            windows = backtest['windows'].set_index('start_year')
+            b1, b2, b3 = st.columns(3)
+            for col, label, key in [(b1, "最差", "worst"), (b2, "中位數", "median"), (b3, "最佳", "best")]:
+                row = windows.loc[backtest[key]]
+                col.metric(f"{label}起始年度：{backtest[key]}",
+                           f"NT$ {row['assets_at_retirement_real_value']:,.0f}",
+                           help=f"退休首月可支配所得約 NT$ {row['first_month_disposable_income_real_value']:,.0f}；年化報酬 {row['annualized_return']:.2%}")
+
+            fig_backtest = go.Figure()
+            for label, key in [("最差", "worst"), ("中位數", "median"), ("最佳", "best")]:
+                fig_backtest.add_trace(go.Scatter(x=backtest['age'], y=backtest['assets_real_paths'][backtest[key]],
+                                                  name=f"{label} ({backtest[key]} 年起)"))
+            fig_backtest.add_vline(x=user_retirement_age, line_dash="dash", annotation_text="退休")
+            fig_backtest.update_layout(title=f"歷史回測總資產路徑 (今日購買力，共 {len(windows)} 個起始年度)",
+                                       xaxis_title="年齡", yaxis_title="總資產 (TWD)", hovermode="x unified")
+            st.plotly_chart(fig_backtest, use_container_width=True)
+
+            with st.expander("查看所有起始年度的回測結果"):
+                st.dataframe(backtest['windows'].rename(columns={
+                    'start_year': '起始年度', 'assets_at_retirement_real_value': '退休時資產 (今日購買力)',
+                    'first_month_disposable_income_real_value': '退休首月可支配所得 (今日購買力)',
+                    'final_assets_real_value': f"{backtest['horizon_end_age']} 歲資產 (今日購買力)", 'annualized_return': '年化報酬率'
+                }), use_container_width=True)
+
+
+    # --- [v5.5.0 新增] 月解析度現金流模擬 ---
+    st.markdown("---")
+    st.subheader("📅 月度現金流模擬 (事件排程)")
+    st.caption("以「月」為單位模擬，貸款起訖、寬限期結束、退休月份、勞退/勞保請領與一次性大額支出都會落在實際的月份。")
+
+    with st.form("monthly_projection_form"):
+        today = date.today()
+        default_retirement = date(today.year + max(0, user_retirement_age - plan.get('current_age', 35)), today.month, 1)
+        retirement_date = st.date_input("預計退休年月", value=default_retirement)
+        st.markdown("**一次性支出 (例如購車、子女學費)**")
+        expenses_df = st.data_editor(
+            pd.DataFrame({"name": pd.Series(dtype=str), "date": pd.Series(dtype='datetime64[ns]'), "amount": pd.Series(dtype=float)}),
+            num_rows="dynamic", use_container_width=True, key="one_off_expenses_editor",
+            column_config={
+                "name": st.column_config.TextColumn("項目"),
+                "date": st.column_config.DateColumn("支出年月"),
+                "amount": st.column_config.NumberColumn("金額 (名目 TWD)", min_value=0, step=10000),
+            }
+        )
+        monthly_submitted = st.form_submit_button("執行月度模擬", use_container_width=True)
+
+    if monthly_submitted:
+        expenses = expenses_df.dropna(subset=['date', 'amount']).to_dict('records')
+        with st.spinner("正在執行月度模擬..."):
+            st.session_state['monthly_projection_results'] = get_monthly_financial_projection(
+                user_id, retirement_date=retirement_date, one_off_expenses=expenses
+            )
+
+    if 'monthly_projection_results' in st.session_state:
+        monthly = st.session_state['monthly_projection_results']
+        monthly_df = pd.DataFrame(monthly['timeseries'])
+
+        fig_monthly = px.line(
+            monthly_df, x="date", y=["assets_real_value", "liabilities_real_value"],
+            title="每月總資產與負債 (今日購買力)",
+            labels={"date": "年月", "value": "金額 (TWD, 今日購買力)", "variable": "項目"}
+        )
+        fig_monthly.for_each_trace(lambda t: t.update(name={'assets_real_value': '總資產價值', 'liabilities_real_value': '總負債餘額'}[t.name]))
+        st.plotly_chart(fig_monthly, use_container_width=True)
+
+        fig_monthly_income = px.bar(
+            monthly_df, x="date", y="disposable_income_real_value",
+            title="每月可支配所得 (今日購買力, 已扣除負債支出)",
+            labels={"date": "年月", "disposable_income_real_value": "每月可支配所得"}
+        )
+        st.plotly_chart(fig_monthly_income, use_container_width=True)
+
+        with st.expander("查看事件排程"):
+            events_df = pd.DataFrame(monthly['events'])
+            if not events_df.empty:
+                st.dataframe(events_df[['date', 'label', 'amount']].rename(
+                    columns={'date': '年月', 'label': '事件', 'amount': '金額'}), use_container_width=True)
@@ -6,7 +6,8 @@ import datetime
 import pytz
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from utils import render_sidebar, load_latest_model_data
+from utils import (render_sidebar, load_latest_model_data, load_model_detail, decode_series, load_model_score_archive,
+                   get_jvix_backtest, get_jvix_threshold_grid, JVIX_MARKETS)
 
 st.set_page_config(layout="wide")
 render_sidebar()
@@ -69,11 +70,18 @@ if hasattr(updated_at, 'strftime'):
 data = model_data_doc.get('data', {})
 j_vix_model_data = data.get('j_vix_model', {})
 tech_model_data = data.get('tech_model', {})
-raw_data = data.get('raw_data', {})
+# [v5.5.0 修正] 原始數據改為依類別延遲讀取的明細文件 (舊版文件仍內嵌於 raw_data)
+model_doc_id = model_data_doc.get('doc_id')
+legacy_raw_data = data.get('raw_data', {})
+
+def get_raw_data(family):
+    if family in legacy_raw_data:
+        return legacy_raw_data[family]
+    return load_model_detail(model_doc_id, family) if model_doc_id else {}
 
 
 # --- 頁面排版 ---
-tab1, tab2 = st.tabs(["短中期擇時訊號 (J值+VIX)", "科技股總經儀表板 (V7.3模型)"])
+tab1, tab2, tab3 = st.tabs(["短中期擇時訊號 (J值+VIX)", "科技股總經儀表板 (V7.3模型)", "J值+VIX 訊號回測"])
 
 # --- 頁籤一：短中期擇時訊號 (維持不變) ---
 with tab1:
@@ -100,7 +108,8 @@ with tab1:
     st.markdown("---")
     st.header("核心指標狀態")
 
-    kdj_data = raw_data.get('kdj', {})
+    # [v5.5.0 修正] 摘要文件已附各市場最新一期 KDJ，頁籤一不需讀取明細
+    kdj_data = j_vix_model_data.get('latest_kdj') or legacy_raw_data.get('kdj', {})
     latest_vix = j_vix_model_data.get('latest_vix', 'N/A')
 
     tabs_kdj = st.tabs(markets)
@@ -193,15 +202,44 @@ with tab2:
                         st.caption(f"├─ {key}: {details.get('value', 'N/A')}")
                         st.caption(f"└─ 評級: {details.get('rating', 'N/A')}")
 
-        with st.expander("🔍 展開以查看所有指標原始數據", expanded=False):
-
-            # --- [v5.4.0] 全新的三頁籤佈局 ---
-            exp_tabs = st.tabs(["產業數據", "總經數據", "領先指標"])
-
-            # 頁籤一：產業數據
-            with exp_tabs[0]:
+        # --- [v5.5.0 新增] 歷史評分走勢 (每日評分歸檔) ---
+        st.markdown("---")
+        st.header("📈 歷史評分走勢")
+        score_history = load_model_score_archive()
+        if score_history.empty:
+            st.info("評分歸檔正在累積中，每日模型執行後會新增一筆紀錄。")
+        else:
+            factor_columns = [k for k in max_scores if k in score_history.columns]
+            history_view = st.radio("顯示內容", ["總分", "因子分數"], horizontal=True, key="score_history_view")
+            fig_history = go.Figure()
+            if history_view == "總分":
+                # 各情境的分數區間 (對應 run_tech_model 的門檻)
+                for low, high, color in [(80, 100, "green"), (65, 80, "lightgreen"), (45, 65, "gold"), (25, 45, "orange"), (0, 25, "red")]:
+                    fig_history.add_hrect(y0=low, y1=high, fillcolor=color, opacity=0.08, line_width=0)
+                fig_history.add_trace(go.Scatter(
+                    x=score_history.index, y=score_history['total_score'], mode='lines', name='總分',
+                    customdata=score_history[['scenario', 'position']].values,
+                    hovertemplate='%{x|%Y-%m-%d}<br>總分: %{y:.1f}<br>%{customdata[0]}<br>建議倉位: %{customdata[1]}<extra></extra>'
+                ))
+                fig_history.update_layout(yaxis_range=[0, 100])
+            else:
+                for key in factor_columns:
+                    fig_history.add_trace(go.Scatter(x=score_history.index, y=score_history[key], mode='lines', name=key, stackgroup='factors'))
+            fig_history.update_layout(height=350, margin=dict(l=0, r=0, t=30, b=0), yaxis_title="分數",
+                                      legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+            st.plotly_chart(fig_history, use_container_width=True)
+            st.caption(f"共 {len(score_history)} 筆每日紀錄 ({score_history.index[0]:%Y-%m-%d} ~ {score_history.index[-1]:%Y-%m-%d})")
+
+        # [v5.5.0 修正] 改為開關 + 類別選單，只有開啟且選到的類別才讀取對應的明細文件
+        if st.toggle("🔍 顯示所有指標原始數據", value=False):
+
+            # --- [v5.4.0] 三類別佈局 ---
+            raw_view = st.radio("原始數據類別", ["產業數據", "總經數據", "領先指標"], horizontal=True, label_visibility="collapsed")
+
+            # 類別一：產業數據
+            if raw_view == "產業數據":
                 st.markdown("#### **科技巨頭關鍵財務數據 (季)**")
-                corporate_data = raw_data.get('corporate_financials', {})
+                corporate_data = get_raw_data('corporate_financials')
                 if not corporate_data:
                     st.write("產業數據正在收集中...")
                 else:
@@ -215,8 +253,7 @@ with tab2:
                                     # --- 營收 ---
                                     revenue_data = corporate_data[symbol].get('revenue', {})
                                     if revenue_data:
-                                        rev_df = pd.DataFrame.from_dict(revenue_data, orient='index', columns=['Revenue']).sort_index()
-                                        rev_df.index = pd.to_datetime(rev_df.index)
+                                        rev_df = decode_series(revenue_data, 'Revenue').to_frame()
                                         rev_df['YoY'] = rev_df['Revenue'].pct_change(4) * 100
                                         latest_rev_yoy = rev_df['YoY'].iloc[-1] if len(rev_df) >= 5 else 'N/A'
                                         
@@ -248,8 +285,7 @@ with tab2:
                                     # --- 資本支出 ---
                                     capex_data = corporate_data[symbol].get('capex', {})
                                     if capex_data:
-                                        capex_df = pd.DataFrame.from_dict(capex_data, orient='index', columns=['Capex']).sort_index()
-                                        capex_df.index = pd.to_datetime(capex_df.index)
+                                        capex_df = decode_series(capex_data, 'Capex').to_frame()
                                         capex_df['Capex'] = capex_df['Capex'].abs()
                                         capex_df['YoY'] = capex_df['Capex'].pct_change(4) * 100
                                         latest_capex_yoy = capex_df['YoY'].iloc[-1] if len(capex_df) >= 5 else 'N/A'
@@ -257,11 +293,11 @@ with tab2:
                                         st.metric("最新季資本支出年增率", f"{latest_capex_yoy:.2f}%" if isinstance(latest_capex_yoy, (int, float)) else "N/A")
 
 
-            # 頁籤二：總經數據
-            with exp_tabs[1]:
+            # 類別二：總經數據
+            elif raw_view == "總經數據":
                 st.markdown("#### **美國總經指標**")
-                fred_data = raw_data.get('fred', {})
-                ism_data = raw_data.get('dbnomics', {})
+                fred_data = get_raw_data('fred')
+                ism_data = get_raw_data('dbnomics')
                 
                 macro_data_sources = {**fred_data, **ism_data}
                 indicators_to_display = [
@@ -281,12 +317,12 @@ with tab2:
                     elif name == "ISM 製造業PMI-新訂單": original_name = "新訂單"
                     elif name == "ISM 製造業PMI-客戶端存貨": original_name = "客戶端存貨"
 
-                    if original_name in macro_data_sources and macro_data_sources.get(original_name):
+                    # [v5.5.0 修正] 以解碼後的長度判斷，空序列 (n=0) 的編碼 dict 本身不是空值
+                    series = decode_series(macro_data_sources[original_name]) if macro_data_sources.get(original_name) else None
+                    if series is not None and not series.empty:
                         with macro_cols[col_idx % 2]:
                              with st.container(border=True):
-                                df = pd.DataFrame.from_dict(macro_data_sources[original_name], orient='index', columns=['Value'])
-                                df.index = pd.to_datetime(df.index)
-                                df.sort_index(inplace=True)
+                                df = series.to_frame()
                                 
                                 st.markdown(f"**{name}**")
                                 latest_value = df['Value'].iloc[-1]
@@ -300,23 +336,22 @@ with tab2:
                                 st.line_chart(df, height=150)
                         col_idx += 1
 
-            # 頁籤三：領先指標
-            with exp_tabs[2]:
+            # 類別三：領先指標
+            else:
                 st.markdown("#### **領先指標 (OECD)**")
-                dbnomics_data = raw_data.get('dbnomics', {})
+                dbnomics_data = get_raw_data('dbnomics')
                 
                 lead_indicators_to_display = ["OECD 美國領先指標"] # 只保留 OECD
                 
                 lead_cols = st.columns(2)
                 col_idx_lead = 0
                 for name in lead_indicators_to_display:
-                    if name in dbnomics_data and dbnomics_data.get(name):
+                    series = decode_series(dbnomics_data[name]) if dbnomics_data.get(name) else None
+                    if series is not None and not series.empty:
                         # 顯示絕對值卡片
                         with lead_cols[col_idx_lead % 2]:
                              with st.container(border=True):
-                                df = pd.DataFrame.from_dict(dbnomics_data[name], orient='index', columns=['Value'])
-                                df.index = pd.to_datetime(df.index)
-                                df.sort_index(inplace=True)
+                                df = series.to_frame()
                                 
                                 st.markdown(f"**{name}**")
                                 latest_value = df['Value'].iloc[-1]
@@ -330,11 +365,12 @@ with tab2:
                                 st.line_chart(df, height=150)
                         col_idx_lead += 1
                 
-                        # 額外計算並顯示年增率卡片
+                        # 額外計算並顯示年增率卡片 (不足 13 個月時無年增率可顯示)
+                        oecd_yoy = (df.pct_change(12) * 100).dropna()
+                        if oecd_yoy.empty:
+                            continue
                         with lead_cols[col_idx_lead % 2]:
                             with st.container(border=True):
-                                oecd_yoy = df.pct_change(12) * 100
-                                oecd_yoy.dropna(inplace=True)
                                 
                                 st.markdown(f"**{name} (年增率 %)**")
                                 latest_yoy = oecd_yoy['Value'].iloc[-1]
@@ -345,4 +381,78 @@ with tab2:
                                     label=f"最新 ({oecd_yoy.index[-1].strftime('%Y-%m')})",
                                     value=f"{latest_yoy:,.2f}%",
                                     delta=f"{delta_yoy:,.2f}" if delta_yoy is not None else None)
-                                st.line_chart(oecd_yoy, height=150)
\ No newline at end of file
+                                st.line_chart(oecd_yoy, height=150)
+
+
+# --- [v5.5.0 新增] 頁籤三：J值+VIX 訊號回測 ---
+with tab3:
+    st.header("📊 J值+VIX 訊號歷史回測")
+    st.caption("以近十年日線重算每個交易日當下的週/月 J 值，統計「J 值低於門檻且 VIX 高於門檻」之後各期間的指數報酬 (價格指數，不含股息)。")
+    signal_labels = {"mid_term_pullback": "中期回檔訊號 (週J)", "inventory_cycle": "庫存週期訊號 (月J)"}
+
+    with st.form("jvix_backtest_form"):
+        form_cols = st.columns(4)
+        j_threshold = form_cols[0].number_input("J 值門檻 (低於)", value=20.0, step=5.0)
+        vix_threshold = form_cols[1].number_input("VIX 門檻 (高於)", value=25.0, step=1.0)
+        horizons = form_cols[2].multiselect("前瞻期間 (月)", [1, 3, 6, 12, 24], default=[1, 3, 6, 12])
+        episodes_only = form_cols[3].checkbox("連續訊號只計第一天", value=True)
+        submitted = st.form_submit_button("執行回測")
+
+    # [v5.5.0 修正] 各頁籤內容每次重新執行都會跑；只有送出表單後才讀取價格歷史並回測
+    if submitted:
+        with st.spinner("正在回測所有市場..."):
+            st.session_state['jvix_backtest'] = get_jvix_backtest(j_threshold, vix_threshold, tuple(sorted(horizons)) or (3,), episodes_only)
+    backtest = st.session_state.get('jvix_backtest')
+
+    if backtest is None:
+        st.info("設定門檻後按下「執行回測」。")
+    elif not backtest:
+        st.warning("無法取得市場價格歷史，請稍後再試。")
+    else:
+        st.caption(f"回測期間: {backtest['start']:%Y-%m-%d} ~ {backtest['end']:%Y-%m-%d}")
+        summary = backtest['summary']
+        for signal_name, label in signal_labels.items():
+            st.markdown(f"#### {label}")
+            rows = summary[summary['signal'] == signal_name]
+            table = rows.pivot(index='market', columns='horizon_months', values='mean_return').reindex(list(JVIX_MARKETS)) * 100
+            baseline = rows.pivot(index='market', columns='horizon_months', values='baseline_return').reindex(list(JVIX_MARKETS)) * 100
+            win_rate = rows.pivot(index='market', columns='horizon_months', values='win_rate').reindex(list(JVIX_MARKETS)) * 100
+            counts = rows.groupby('market')['n_signals'].max().reindex(list(JVIX_MARKETS))
+            display = pd.DataFrame({"訊號次數": counts})
+            for months in table.columns:
+                display[f"{months}月 平均報酬%"] = table[months].round(2)
+                display[f"{months}月 勝率%"] = win_rate[months].round(1)
+                display[f"{months}月 基準%"] = baseline[months].round(2)
+            st.dataframe(display, use_container_width=True)
+
+        with st.expander("📋 訊號明細"):
+            events = backtest['events'].copy()
+            events['signal'] = events['signal'].map(signal_labels)
+            return_cols = [c for c in events.columns if c.startswith('return_')]
+            events[return_cols] = (events[return_cols] * 100).round(2)
+            st.dataframe(events.sort_values('date', ascending=False), use_container_width=True, hide_index=True)
+
+    st.markdown("---")
+    st.subheader("🗺️ 門檻掃描")
+    # 同樣改為開關，開啟後才讀取價格歷史並掃描門檻
+    if st.toggle("顯示門檻掃描", value=False, key="jvix_grid_toggle"):
+        grid_cols = st.columns(3)
+        grid_signal = grid_cols[0].selectbox("訊號", list(signal_labels), format_func=signal_labels.get)
+        grid_horizon = grid_cols[1].selectbox("前瞻期間 (月)", [1, 3, 6, 12], index=1)
+        grid_market = grid_cols[2].selectbox("市場", list(JVIX_MARKETS))
+        j_grid = list(range(-10, 45, 5))
+        vix_grid = list(range(15, 45, 2))
+        grid = get_jvix_threshold_grid(j_grid, vix_grid, grid_horizon, grid_signal, episodes_only)
+        if grid:
+            m = grid['markets'].index(grid_market)
+            mean_grid = grid['mean_return'][:, :, m] * 100
+            count_grid = grid['n_signals'][:, :, m]
+            fig_grid = go.Figure(go.Heatmap(
+                z=mean_grid, x=[f"VIX>{v}" for v in vix_grid], y=[f"J<{j}" for j in j_grid],
+                text=count_grid, texttemplate="%{text}", colorscale="RdYlGn", zmid=grid['baseline_return'][m] * 100,
+                hovertemplate='%{y}, %{x}<br>平均報酬: %{z:.2f}%<br>訊號次數: %{text}<extra></extra>',
+                colorbar=dict(title="平均報酬%")
+            ))
+            fig_grid.update_layout(height=450, margin=dict(l=0, r=0, t=30, b=0))
+            st.plotly_chart(fig_grid, use_container_width=True)
+            st.caption(f"格內數字為訊號次數；顏色中心為同期全部交易日的平均 {grid_horizon} 個月報酬 ({grid['baseline_return'][m] * 100:.2f}%)。")
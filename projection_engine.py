@@ -0,0 +1,515 @@
+# projection_engine.py (v5.5.0)
+# 整合性財務模擬的陣列引擎：以「年齡」為索引的預先配置 NumPy 陣列取代逐年 dict 迴圈。
+# 所有參數皆可為純量或可廣播的陣列 (例如多組情境、多條報酬路徑)，年齡維度固定在最後一軸。
+
+import heapq
+import numpy as np
+import pandas as pd
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 勞退法定請領年齡
+PENSION_CLAIM_AGE = 60
+PROJECTION_END_AGE = 100
+
+# 需要同時輸出名目與實質價值的欄位
+VALUE_KEYS = ["year_end_assets", "year_end_liabilities", "disposable_income", "asset_income",
+              "pension_income", "total_income", "investment_gain", "annual_investment"]
+
+
+def align_debt_by_age(yearly_debt_summary: pd.DataFrame, current_age: int, current_year: int,
+                      end_age: int = PROJECTION_END_AGE) -> Dict[str, np.ndarray]:
+    """將逐年攤還摘要 (以日曆年為索引) 對齊到以年齡為索引的陣列，缺值年度補 0。"""
+    n_years = end_age - current_age + 1
+    payment = np.zeros(n_years)
+    balance = np.zeros(n_years)
+    if yearly_debt_summary is not None and not yearly_debt_summary.empty:
+        pos = yearly_debt_summary['year'].to_numpy(dtype=int) - current_year
+        valid = (pos >= 0) & (pos < n_years)
+        payment[pos[valid]] = yearly_debt_summary['annual_debt_payment'].to_numpy(dtype=float)[valid]
+        balance[pos[valid]] = yearly_debt_summary['year_end_liabilities_nominal'].to_numpy(dtype=float)[valid]
+    return {"annual_debt_payment": payment, "year_end_liabilities_nominal": balance}
+
+
+def _scenario(value) -> np.ndarray:
+    """純量或情境陣列 → 在最後補上一個年齡軸以便廣播。"""
+    return np.asarray(value, dtype=float)[..., None]
+
+
+def _compound_assets(start_assets, growth, contribution) -> np.ndarray:
+    """
+    以累積乘積求解 A_{t+1} = g_t * A_t + c_t，回傳每年年末資產。
+    A_t = G_t * (A_0 + Σ_{k≤t} c_k / G_k)，其中 G_t = Π_{k≤t} g_k。
+    """
+    cumulative_growth = np.cumprod(growth, axis=-1)
+    discounted = np.cumsum(contribution / cumulative_growth, axis=-1)
+    return cumulative_growth * (start_assets + discounted)
+
+
+def run_projection(current_assets, current_age: int, retirement_age, return_rate, dividend_yield,
+                   withdrawal_rate, inflation_rate, annual_investment, labor_pension_monthly,
+                   total_pension_monthly, legal_age, annual_debt_payment: Optional[np.ndarray] = None,
+                   year_end_liabilities: Optional[np.ndarray] = None, return_path: Optional[np.ndarray] = None,
+                   inflation_path: Optional[np.ndarray] = None, end_age: int = PROJECTION_END_AGE,
+                   value_keys: Sequence[str] = VALUE_KEYS) -> Dict[str, np.ndarray]:
+    """
+    執行整合性財務模擬 (年為單位，年齡 current_age ~ end_age)。
+
+    Args:
+        current_assets: 目前總資產 (TWD)
+        current_age: 目前年齡 (所有情境共用)
+        retirement_age: 退休年齡，可為情境陣列
+        return_rate / dividend_yield / withdrawal_rate / inflation_rate: 年化比率 (小數)，可為情境陣列
+        annual_investment: 退休前每年新增投資
+        labor_pension_monthly: 勞退月領金額 (60 歲起)
+        total_pension_monthly: 勞退 + 勞保月領金額 (法定請領年齡起)
+        legal_age: 勞保法定請領年齡
+        annual_debt_payment / year_end_liabilities: 以年齡為索引的負債陣列 (align_debt_by_age)
+        return_path / inflation_path: 形狀 (..., 年數) 的逐年報酬率或通膨率，提供時取代對應的固定比率
+        value_keys: 需要輸出的欄位 (預設全部)；大量路徑模擬時可只取所需欄位以節省記憶體
+
+    Returns:
+        dict: 欄式結果，每個欄位形狀為 (..., 年數)；另含 'age' 與 'phase'
+    """
+    ages = np.arange(current_age, end_age + 1)
+    n_years = ages.size
+    years_from_now = np.arange(n_years)
+
+    is_accumulation = ages < _scenario(retirement_age)
+    rr = np.asarray(return_path, dtype=float) if return_path is not None else _scenario(return_rate)
+    dy = _scenario(dividend_yield)
+    wr = _scenario(withdrawal_rate)
+    investment = _scenario(annual_investment)
+
+    debt_payment = np.zeros(n_years) if annual_debt_payment is None else np.asarray(annual_debt_payment, dtype=float)
+    liabilities = np.zeros(n_years) if year_end_liabilities is None else np.asarray(year_end_liabilities, dtype=float)
+
+    # 1. 資產演進：累積期 A*(1+r) + 投資；提領期 A*(1+r-w) (股息視為再投入後提領)
+    growth = np.where(is_accumulation, 1 + rr, 1 + rr - wr)
+    contribution = np.where(is_accumulation, investment, 0.0)
+    year_end_assets = _compound_assets(_scenario(current_assets), growth, contribution)
+    start_assets = np.concatenate(
+        [np.broadcast_to(_scenario(current_assets), year_end_assets.shape[:-1] + (1,)), year_end_assets[..., :-1]], axis=-1
+    )
+
+    # 2. 收入與支出
+    investment_gain = start_assets * rr
+    asset_income = np.where(is_accumulation, 0.0, start_assets * (dy + wr))
+    pension_by_age = np.where(ages >= _scenario(legal_age), _scenario(total_pension_monthly) * 12,
+                              np.where(ages >= PENSION_CLAIM_AGE, _scenario(labor_pension_monthly) * 12, 0.0))
+    pension_income = np.where(is_accumulation, 0.0, pension_by_age)
+    total_income = asset_income + pension_income
+    disposable_income = np.where(is_accumulation, -debt_payment, total_income - debt_payment)
+
+    # 3. 通膨折現
+    if inflation_path is not None:
+        inflation_divisor = np.cumprod(1 + np.asarray(inflation_path, dtype=float), axis=-1)
+    else:
+        inflation_divisor = (1 + _scenario(inflation_rate)) ** (years_from_now + 1)
+
+    shape = np.broadcast_shapes(year_end_assets.shape, inflation_divisor.shape, is_accumulation.shape)
+    nominal = {
+        "year_end_assets": year_end_assets,
+        "year_end_liabilities": liabilities,
+        "disposable_income": disposable_income,
+        "asset_income": asset_income,
+        "pension_income": pension_income,
+        "total_income": total_income,
+        "investment_gain": investment_gain,
+        "annual_investment": contribution,
+    }
+    result = {"age": ages}
+    for key in value_keys:
+        value = np.broadcast_to(nominal[key], shape)
+        result[f"{key}_nominal"] = value
+        result[f"{key}_real_value"] = value / inflation_divisor
+    if list(value_keys) == VALUE_KEYS:
+        result["phase"] = np.where(np.broadcast_to(is_accumulation, shape), "accumulation", "decumulation")
+        result["monthly_disposable_income_nominal"] = result["disposable_income_nominal"] / 12
+        result["monthly_disposable_income_real_value"] = result["disposable_income_real_value"] / 12
+        result["withdrawal_percentage"] = np.where(np.broadcast_to(is_accumulation, shape), np.nan, np.broadcast_to(wr * 100, shape))
+    return result
+
+
+def summarize_at_retirement(result: Dict[str, np.ndarray], current_age: int, retirement_age) -> Dict:
+    """取出退休當年的關鍵指標；退休年齡超出模擬範圍時為 0。可處理情境陣列。"""
+    n_years = result["age"].size
+    idx = np.asarray(retirement_age, dtype=int) - current_age
+    valid = (idx >= 0) & (idx < n_years)
+    safe_idx = np.clip(idx, 0, n_years - 1)
+
+    def at_retirement(key):
+        values = result[key]
+        picked = np.take_along_axis(values, np.broadcast_to(safe_idx[..., None], values.shape[:-1] + (1,)), axis=-1)[..., 0]
+        picked = np.where(valid, picked, 0.0)
+        return picked.item() if picked.ndim == 0 else picked
+
+    first_year_nominal = at_retirement("disposable_income_nominal")
+    first_year_real = at_retirement("disposable_income_real_value")
+    return {
+        "assets_at_retirement_nominal": at_retirement("year_end_assets_nominal"),
+        "assets_at_retirement_real_value": at_retirement("year_end_assets_real_value"),
+        "first_year_disposable_income_nominal": first_year_nominal,
+        "first_year_disposable_income_real_value": first_year_real,
+        "first_month_disposable_income_nominal": first_year_nominal / 12,
+        "first_month_disposable_income_real_value": first_year_real / 12,
+    }
+
+
+# --- [v5.5.0 新增] 蒙地卡羅模擬 ---
+
+def simulate_rate_paths(n_paths: int, n_years: int, return_rate, return_volatility, inflation_rate,
+                        inflation_volatility, correlation: float = 0.0, seed: Optional[int] = None):
+    """
+    以常態分布產生 (路徑數 × 年數) 的報酬率與通膨率路徑，兩者可設定相關係數。
+    所有比率皆為小數 (例如 0.07)。
+    """
+    rng = np.random.default_rng(seed)
+    z_return = rng.standard_normal((n_paths, n_years))
+    z_independent = rng.standard_normal((n_paths, n_years))
+    z_inflation = correlation * z_return + np.sqrt(max(0.0, 1 - correlation ** 2)) * z_independent
+    return_path = return_rate + return_volatility * z_return
+    inflation_path = inflation_rate + inflation_volatility * z_inflation
+    # 報酬率不得低於 -100%，通膨率不得低於 -100%
+    return np.maximum(return_path, -0.99), np.maximum(inflation_path, -0.99)
+
+
+def run_monte_carlo(projection_inputs: Dict, n_paths: int = 10000, return_volatility: float = 0.15,
+                    inflation_volatility: float = 0.01, correlation: float = 0.0, seed: Optional[int] = None,
+                    depletion_floor: Optional[float] = None, percentiles: Sequence[float] = (10, 50, 90)) -> Dict:
+    """
+    以 (路徑數 × 年數) 一次向量化計算蒙地卡羅模擬。
+
+    Args:
+        projection_inputs: run_projection 的參數 (需為單一情境的純量)
+        n_paths: 模擬路徑數
+        return_volatility / inflation_volatility: 年化標準差 (小數)
+        correlation: 報酬率與通膨率的相關係數
+        seed: 亂數種子，相同種子可重現相同結果
+        depletion_floor: 退休後實質資產低於此金額即視為「耗盡」；預設為確定性情境下退休首年的實質可支配所得 (約一年生活費)
+
+    Returns:
+        dict: age, percentiles, assets_real_bands / disposable_income_real_bands (形狀: 百分位數 × 年數),
+              depletion_probability, assets_at_retirement_real_bands
+    """
+    current_age = projection_inputs['current_age']
+    retirement_age = projection_inputs['retirement_age']
+    end_age = projection_inputs.get('end_age', PROJECTION_END_AGE)
+    n_years = end_age - current_age + 1
+
+    if depletion_floor is None:
+        deterministic = run_projection(**projection_inputs, value_keys=["year_end_assets", "disposable_income"])
+        depletion_floor = max(0.0, summarize_at_retirement(deterministic, current_age, retirement_age)["first_year_disposable_income_real_value"])
+
+    return_path, inflation_path = simulate_rate_paths(
+        n_paths, n_years, projection_inputs['return_rate'], return_volatility,
+        projection_inputs['inflation_rate'], inflation_volatility, correlation, seed
+    )
+    result = run_projection(**projection_inputs, return_path=return_path, inflation_path=inflation_path,
+                            value_keys=["year_end_assets", "disposable_income"])
+
+    assets_real = result["year_end_assets_real_value"]
+    income_real = result["disposable_income_real_value"]
+    retired = result["age"] >= retirement_age
+    depleted = (assets_real < depletion_floor) & retired
+
+    retirement_idx = int(np.clip(retirement_age - current_age, 0, n_years - 1))
+    return {
+        "age": result["age"],
+        "percentiles": list(percentiles),
+        "assets_real_bands": np.percentile(assets_real, percentiles, axis=0),
+        "disposable_income_real_bands": np.percentile(income_real, percentiles, axis=0),
+        "assets_at_retirement_real_bands": np.percentile(assets_real[:, retirement_idx], percentiles),
+        "depletion_probability": float(depleted.any(axis=1).mean()),
+        "depletion_floor": float(depletion_floor),
+        "n_paths": n_paths,
+    }
+
+
+# --- [v5.5.0 新增] 多維敏感度網格 ---
+
+GRID_DIMENSIONS = ["return_rate", "withdrawal_rate", "inflation_rate", "retirement_age"]
+# 隨退休年齡變動的退休金欄位 (提繳年數、年資與請領年齡皆不同)
+PENSION_KEYS = ["labor_pension_monthly", "total_pension_monthly"]
+PensionForAges = Callable[[np.ndarray], Dict[str, np.ndarray]]
+
+
+def _pensions_for_ages(pension_for_ages: Optional[PensionForAges], ages: np.ndarray) -> Dict[str, np.ndarray]:
+    """以 pension_for_ages 計算各退休年齡的月領金額，形狀與 ages 相同；未提供時回傳空 dict (沿用原輸入)。"""
+    if pension_for_ages is None:
+        return {}
+    pensions = pension_for_ages(np.ravel(ages))
+    return {key: np.asarray(pensions[key], dtype=float).reshape(np.shape(ages)) for key in PENSION_KEYS}
+
+
+def run_sensitivity_grid(projection_inputs: Dict, return_rates: Sequence[float], withdrawal_rates: Sequence[float],
+                         inflation_rates: Sequence[float], retirement_ages: Sequence[int],
+                         pension_for_ages: Optional[PensionForAges] = None) -> Dict:
+    """
+    報酬率 × 提領率 × 通膨率 × 退休年齡 的網格掃描。
+    每個維度各佔一軸後交給 run_projection 廣播，一次算出整個網格 (形狀: R × W × I × A)。
+
+    pension_for_ages: 傳入退休年齡陣列、回傳各年齡 PENSION_KEYS 月領金額的函數；提供時退休金沿退休年齡軸廣播，
+                      未提供時沿用 projection_inputs 中的值。
+
+    Returns:
+        dict: 各維度的座標軸 (GRID_DIMENSIONS)，以及
+              assets_at_retirement_real_value / first_year_disposable_income_real_value 兩個 4 維陣列
+    """
+    axes = {
+        "return_rate": np.asarray(return_rates, dtype=float),
+        "withdrawal_rate": np.asarray(withdrawal_rates, dtype=float),
+        "inflation_rate": np.asarray(inflation_rates, dtype=float),
+        "retirement_age": np.asarray(retirement_ages, dtype=int),
+    }
+    # 第 i 個維度放在第 i 軸，其餘軸長度為 1
+    grid = {name: values.reshape([-1 if i == j else 1 for j in range(len(GRID_DIMENSIONS))])
+            for i, (name, values) in enumerate(axes.items())}
+
+    inputs = {**projection_inputs, **grid, **_pensions_for_ages(pension_for_ages, grid['retirement_age'])}
+    result = run_projection(**inputs, value_keys=["year_end_assets", "disposable_income"])
+    summary = summarize_at_retirement(result, projection_inputs['current_age'], grid['retirement_age'])
+
+    shape = tuple(values.size for values in axes.values())
+    return {
+        **axes,
+        "assets_at_retirement_real_value": np.broadcast_to(summary["assets_at_retirement_real_value"], shape),
+        "first_year_disposable_income_real_value": np.broadcast_to(summary["first_year_disposable_income_real_value"], shape),
+    }
+
+
+# --- [v5.5.0 新增] 目標反推 (goal seek) ---
+
+def _first_month_real_income(projection_inputs: Dict, **overrides) -> np.ndarray:
+    """以 overrides (可為陣列) 執行一次廣播模擬，回傳退休首月的實質可支配所得。"""
+    inputs = {**projection_inputs, **overrides}
+    result = run_projection(**inputs, value_keys=["year_end_assets", "disposable_income"])
+    summary = summarize_at_retirement(result, inputs['current_age'], inputs['retirement_age'])
+    return np.asarray(summary["first_month_disposable_income_real_value"])
+
+
+def solve_required_investment(projection_inputs: Dict, target_monthly_income: float, max_investment: float = 1e8,
+                              tolerance: float = 100.0, n_grid: int = 65) -> Optional[Dict]:
+    """
+    找出達成「退休首月實質可支配所得 ≥ target_monthly_income」所需的最低每年投資金額。
+
+    每一輪以 n_grid 個候選值做一次廣播模擬，找出第一個達標的區間後在該區間內再細分
+    (向量化的區間二分法)，直到區間寬度小於 tolerance。無法在 max_investment 內達成時回傳 None。
+    """
+    low, high = 0.0, max_investment
+    income_without_investment = float(_first_month_real_income(projection_inputs, annual_investment=low))
+    if income_without_investment >= target_monthly_income:
+        return {"annual_investment": 0.0, "monthly_income_real": income_without_investment}
+    if _first_month_real_income(projection_inputs, annual_investment=high) < target_monthly_income:
+        return None
+
+    while high - low > tolerance:
+        candidates = np.linspace(low, high, n_grid)
+        met = _first_month_real_income(projection_inputs, annual_investment=candidates) >= target_monthly_income
+        first = int(np.argmax(met))
+        low, high = candidates[max(first - 1, 0)], candidates[first]
+
+    return {"annual_investment": float(high), "monthly_income_real": float(_first_month_real_income(projection_inputs, annual_investment=high))}
+
+
+def solve_earliest_retirement_age(projection_inputs: Dict, target_monthly_income: float,
+                                  max_age: Optional[int] = None,
+                                  pension_for_ages: Optional[PensionForAges] = None) -> Optional[Dict]:
+    """
+    找出退休首月實質可支配所得 ≥ target_monthly_income 的最早退休年齡。
+    所有候選年齡以一次廣播模擬求值；無任何年齡達標時回傳 None。
+    提供 pension_for_ages 時，每個候選年齡使用各自的退休金月領金額 (同 run_sensitivity_grid)。
+    """
+    end_age = projection_inputs.get('end_age', PROJECTION_END_AGE)
+    candidates = np.arange(projection_inputs['current_age'] + 1, min(max_age or end_age, end_age) + 1)
+    if candidates.size == 0:
+        return None
+    income = _first_month_real_income(projection_inputs, retirement_age=candidates,
+                                      **_pensions_for_ages(pension_for_ages, candidates))
+    met = income >= target_monthly_income
+    if not met.any():
+        return None
+    first = int(np.argmax(met))
+    return {"retirement_age": int(candidates[first]), "monthly_income_real": float(income[first])}
+
+
+# --- [v5.5.0 新增] 歷史報酬序列回測 ---
+# 回測只重播到退休後此年數 (且不超過歷史長度)，確保每個視窗都是實際發生過的連續年報酬
+HISTORICAL_RETIREMENT_YEARS = 10
+
+
+def historical_return_windows(annual_returns: Sequence[float], n_years: int) -> np.ndarray:
+    """
+    由歷史年報酬序列取出所有連續 n_years 年的滾動視窗 (形狀: 視窗數 × n_years)。
+    歷史長度不足 n_years 時拋出 ValueError (不以循環方式拼接不存在的報酬序列)。
+    """
+    returns = np.asarray(annual_returns, dtype=float)
+    n_history = returns.size
+    if n_history < n_years:
+        raise ValueError(f"歷史報酬僅 {n_history} 年，不足 {n_years} 年的回測期間")
+    idx = np.arange(n_history - n_years + 1)[:, None] + np.arange(n_years)[None, :]
+    return returns[idx]
+
+
+def run_historical_backtest(projection_inputs: Dict, years: Sequence[int], annual_returns: Sequence[float],
+                            return_adjustment: float = 0.0) -> Dict:
+    """
+    以實際歷史年報酬重播使用者的計畫：每個起始年度一條路徑，所有視窗一次向量化計算。
+
+    回測期間為目前年齡至「退休後 HISTORICAL_RETIREMENT_YEARS 年」(不超過 end_age)，並縮短至歷史長度以內，
+    讓每條路徑都是實際發生過的連續年報酬；歷史長度不足以涵蓋到退休首年時不執行回測。
+
+    Args:
+        projection_inputs: run_projection 的參數 (需為單一情境的純量)
+        years / annual_returns: 歷史年度與對應的年報酬率 (小數)
+        return_adjustment: 加到每年報酬率上的調整 (例如價格指數未含的股息率)
+
+    Returns:
+        dict: windows (每個起始年度的摘要 DataFrame，依退休時實質資產排序)，
+              worst / median / best (起始年度)，age 與 assets_real_paths (各起始年度的實質資產路徑)，
+              horizon_end_age (回測期末年齡)；歷史不足時回傳 {"insufficient_history": True, "history_years", "required_years"}
+    """
+    current_age = projection_inputs['current_age']
+    retirement_age = projection_inputs['retirement_age']
+    end_age = projection_inputs.get('end_age', PROJECTION_END_AGE)
+    n_history = len(annual_returns)
+    required_years = max(retirement_age - current_age, 0) + 1
+    if n_history < required_years:
+        return {"insufficient_history": True, "history_years": n_history, "required_years": required_years}
+
+    n_years = min(end_age - current_age + 1, required_years + HISTORICAL_RETIREMENT_YEARS, n_history)
+    horizon_end_age = current_age + n_years - 1
+    inputs = {**projection_inputs, "end_age": horizon_end_age}
+    for key in ("annual_debt_payment", "year_end_liabilities"):
+        if inputs.get(key) is not None:
+            inputs[key] = np.asarray(inputs[key], dtype=float)[:n_years]
+
+    paths = historical_return_windows(annual_returns, n_years) + return_adjustment
+    start_years = np.asarray(years, dtype=int)[:paths.shape[0]]
+    result = run_projection(**inputs, return_path=paths, value_keys=["year_end_assets", "disposable_income"])
+    summary = summarize_at_retirement(result, current_age, retirement_age)
+
+    windows = pd.DataFrame({
+        "start_year": start_years,
+        "assets_at_retirement_real_value": summary["assets_at_retirement_real_value"],
+        "first_month_disposable_income_real_value": summary["first_month_disposable_income_real_value"],
+        "final_assets_real_value": result["year_end_assets_real_value"][:, -1],
+        "annualized_return": np.prod(1 + paths, axis=1) ** (1 / n_years) - 1,
+    }).sort_values("assets_at_retirement_real_value").reset_index(drop=True)
+
+    return {
+        "windows": windows,
+        "worst": int(windows["start_year"].iloc[0]),
+        "median": int(windows["start_year"].iloc[len(windows) // 2]),
+        "best": int(windows["start_year"].iloc[-1]),
+        "age": result["age"],
+        "assets_real_paths": dict(zip(start_years.tolist(), result["year_end_assets_real_value"])),
+        "horizon_end_age": horizon_end_age,
+    }
+
+
+# --- [v5.5.0 新增] 月解析度現金流引擎 ---
+
+MONTHLY_EVENT_LABELS = {
+    "loan_start": "貸款開始", "grace_end": "寬限期結束", "loan_end": "貸款結清",
+    "retirement": "退休", "labor_pension_claim": "勞退請領 (60 歲)",
+    "labor_insurance_claim": "勞保年金請領", "expense": "一次性支出",
+}
+# 人生里程碑事件：若已發生 (月份為負) 仍視為自第 0 個月起生效
+_MILESTONE_EVENTS = ("retirement", "labor_pension_claim", "labor_insurance_claim")
+
+
+def build_event_queue(current_age: int, retirement_month: int, legal_age: int, n_months: int,
+                      loan_events: Optional[List[Dict]] = None, one_off_expenses: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    建立依月份排序的事件佇列 (以 heapq 依 month_offset 排序，同月份依加入順序)。
+
+    Args:
+        retirement_month: 退休月份 (相對於本月的月數)
+        loan_events: build_monthly_debt_series 回傳的 loan_events
+        one_off_expenses: [{"month_offset", "name", "amount"}, ...] 一次性支出 (例如購車、學費)
+
+    Returns:
+        list[dict]: 每筆事件含 month_offset, type, label, amount；超出模擬期間的事件不列入
+    """
+    heap = []
+
+    def push(offset: int, event_type: str, label: str = "", amount: float = 0.0):
+        if event_type in _MILESTONE_EVENTS:
+            offset = max(offset, 0)
+        if 0 <= offset < n_months:
+            heapq.heappush(heap, (int(offset), len(heap), {
+                "month_offset": int(offset), "type": event_type,
+                "label": label or MONTHLY_EVENT_LABELS[event_type], "amount": float(amount),
+            }))
+
+    push(retirement_month, "retirement")
+    push((PENSION_CLAIM_AGE - current_age) * 12, "labor_pension_claim")
+    push((legal_age - current_age) * 12, "labor_insurance_claim")
+    for event in loan_events or []:
+        push(event["month_offset"], event["type"], f"{MONTHLY_EVENT_LABELS[event['type']]}：{event.get('label', '')}")
+    for expense in one_off_expenses or []:
+        push(expense["month_offset"], "expense", expense.get("name") or MONTHLY_EVENT_LABELS["expense"], expense.get("amount", 0.0))
+    return [heapq.heappop(heap)[2] for _ in range(len(heap))]
+
+
+def run_monthly_projection(current_assets: float, current_age: int, events: List[Dict], return_rate: float,
+                           dividend_yield: float, withdrawal_rate: float, inflation_rate: float,
+                           annual_investment: float, labor_pension_monthly: float, total_pension_monthly: float,
+                           monthly_debt_payment: Optional[np.ndarray] = None, monthly_liabilities: Optional[np.ndarray] = None,
+                           end_age: int = PROJECTION_END_AGE) -> Dict[str, np.ndarray]:
+    """
+    以月為單位執行整合性財務模擬 (約 800 個月)，狀態切換點由事件佇列決定。
+
+    事件只在各自的月份把對應的狀態 (退休、勞退/勞保開始請領) 切換為生效，
+    一次性支出於當月月底自資產扣除；其餘全部為整段陣列運算。
+    年化比率 (小數) 會換算為等效月報酬率與月通膨率。
+
+    Returns:
+        dict: 欄式結果，每個欄位長度為月數；含 month_offset, age, phase 與各項名目/實質金額
+    """
+    n_months = (end_age - current_age + 1) * 12
+    months = np.arange(n_months)
+
+    def first_month(event_type: str) -> int:
+        return next((e["month_offset"] for e in events if e["type"] == event_type), n_months)
+
+    is_accumulation = months < first_month("retirement")
+    labor_claimed = months >= first_month("labor_pension_claim")
+    insurance_claimed = months >= first_month("labor_insurance_claim")
+    expense_offsets = [e["month_offset"] for e in events if e["type"] == "expense"]
+    one_off_expense = np.bincount(np.asarray(expense_offsets, dtype=int),
+                                  weights=[e["amount"] for e in events if e["type"] == "expense"], minlength=n_months)
+
+    monthly_return = (1 + return_rate) ** (1 / 12) - 1
+    debt_payment = np.zeros(n_months) if monthly_debt_payment is None else np.asarray(monthly_debt_payment, dtype=float)[:n_months]
+    liabilities = np.zeros(n_months) if monthly_liabilities is None else np.asarray(monthly_liabilities, dtype=float)[:n_months]
+
+    # 1. 資產演進：累積期 A*(1+r) + 月投資；提領期 A*(1+r-w/12)；一次性支出於月底扣除
+    growth = np.where(is_accumulation, 1 + monthly_return, 1 + monthly_return - withdrawal_rate / 12)
+    contribution = np.where(is_accumulation, annual_investment / 12, 0.0) - one_off_expense
+    assets = _compound_assets(float(current_assets), growth, contribution)
+    start_assets = np.concatenate([[float(current_assets)], assets[:-1]])
+
+    # 2. 收入與支出
+    asset_income = np.where(is_accumulation, 0.0, start_assets * (dividend_yield + withdrawal_rate) / 12)
+    pension_by_month = np.where(insurance_claimed, total_pension_monthly, np.where(labor_claimed, labor_pension_monthly, 0.0))
+    pension_income = np.where(is_accumulation, 0.0, pension_by_month)
+    total_income = asset_income + pension_income
+    disposable_income = np.where(is_accumulation, -debt_payment, total_income - debt_payment)
+
+    # 3. 通膨折現
+    inflation_divisor = (1 + inflation_rate) ** ((months + 1) / 12)
+
+    result = {
+        "month_offset": months,
+        "age": current_age + months / 12,
+        "phase": np.where(is_accumulation, "accumulation", "decumulation"),
+        "debt_payment_nominal": debt_payment,
+        "one_off_expense_nominal": one_off_expense,
+    }
+    for key, value in [("assets", assets), ("liabilities", liabilities), ("asset_income", asset_income),
+                       ("pension_income", pension_income), ("total_income", total_income),
+                       ("disposable_income", disposable_income)]:
+        result[f"{key}_nominal"] = value
+        result[f"{key}_real_value"] = value / inflation_divisor
+    return result
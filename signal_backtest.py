@@ -0,0 +1,174 @@
+# signal_backtest.py (v5.5.0)
+# J值+VIX 擇時訊號的向量化回測：以「日期 × 市場」的價格表一次計算所有市場、所有交易日的訊號與前瞻報酬。
+# KDJ 參數與 backend/scraper-function/indicators.py 一致 (9 期高低點、com=2 平滑)，每日 J 值為「截至當日」的當期暫時值，
+# 與每日排程模型當天看到的數值相同。
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Sequence
+
+KDJ_WINDOW = 9
+KDJ_COM = 2
+KDJ_ALPHA = 1 / (1 + KDJ_COM)
+
+# 訊號名稱 -> (重取樣週期, 週期代碼)，對應 run_j_vix_model 的兩種訊號
+SIGNAL_TIMEFRAMES = {"mid_term_pullback": ("W-FRI", "W-FRI"), "inventory_cycle": ("ME", "M")}
+DEFAULT_HORIZONS_MONTHS = (1, 3, 6, 12)
+
+
+def _period_labels(index: pd.DatetimeIndex, period_code: str) -> pd.DatetimeIndex:
+    """每個交易日所屬週期的標籤 (週五或月底)，與 resample 的標籤相同。"""
+    return index.to_period(period_code).end_time.normalize()
+
+
+def daily_kdj_j(high: pd.DataFrame, low: pd.DataFrame, close: pd.DataFrame, time_period: str, period_code: str) -> pd.DataFrame:
+    """
+    計算每個交易日「截至當日」的 J 值 (日期 × 市場)。
+
+    已收盤週期的 K、D 以全量方式計算 (逐欄 EWM)，當期則以期初至當日的最高/最低價與前 KDJ_WINDOW-1 期的高低點
+    求 RSV，再由前一期的 K、D 遞推；各週期最後一個交易日的結果即等於週期收盤後的 J 值。
+    """
+    high_p = high.resample(time_period).max()
+    low_p = low.resample(time_period).min()
+    close_p = close.resample(time_period).last()
+
+    # 週期層級的 K、D (同 calculate_kdj_frame：略過缺值週期)
+    rsv_p = (close_p - low_p.rolling(KDJ_WINDOW, min_periods=1).min()) / (high_p.rolling(KDJ_WINDOW, min_periods=1).max() - low_p.rolling(KDJ_WINDOW, min_periods=1).min()) * 100
+    valid_p = rsv_p.notna()
+    k_p = rsv_p.ewm(com=KDJ_COM, adjust=False, ignore_na=True).mean().where(valid_p)
+    d_p = k_p.ewm(com=KDJ_COM, adjust=False, ignore_na=True).mean().where(valid_p)
+
+    # 前一期 (最近一個有效週期) 的 K、D 與前 KDJ_WINDOW-1 期的高低點，對應到每個交易日
+    labels = _period_labels(close.index, period_code)
+    prev_k = k_p.ffill().shift(1).reindex(labels).to_numpy()
+    prev_d = d_p.ffill().shift(1).reindex(labels).to_numpy()
+    prev_high = high_p.rolling(KDJ_WINDOW - 1, min_periods=1).max().shift(1).reindex(labels).to_numpy()
+    prev_low = low_p.rolling(KDJ_WINDOW - 1, min_periods=1).min().shift(1).reindex(labels).to_numpy()
+
+    # 當期期初至當日的最高/最低價
+    group = pd.Series(labels, index=close.index)
+    to_date_high = high.groupby(group).cummax().to_numpy()
+    to_date_low = low.groupby(group).cummin().to_numpy()
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        highest = np.fmax(prev_high, to_date_high)
+        lowest = np.fmin(prev_low, to_date_low)
+        rsv = (close.to_numpy() - lowest) / (highest - lowest) * 100
+        k = np.where(np.isnan(prev_k), rsv, (1 - KDJ_ALPHA) * prev_k + KDJ_ALPHA * rsv)
+        d = np.where(np.isnan(prev_d), k, (1 - KDJ_ALPHA) * prev_d + KDJ_ALPHA * k)
+    return pd.DataFrame(3 * k - 2 * d, index=close.index, columns=close.columns)
+
+
+def forward_returns(close: pd.DataFrame, horizons_months: Sequence[int] = DEFAULT_HORIZONS_MONTHS) -> np.ndarray:
+    """
+    每個交易日往後 N 個月的報酬 (形狀: 期數 × 日期 × 市場)；以目標日 (含) 之前最後一個收盤價計算，
+    超出資料範圍的部分為 NaN。
+    """
+    filled = close.ffill().to_numpy()
+    index = close.index
+    out = np.full((len(horizons_months),) + filled.shape, np.nan)
+    for h, months in enumerate(horizons_months):
+        targets = index + pd.DateOffset(months=months)
+        pos = index.searchsorted(targets, side='right') - 1
+        inside = targets <= index[-1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[h, inside] = filled[pos[inside]] / filled[inside] - 1
+    return out
+
+
+def prepare_signal_inputs(prices: pd.DataFrame, market_tickers: Dict[str, str], vix_ticker: str = "^VIX") -> Dict:
+    """
+    由 (欄位, ticker) 格式的日線價格表準備回測所需的陣列：各市場每日 J 值 (週/月)、VIX 與收盤價。
+    市場休市日的收盤價為 NaN，該日不產生訊號。
+    """
+    tickers = list(market_tickers.values())
+    high, low, close = (prices[field].reindex(columns=tickers) for field in ("High", "Low", "Close"))
+    j_values = {name: daily_kdj_j(high, low, close, time_period, period_code).to_numpy()
+                for name, (time_period, period_code) in SIGNAL_TIMEFRAMES.items()}
+    vix = prices["Close"][vix_ticker].ffill().to_numpy()
+    return {"index": close.index, "markets": list(market_tickers), "close": close, "j": j_values, "vix": vix}
+
+
+def _signal_mask(j: np.ndarray, vix: np.ndarray, j_threshold, vix_threshold, episodes_only: bool) -> np.ndarray:
+    """
+    J < j_threshold 且 VIX > vix_threshold 的進場訊號；門檻可為陣列 (前置維度會廣播)。
+    episodes_only=True 時只保留連續訊號區段的第一天，避免同一波段重複計算。
+    """
+    j_threshold = np.asarray(j_threshold, dtype=float)[..., None, None]
+    vix_threshold = np.asarray(vix_threshold, dtype=float)[..., None, None]
+    with np.errstate(invalid='ignore'):
+        signal = (j < j_threshold) & (vix[:, None] > vix_threshold)
+    if episodes_only:
+        previous = np.zeros_like(signal)
+        previous[..., 1:, :] = signal[..., :-1, :]
+        signal &= ~previous
+    return signal
+
+
+def _summarize(signal: np.ndarray, fwd: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    依訊號遮罩彙總前瞻報酬 (沿日期軸)：訊號數、平均報酬、勝率與同期全部交易日的平均報酬 (基準)。
+    signal: (... × 日期 × 市場)，fwd: (日期 × 市場)。
+    """
+    valid = ~np.isnan(fwd)
+    hits = signal & valid
+    n = hits.sum(axis=-2)
+    returns = np.where(hits, fwd, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = returns.sum(axis=-2) / n
+        win_rate = (hits & (fwd > 0)).sum(axis=-2) / n
+        baseline = np.where(valid, fwd, 0.0).sum(axis=-2) / valid.sum(axis=-2)
+    return {"n_signals": n, "mean_return": mean, "win_rate": win_rate, "baseline_return": baseline}
+
+
+def run_jvix_backtest(inputs: Dict, j_threshold: float = 20, vix_threshold: float = 25,
+                      horizons_months: Sequence[int] = DEFAULT_HORIZONS_MONTHS, episodes_only: bool = True) -> Dict:
+    """
+    以單一組門檻回測所有市場、兩種訊號在完整歷史上的表現。
+
+    Args:
+        inputs: prepare_signal_inputs 的結果
+        j_threshold / vix_threshold: 進場條件 J < j_threshold 且 VIX > vix_threshold
+        horizons_months: 前瞻報酬的期間 (月)
+        episodes_only: 只計算每段連續訊號的第一天
+
+    Returns:
+        dict: summary (市場 × 訊號 × 期間 的統計 DataFrame)，events (每筆訊號的日期、J、VIX 與各期間前瞻報酬)
+    """
+    fwd = forward_returns(inputs["close"], horizons_months)
+    index, markets, vix = inputs["index"], inputs["markets"], inputs["vix"]
+    summary_rows, events = [], []
+    for signal_name, j in inputs["j"].items():
+        signal = _signal_mask(j, vix, j_threshold, vix_threshold, episodes_only)
+        stats = _summarize(signal[None], fwd)  # (期間 × 市場)
+        for h, months in enumerate(horizons_months):
+            for m, market in enumerate(markets):
+                summary_rows.append({"market": market, "signal": signal_name, "horizon_months": months,
+                                     **{key: value[h, m] for key, value in stats.items()}})
+        day_idx, market_idx = np.nonzero(signal)
+        events.append(pd.DataFrame({
+            "date": index[day_idx], "market": np.asarray(markets)[market_idx], "signal": signal_name,
+            "J": j[day_idx, market_idx], "VIX": vix[day_idx],
+            **{f"return_{months}m": fwd[h, day_idx, market_idx] for h, months in enumerate(horizons_months)},
+        }))
+    events = pd.concat(events, ignore_index=True).sort_values("date", ignore_index=True)
+    return {"summary": pd.DataFrame(summary_rows), "events": events,
+            "start": index[0], "end": index[-1], "horizons_months": list(horizons_months)}
+
+
+def run_jvix_threshold_grid(inputs: Dict, j_thresholds: Sequence[float], vix_thresholds: Sequence[float],
+                            horizon_months: int = 3, signal_name: str = "mid_term_pullback",
+                            episodes_only: bool = True) -> Dict:
+    """
+    一次掃描所有 (J 門檻, VIX 門檻) 組合：訊號遮罩形狀為 (J 門檻 × VIX 門檻 × 日期 × 市場)，統計沿日期軸彙總。
+
+    Returns:
+        dict: j_thresholds, vix_thresholds, markets，以及 n_signals / mean_return / win_rate
+              (形狀: J 門檻 × VIX 門檻 × 市場) 與 baseline_return (各市場)
+    """
+    j_thresholds = np.asarray(j_thresholds, dtype=float)
+    vix_thresholds = np.asarray(vix_thresholds, dtype=float)
+    fwd = forward_returns(inputs["close"], [horizon_months])[0]
+    signal = _signal_mask(inputs["j"][signal_name], inputs["vix"], j_thresholds[:, None], vix_thresholds[None, :], episodes_only)
+    return {"j_thresholds": j_thresholds, "vix_thresholds": vix_thresholds, "markets": inputs["markets"],
+            "horizon_months": horizon_months, "signal": signal_name, **_summarize(signal, fwd)}
@@ -15,8 +15,21 @@ import logging
 import sys
 import numpy_financial as npf
 import pytz 
+import hashlib
+import base64
+from collections import OrderedDict
 from typing import Dict, List, Tuple, Optional
 from config import APP_VERSION # <--- 從 config.py 引用
+from loan_schedule import (
+    liabilities_to_arrays, outstanding_balances, build_yearly_debt_summary,
+    normalize_rate_segments, segmented_loan_state, build_monthly_debt_series
+)
+from projection_engine import (
+    align_debt_by_age, run_projection, summarize_at_retirement, run_monte_carlo,
+    run_sensitivity_grid, solve_required_investment, solve_earliest_retirement_age,
+    run_historical_backtest, build_event_queue, run_monthly_projection, PROJECTION_END_AGE
+)
+from signal_backtest import prepare_signal_inputs, run_jvix_backtest, run_jvix_threshold_grid
 
 
 # 設定日誌系統
@@ -401,47 +414,50 @@ def calculate_asset_metrics(assets_df: pd.DataFrame) -> pd.DataFrame:
 
 def calculate_current_debt_snapshot(liabilities_df: pd.DataFrame) -> Dict:
     """
-    接收使用者所有的債務資料，為每一筆貸款從「起始日」模擬到「今天」，
-    計算出截至今日最精確的剩餘本金與月付金。
+    接收使用者所有的債務資料，為每一筆貸款計算出截至今日最精確的剩餘本金與月付金。
+    剩餘本金以 loan_schedule 的封閉解一次算出，不再逐月模擬。
     回傳一個 {doc_id: {"balance": new_balance, "payments": new_payments}} 的字典。
     """
     if liabilities_df.empty:
         return {}
 
-    updated_data = {}
     today = pd.to_datetime(datetime.now())
 
-    for _, loan in liabilities_df.iterrows():
-        principal = loan['total_amount']
-        annual_rate = loan['interest_rate']
-        years = loan['loan_period_years']
-        grace_period_years = loan['grace_period_years']
-        
-        # 重新計算月付金
-        new_payments = calculate_loan_payments(principal, annual_rate, years, grace_period_years)
+    # 重新計算月付金
+    payments = [
+        calculate_loan_payments(loan['total_amount'], loan['interest_rate'], loan['loan_period_years'], loan['grace_period_years'])
+        for _, loan in liabilities_df.iterrows()
+    ]
+    arrays = liabilities_to_arrays(liabilities_df)
+    regular_payments = np.array([p['regular_payment'] for p in payments], dtype=float)
+
+    # 從起始日到今天經過的月數，一次算出所有貸款的剩餘本金
+    months_passed = (today.year * 12 + today.month - 1) - arrays['start_month_index']
+    balances = outstanding_balances(
+        arrays['principal'], arrays['annual_rate'], arrays['total_months'],
+        arrays['grace_months'], regular_payments, months_passed
+    )
 
-        # 模擬歷史攤銷
-        start_date = pd.to_datetime(loan['start_date'])
-        months_passed = (today.year - start_date.year) * 12 + (today.month - start_date.month)
-        
-        for i in range(min(months_passed, years * 12)):
-            current_date = start_date + pd.DateOffset(months=i)
-            is_in_grace_period = (current_date < start_date + pd.DateOffset(years=grace_period_years))
-            
-            interest_payment = principal * (annual_rate / 100 / 12)
-            
-            if is_in_grace_period:
-                principal_payment = 0
-            else:
-                principal_payment = new_payments['regular_payment'] - interest_payment
-            
-            principal -= principal_payment
-        
-        updated_data[loan['doc_id']] = {
-            "outstanding_balance": max(0, principal),
+    updated_data = {}
+    for i, (doc_id, balance, new_payments) in enumerate(zip(liabilities_df['doc_id'], balances, payments)):
+        updated_data[doc_id] = {
+            "outstanding_balance": float(balance),
             "monthly_payment": new_payments['regular_payment'],
             "grace_period_payment_val": new_payments['grace_period_payment']
         }
+
+        # [v5.5.0] 機動利率貸款：依利率歷史分段重新攤還
+        rate_history = liabilities_df['rate_history'].iloc[i] if 'rate_history' in liabilities_df.columns else None
+        if isinstance(rate_history, list) and rate_history:
+            loan = liabilities_df.iloc[i]
+            segments = normalize_rate_segments(loan['start_date'], rate_history, loan['interest_rate'])
+            state = segmented_loan_state(arrays['principal'][i], segments, arrays['total_months'][i], arrays['grace_months'][i], months_passed[i])
+            updated_data[doc_id] = {
+                "outstanding_balance": state['outstanding_balance'],
+                "monthly_payment": state['regular_payment'],
+                "grace_period_payment_val": state['grace_period_payment'],
+                "interest_rate": state['current_rate']
+            }
         
     return updated_data
 
@@ -462,25 +478,29 @@ def recalculate_single_loan(loan_data: dict) -> dict:
     # 1. 根據最新參數，重新計算月付金
     new_payments = calculate_loan_payments(principal, annual_rate, years, grace_period_years)
 
-    # 2. 模擬歷史攤銷，計算最新剩餘本金
+    # 2. 以封閉解計算至今日的剩餘本金
     months_passed = (today.year - start_date.year) * 12 + (today.month - start_date.month)
-    
-    for i in range(min(months_passed, years * 12)):
-        current_date = start_date + pd.DateOffset(months=i)
-        is_in_grace_period = (current_date < start_date + pd.DateOffset(years=grace_period_years))
-        
-        interest_payment = principal * (annual_rate / 100 / 12)
-        
-        if is_in_grace_period:
-            principal_payment = 0
-        else:
-            principal_payment = new_payments['regular_payment'] - interest_payment
-        
-        principal -= principal_payment
+
+    # [v5.5.0] 有利率歷史時，改為依利率分段逐段重新攤還，並以最新利率作為目前利率
+    rate_history = loan_data.get('rate_history')
+    if isinstance(rate_history, list) and rate_history:
+        segments = normalize_rate_segments(start_date, rate_history, annual_rate)
+        state = segmented_loan_state(principal, segments, years * 12, grace_period_years * 12, months_passed)
+        return {
+            "outstanding_balance": state['outstanding_balance'],
+            "monthly_payment": state['regular_payment'],
+            "grace_period_payment_val": state['grace_period_payment'],
+            "interest_rate": state['current_rate']
+        }
+
+    balance = outstanding_balances(
+        principal, annual_rate, years * 12, grace_period_years * 12,
+        new_payments['regular_payment'], months_passed
+    )
     
     # 3. 回傳包含所有最新計算值的字典
     return {
-        "outstanding_balance": max(0, principal),
+        "outstanding_balance": float(balance),
         "monthly_payment": new_payments['regular_payment'],
         "grace_period_payment_val": new_payments['grace_period_payment']
     }
@@ -513,7 +533,7 @@ def calculate_loan_payments(principal, annual_rate, years, grace_period_years=0)
     }
 
 # --- [v4.1] 退休金計算引擎的包裝函數 ---
-def get_full_retirement_analysis(user_inputs: Dict) -> Dict:
+def get_full_retirement_analysis(user_inputs: Dict, include_details: bool = False) -> Dict:
 
     calculator = RetirementCalculator()
 
@@ -540,7 +560,7 @@ def get_full_retirement_analysis(user_inputs: Dict) -> Dict:
     }
 
     # 執行計算
-    labor_pension_result = calculator.calculate_labor_pension_accurate(**pension_params, verbose=False)
+    labor_pension_result = calculator.calculate_labor_pension_accurate(**pension_params, verbose=False, include_details=include_details)
     labor_insurance_result = calculator.calculate_labor_insurance_pension(**insurance_params, verbose=False)
 
     # 整合結果用於替代率分析
@@ -566,15 +586,151 @@ def get_full_retirement_analysis(user_inputs: Dict) -> Dict:
             "analysis": replacement_ratio_result
         },
         "sensitivity_analysis": sensitivity_result,
-        "validation_errors": labor_pension_result.get('validation_errors', [])
+        "validation_errors": labor_pension_result.get('validation_errors', []),
+        # [v5.5.0 新增] 記錄輸入雜湊與年金表版本，供後續比對是否可重用
+        "input_hash": retirement_analysis_hash(user_inputs),
+        "table_version": calculator.annuity_data_publish_date,
+        # 是否已建立逐年提繳明細 (明細可能因退休前年數為 0 而合法地為空)
+        "has_details": include_details
     }
 
     return final_results
 
-def get_holistic_financial_projection(user_id: str) -> Dict:
 
+# --- [v5.5.0 新增] 退休分析結果的輸入雜湊快取 ---
+# 影響 get_full_retirement_analysis 結果的輸入欄位 (與其預設值)
+RETIREMENT_ANALYSIS_INPUTS = {
+    'current_pension_principal': 0, 'avg_monthly_salary': 0, 'self_contribution_rate': 0,
+    'years_to_retirement': 0, 'expected_return_rate': 4.0, 'retirement_age': 60,
+    'pension_contributed_years': 0, 'salary_growth_rate': 2.0, 'insurance_seniority': 0,
+    'birth_year': 1990,
+}
+RETIREMENT_ANALYSIS_CACHE_SIZE = 64
+_retirement_analysis_cache: "OrderedDict[str, Dict]" = OrderedDict()
+
+
+def retirement_analysis_hash(user_inputs: Dict) -> str:
+    """
+    以影響退休分析的輸入欄位與年金/生命表版本 (annuity_data_publish_date) 計算穩定的雜湊值。
+    其他與退休金無關的欄位 (例如現金流模擬的報酬率假設) 不影響雜湊。
+    """
+    params = {}
+    for key, default in RETIREMENT_ANALYSIS_INPUTS.items():
+        value = user_inputs.get(key, default)
+        params[key] = float(value) if value is not None else None
+    params['table_version'] = RetirementCalculator().annuity_data_publish_date
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]
+
+
+def get_retirement_analysis(user_inputs: Dict, stored_results: Optional[Dict] = None,
+                            include_details: bool = False) -> Dict:
+    """
+    取得退休分析結果：雜湊相符時依序重用記憶體快取或已儲存的結果 (pension_analysis_results)，
+    雜湊不符時才重新呼叫 get_full_retirement_analysis。
+    """
+    input_hash = retirement_analysis_hash(user_inputs)
+
+    def usable(results) -> bool:
+        if not isinstance(results, dict) or results.get('input_hash') != input_hash:
+            return False
+        # 依是否曾要求建立明細判斷，而非明細是否為空；舊版結果沒有 has_details 時以明細是否存在判斷
+        return (not include_details or results.get('has_details', False)
+                or bool(results.get('labor_pension', {}).get('contribution_details')))
+
+    results = _retirement_analysis_cache.get(input_hash)
+    if not usable(results):
+        results = stored_results if usable(stored_results) else get_full_retirement_analysis(user_inputs, include_details=include_details)
+
+    _retirement_analysis_cache[input_hash] = results
+    _retirement_analysis_cache.move_to_end(input_hash)
+    while len(_retirement_analysis_cache) > RETIREMENT_ANALYSIS_CACHE_SIZE:
+        _retirement_analysis_cache.popitem(last=False)
+    return results
+
+def get_batch_retirement_analysis(plans_df: pd.DataFrame, calculator: Optional["RetirementCalculator"] = None) -> pd.DataFrame:
+    """
+    [v5.5.0 新增] 批次退休分析：一次計算多位使用者或多組情境的勞退、勞保與所得替代率。
+
+    Args:
+        plans_df: 欄式表格，每列一位使用者/情境，欄位同 retirement_plan
+                  (缺少的欄位使用 RETIREMENT_ANALYSIS_INPUTS 的預設值)
+
+    Returns:
+        pd.DataFrame: 與 plans_df 同索引，欄位 labor_pension_monthly, labor_pension_lump_sum,
+                      can_monthly_payment, labor_insurance_monthly, legal_age, total_monthly_pension, replacement_ratio
+    """
+    calculator = calculator or RetirementCalculator()
+
+    def column(key):
+        values = plans_df[key] if key in plans_df.columns else pd.Series(RETIREMENT_ANALYSIS_INPUTS[key], index=plans_df.index)
+        return values.fillna(RETIREMENT_ANALYSIS_INPUTS[key]).to_numpy(dtype=float)
+
+    salary = column('avg_monthly_salary')
+    years = column('years_to_retirement')
+    employee_rate = column('self_contribution_rate')
+    contributed_years = column('pension_contributed_years')
+    retirement_age = column('retirement_age')
+
+    pension = calculator.calculate_labor_pension_batch(
+        column('current_pension_principal'), salary, 6.0 + employee_rate, years.astype(int),
+        column('expected_return_rate'), retirement_age, contributed_years, column('salary_growth_rate')
+    )
+    # 與 calculate_labor_pension_accurate 的輸入驗證一致：不合法的列結果為 0
+    valid = (salary > 0) & (years >= 0) & (employee_rate >= 0) & (employee_rate <= 6.0) & (contributed_years >= 0)
+    insurance = calculator.calculate_labor_insurance_batch(
+        salary, column('insurance_seniority'), retirement_age, column('birth_year')
+    )
+
+    labor_pension_monthly = np.where(valid, pension['monthly_pension'], 0.0)
+    total_monthly_pension = labor_pension_monthly + insurance['monthly_pension']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        replacement_ratio = np.where(salary > 0, total_monthly_pension / salary * 100, np.nan)
+
+    return pd.DataFrame({
+        "labor_pension_monthly": labor_pension_monthly,
+        "labor_pension_lump_sum": np.where(valid, pension['lump_sum'], 0.0),
+        "can_monthly_payment": valid & pension['can_monthly_payment'],
+        "labor_insurance_monthly": insurance['monthly_pension'],
+        "legal_age": insurance['legal_age'],
+        "total_monthly_pension": total_monthly_pension,
+        "replacement_ratio": replacement_ratio,
+        "table_version": calculator.annuity_data_publish_date,
+    }, index=plans_df.index)
+
+
+def pensions_by_retirement_age(plan: Dict, current_age: int, planned_retirement_age: int, ages) -> Dict[str, np.ndarray]:
+    """
+    [v5.5.0 新增] 依候選退休年齡重算勞退與勞退 + 勞保月領金額 (以 get_batch_retirement_analysis 一次算完)。
+    提早或延後退休時，勞退提繳年數與勞保年資隨之增減，勞保延後加給依請領年齡計算。
+
+    Returns:
+        dict: labor_pension_monthly, total_pension_monthly (形狀與 ages 相同)
+    """
+    ages = np.asarray(ages, dtype=int)
+    shift = ages - planned_retirement_age
+    base = {key: plan.get(key) if plan.get(key) is not None else default for key, default in RETIREMENT_ANALYSIS_INPUTS.items()}
+    plans_df = pd.DataFrame({
+        **base,
+        'retirement_age': ages,
+        'years_to_retirement': np.maximum(ages - current_age, 0),
+        'insurance_seniority': np.maximum(float(base['insurance_seniority']) + shift, 0),
+        'pension_contributed_years': np.maximum(float(base['pension_contributed_years']) + shift, 0),
+    }, index=np.arange(ages.size))
+    analysis = get_batch_retirement_analysis(plans_df)
+    return {
+        "labor_pension_monthly": analysis['labor_pension_monthly'].to_numpy(),
+        "total_pension_monthly": analysis['total_monthly_pension'].to_numpy(),
+    }
+
+
+def load_projection_inputs(user_id: str) -> Dict:
+    """
+    [v5.5.0 新增] 讀取使用者的資產、負債與退休規劃，整理成 run_projection 所需的參數。
+    確定性模擬、蒙地卡羅模擬等皆共用這份輸入。
+    """
     # 1. 初始化 (維持不變)
-    plan = load_retirement_plan(user_id)
+    plan, stored_pension_results = load_pension_data(user_id)
     raw_assets_df = load_user_assets_from_firestore(user_id)
     liabilities_df = load_user_liabilities(user_id)
 
@@ -595,164 +751,188 @@ def get_holistic_financial_projection(user_id: str) -> Dict:
     retirement_age = plan.get('retirement_age', 65)
     # --- [修正結束] ---
  
-     # 取得退休金預估
-    pension_results = get_full_retirement_analysis(plan)
+     # 取得退休金預估 ([v5.5.0] 輸入雜湊相符時重用已儲存的分析結果)
+    pension_results = get_retirement_analysis(plan, stored_pension_results)
     legal_age = pension_results.get('labor_insurance', {}).get('legal_age', 65)
 
-    # 初始負債狀態
-    # [v5.0.0 修正] 我們需要保留完整的 liabilities_df 以便逐筆計算
-    current_liabilities_df = liabilities_df.copy()
-
-    # --- [v5.0.0 最終修正] ---
-    # 1. 預先計算好所有負債的完整逐年攤銷表
-    yearly_debt_summary = pd.DataFrame()
-    if not liabilities_df.empty:
-        all_yearly_schedules = []
-        for _, loan in liabilities_df.iterrows():
-            schedule = []
-            principal = loan['total_amount']
-            monthly_rate = loan['interest_rate'] / 100 / 12
-            start_date = pd.to_datetime(loan['start_date'])
-            total_months = loan['loan_period_years'] * 12
-
-            for i in range(total_months):
-                current_date = start_date + pd.DateOffset(months=i)
-                is_in_grace_period = (current_date < start_date + pd.DateOffset(years=loan['grace_period_years']))
-                
-                interest_payment = principal * monthly_rate
-                
-                if is_in_grace_period:
-                    principal_payment = 0
-                    total_payment = loan.get('grace_period_payment_val', interest_payment)
-                else:
-                    total_payment = loan['monthly_payment']
-                    principal_payment = total_payment - interest_payment
-                
-                principal -= principal_payment
-                
-                schedule.append({
-                    "year": current_date.year,
-                    "total_payment": total_payment,
-                    "ending_balance": max(0, principal)
-                })
-            
-            loan_schedule_df = pd.DataFrame(schedule)
-            # 按年匯總單筆貸款的數據
-            yearly_loan_summary = loan_schedule_df.groupby('year').agg(
-                annual_debt_payment=('total_payment', 'sum'),
-                year_end_liabilities_nominal=('ending_balance', 'last')
-            ).reset_index()
-            all_yearly_schedules.append(yearly_loan_summary)
-        
-        # 將所有貸款的年度數據合併
-        if all_yearly_schedules:
-            full_amortization_df = pd.concat(all_yearly_schedules)
-            yearly_debt_summary = full_amortization_df.groupby('year').sum().reset_index()
-        
-
-    projection_timeseries = []
-    
-    # 模擬迴圈
-    for age in range(current_age, 101):
-        year_data = {"age": age}
-        current_year = datetime.now().year + (age - current_age)
-
-        # 從預先算好的攤銷表中，直接查詢當年度的數據
-        debt_info_this_year = yearly_debt_summary[yearly_debt_summary['year'] == current_year]
-        annual_debt_payment = debt_info_this_year['annual_debt_payment'].iloc[0] if not debt_info_this_year.empty else 0
-        year_end_liabilities_nominal = debt_info_this_year['year_end_liabilities_nominal'].iloc[0] if not debt_info_this_year.empty else 0
-        # --- [v5.0.0 最終修正] ---
-        # 資產累積期
-        if age < retirement_age:
-            year_data["phase"] = "accumulation"
-            
-            # 1. 計算投資增長：(年初資產) * 報酬率
-            investment_gain_nominal = current_assets * return_rate
-            
-            # 2. 年末資產 = 年初資產 + 投資增長 + 年度新增投資
-            current_assets += investment_gain_nominal + annual_investment
-
-            # 在此階段，假設負債由薪資等非投資收入支付，不影響資產累積
-            year_data["disposable_income_nominal"] = -annual_debt_payment # 此階段的可支配所得為負的還款額
-            year_data["asset_income_nominal"] = 0
-            year_data["pension_income_nominal"] = 0
-            year_data["investment_gain_nominal"] = investment_gain_nominal # <-- 改名
-            year_data["annual_investment_nominal"] = annual_investment  # 年度名義投資
-            year_data["total_income_nominal"] = 0       
-        
-        # 資產提領期
-        else:
-            year_data["phase"] = "decumulation"
-            
-            # 在退休後，負債還款和生活開銷都必須從總收入(含資產提領)中支出
-            asset_income_nominal = (current_assets * dividend_yield) + (current_assets * withdrawal_rate)
-            pension_income_nominal = 0
-            if age >= legal_age:
-                pension_income_nominal = pension_results['summary']['total_monthly_pension'] * 12
-            elif age >= 60:
-                pension_income_nominal = pension_results['labor_pension']['monthly_pension'] * 12
-            
-            total_income_nominal = asset_income_nominal + pension_income_nominal
-            disposable_income_nominal = total_income_nominal - annual_debt_payment
-            
+    # 以向量化攤還引擎一次算出所有負債的逐年攤銷摘要，並依年齡對齊
+    yearly_debt_summary = build_yearly_debt_summary(liabilities_df)
+    debt_by_age = align_debt_by_age(yearly_debt_summary, current_age, datetime.now().year)
 
-            # 2. 更新資產價值
-            #    (退休後不再有 annual_investment 的注入)
-            investment_gain_nominal = current_assets * return_rate
-            net_withdrawal_from_assets = asset_income_nominal - (current_assets * dividend_yield)
-            current_assets = (current_assets - net_withdrawal_from_assets) + investment_gain_nominal
-
-            year_data["disposable_income_nominal"] = disposable_income_nominal
-            year_data["asset_income_nominal"] = asset_income_nominal
-            year_data["pension_income_nominal"] = pension_income_nominal
-            year_data["total_income_nominal"] = total_income_nominal # [新增] 記錄總收入
-            year_data["withdrawal_percentage"] = withdrawal_rate * 100
-            year_data["investment_gain_nominal"] = investment_gain_nominal # <-- 改名
-            year_data["annual_investment_nominal"] = 0 # 年度名義投資
-        # --- [修正結束] ---
-
-        # --- [v5.0.0 最終修正] ---
-        # 1. 將通膨調整邏輯移至迴圈主體，確保每年都會執行
-        years_from_now = age - current_age
-        inflation_divisor = (1 + inflation_rate) ** (years_from_now + 1)
-
-        # 預先計算好所有前端需要的懸停資訊 (包含名目與實質)
-        year_data["monthly_disposable_income_nominal"] = year_data.get("disposable_income_nominal", 0) / 12 #每月可支配所得的名目價值
-        year_data["monthly_disposable_income_real_value"] = year_data.get("disposable_income_nominal", 0) / 12 / inflation_divisor #每月可支配所得的實際價值
-
-        # 2. 儲存年末資產與負債 (名目與實質價值)
-        year_data["year_end_assets_nominal"] = current_assets #年終名目資產
-        if not current_liabilities_df.empty:
-            year_data["year_end_liabilities_nominal"] = year_end_liabilities_nominal
-        else:
-            year_data["year_end_liabilities_nominal"] = 0 #年終名義負債       
-        year_data["year_end_assets_real_value"] = current_assets / inflation_divisor #年末資產實際價值
-        year_data["year_end_liabilities_real_value"] = year_data["year_end_liabilities_nominal"] / inflation_divisor #年末負債實際價值
-
-        # 產生所有需要的名目與實質欄位
-        for key in ["year_end_assets", "year_end_liabilities", "disposable_income", "asset_income", "pension_income", "total_income", "investment_gain", "annual_investment"]:
-             nominal_key = f"{key}_nominal"
-             real_key = f"{key}_real_value"
-             year_data[real_key] = year_data.get(nominal_key, 0) / inflation_divisor
-
-        projection_timeseries.append(year_data)
-
-    first_year_nominal = next((y["disposable_income_nominal"] for y in projection_timeseries if y["age"] == retirement_age), 0)
-    first_year_real = next((y["disposable_income_real_value"] for y in projection_timeseries if y["age"] == retirement_age), 0)
-    # 最終輸出模型 (擴充 summary)
-    summary = {
-        "assets_at_retirement_nominal": next((y["year_end_assets_nominal"] for y in projection_timeseries if y["age"] == retirement_age), 0),
-        "assets_at_retirement_real_value": next((y["year_end_assets_real_value"] for y in projection_timeseries if y["age"] == retirement_age), 0),
-        
-        "first_year_disposable_income_nominal": first_year_nominal,
-        "first_year_disposable_income_real_value": first_year_real,
-        
-        # 新增每月可支配所得
-        "first_month_disposable_income_nominal": first_year_nominal / 12,
-        "first_month_disposable_income_real_value": first_year_real / 12
+    return {
+        "current_assets": current_assets, "current_age": current_age, "retirement_age": retirement_age,
+        "return_rate": return_rate, "dividend_yield": dividend_yield, "withdrawal_rate": withdrawal_rate,
+        "inflation_rate": inflation_rate, "annual_investment": annual_investment,
+        "labor_pension_monthly": pension_results['labor_pension']['monthly_pension'],
+        "total_pension_monthly": pension_results['summary']['total_monthly_pension'],
+        "legal_age": legal_age,
+        "annual_debt_payment": debt_by_age['annual_debt_payment'],
+        "year_end_liabilities": debt_by_age['year_end_liabilities_nominal'],
     }
+
+
+def get_holistic_financial_projection(user_id: str) -> Dict:
+    # --- [v5.5.0 修正] 以陣列引擎取代逐年 dict 迴圈 ---
+    inputs = load_projection_inputs(user_id)
+
+    # 執行陣列化模擬，回傳以欄為單位的結果 (dict of arrays)
+    projection = run_projection(**inputs)
+    summary = summarize_at_retirement(projection, inputs['current_age'], inputs['retirement_age'])
     
-    return {"summary": summary, "projection_timeseries": projection_timeseries}
+    return {"summary": summary, "projection_timeseries": projection}
+
+
+def get_monte_carlo_projection(user_id: str, n_paths: int = 10000, return_volatility: float = 15.0,
+                               inflation_volatility: float = 1.0, correlation: float = 0.0,
+                               seed: Optional[int] = None) -> Dict:
+    """
+    [v5.5.0 新增] 蒙地卡羅模式：以隨機報酬率與通膨率路徑 (路徑數 × 年數) 一次向量化模擬。
+    波動度以百分比輸入 (與其他假設一致)，回傳 P10/P50/P90 區間與資產耗盡機率。
+    """
+    inputs = load_projection_inputs(user_id)
+    return run_monte_carlo(
+        inputs, n_paths=n_paths, return_volatility=return_volatility / 100,
+        inflation_volatility=inflation_volatility / 100, correlation=correlation, seed=seed
+    )
+
+
+def _projection_pension_for_ages(user_id: str, projection_inputs: Dict):
+    """回傳供 run_sensitivity_grid / solve_earliest_retirement_age 使用的「退休年齡 → 退休金月領金額」函數。"""
+    plan, _ = load_pension_data(user_id)
+    return lambda ages: pensions_by_retirement_age(plan, projection_inputs['current_age'],
+                                                   projection_inputs['retirement_age'], ages)
+
+
+def get_sensitivity_grid(user_id: str, return_rates: List[float], withdrawal_rates: List[float],
+                         inflation_rates: List[float], retirement_ages: List[int]) -> Dict:
+    """
+    [v5.5.0 新增] 整合性模擬的多維敏感度網格 (報酬率 × 提領率 × 通膨率 × 退休年齡)。
+    比率以百分比輸入，回傳的座標軸亦為百分比；退休金月領金額依網格中的每個退休年齡重算。
+    """
+    inputs = load_projection_inputs(user_id)
+    grid = run_sensitivity_grid(
+        inputs, np.asarray(return_rates) / 100, np.asarray(withdrawal_rates) / 100,
+        np.asarray(inflation_rates) / 100, retirement_ages, pension_for_ages=_projection_pension_for_ages(user_id, inputs)
+    )
+    for key in ["return_rate", "withdrawal_rate", "inflation_rate"]:
+        grid[key] = grid[key] * 100
+    return grid
+
+
+def solve_retirement_goal(user_id: str, target_monthly_income: float, solve_for: str = "annual_investment") -> Dict:
+    """
+    [v5.5.0 新增] 目標反推：找出達成「退休首月實質可支配所得」目標的最低每年投資金額或最早退休年齡。
+    直接在記憶體中求解，不需寫回 Firestore 或重新提交表單。
+
+    Args:
+        target_monthly_income: 目標月可支配所得 (今日購買力)
+        solve_for: "annual_investment" 或 "retirement_age"
+
+    Returns:
+        dict: {"solve_for", "feasible", 以及求得的值與達成的月所得}
+    """
+    inputs = load_projection_inputs(user_id)
+    if solve_for == "retirement_age":
+        solution = solve_earliest_retirement_age(inputs, target_monthly_income,
+                                                 pension_for_ages=_projection_pension_for_ages(user_id, inputs))
+    else:
+        solution = solve_required_investment(inputs, target_monthly_income)
+    return {"solve_for": solve_for, "feasible": solution is not None, **(solution or {})}
+
+
+def get_monthly_financial_projection(user_id: str, retirement_date=None, one_off_expenses: Optional[List[Dict]] = None) -> Dict:
+    """
+    [v5.5.0 新增] 月解析度的整合性模擬：貸款起訖、寬限期結束、退休月份、勞退/勞保請領與一次性支出
+    皆以事件佇列排程，不再四捨五入到整年。
+
+    Args:
+        retirement_date: 退休年月 (date/datetime)，預設為退休年齡當年的本月
+        one_off_expenses: [{"name", "date", "amount"}, ...]
+
+    Returns:
+        dict: {"events": 排序後的事件列表, "timeseries": 月度欄式結果 (含 date 欄位)}
+    """
+    inputs = load_projection_inputs(user_id)
+    liabilities_df = load_user_liabilities(user_id)
+    current_age = inputs['current_age']
+    now = datetime.now()
+    first_month_index = now.year * 12 + now.month - 1
+    n_months = (PROJECTION_END_AGE - current_age + 1) * 12
+
+    def month_offset(value) -> int:
+        value = pd.to_datetime(value)
+        return value.year * 12 + value.month - 1 - first_month_index
+
+    retirement_month = (inputs['retirement_age'] - current_age) * 12 if retirement_date is None else month_offset(retirement_date)
+    expenses = [{"month_offset": month_offset(e['date']), "name": e.get('name', ''), "amount": float(e.get('amount') or 0.0)}
+                for e in (one_off_expenses or []) if e.get('date') is not None]
+
+    debt = build_monthly_debt_series(liabilities_df, first_month_index, n_months)
+    events = build_event_queue(current_age, retirement_month, inputs['legal_age'], n_months, debt['loan_events'], expenses)
+    timeseries = run_monthly_projection(
+        inputs['current_assets'], current_age, events, inputs['return_rate'], inputs['dividend_yield'],
+        inputs['withdrawal_rate'], inputs['inflation_rate'], inputs['annual_investment'],
+        inputs['labor_pension_monthly'], inputs['total_pension_monthly'],
+        monthly_debt_payment=debt['payment'], monthly_liabilities=debt['balance']
+    )
+    timeseries['date'] = pd.period_range(start=pd.Period(now, freq='M'), periods=n_months, freq='M').strftime('%Y-%m').to_numpy()
+    for event in events:
+        event['date'] = timeseries['date'][event['month_offset']]
+    return {"events": events, "timeseries": timeseries}
+
+
+# --- [v5.5.0 新增] 歷史報酬回測 ---
+# 指數歷史價格只下載一次並存於本機，回測本身不需網路
+MARKET_HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "market_history")
+BACKTEST_INDEX_OPTIONS = {"^TWII": "台股加權指數", "^GSPC": "標普500指數"}
+
+
+def load_index_year_end_closes(ticker: str, refresh: bool = False) -> pd.Series:
+    """
+    讀取指數已結束年度的年底收盤價；本機無快取、快取缺少上一個已結束年度 (跨年後) 或 refresh=True 時，
+    才以 yfinance 下載完整歷史並存檔。進行中年度的最新月收盤並非年底價，不寫入快取。
+    """
+    path = os.path.join(MARKET_HISTORY_DIR, f"{ticker.replace('^', '')}_year_end.csv")
+    last_complete_year = datetime.now().year - 1
+    if not refresh and os.path.exists(path):
+        closes = pd.read_csv(path, index_col='year')['close']
+        if not closes.empty and closes.index.max() >= last_complete_year:
+            return closes[closes.index <= last_complete_year]
+    history = yf.Ticker(ticker).history(period="max", interval="1mo", auto_adjust=False)
+    if history.empty:
+        logging.warning(f"無法下載 {ticker} 的歷史價格")
+        return pd.Series(dtype=float)
+    closes = history['Close'].groupby(history.index.year).last()
+    closes = closes[closes.index <= last_complete_year]
+    closes.index.name = 'year'
+    os.makedirs(MARKET_HISTORY_DIR, exist_ok=True)
+    closes.rename('close').to_csv(path)
+    return closes.rename('close')
+
+
+@st.cache_data(ttl=86400)
+def load_blended_annual_returns(weights: Dict[str, float]) -> pd.Series:
+    """
+    依權重混合多個指數的年報酬 (每年再平衡)，只保留所有指數皆有資料且已結束的年度。
+    年度是否已結束由 load_index_year_end_closes 依當下日期判斷 (跨年後會自動補上剛結束的年度)。
+    注意：價格指數不含股息，且未做匯率換算。
+    """
+    returns = pd.DataFrame({ticker: load_index_year_end_closes(ticker).pct_change() for ticker in weights}).dropna()
+    total_weight = sum(weights.values()) or 1.0
+    return sum(returns[ticker] * weight for ticker, weight in weights.items()) / total_weight
+
+
+def get_historical_backtest(user_id: str, weights: Dict[str, float]) -> Dict:
+    """
+    [v5.5.0 新增] 以混合指數的實際歷年報酬重播使用者的計畫 (所有起始年度一次向量化計算)。
+    價格指數不含股息，因此每年報酬加上使用者設定的預期股息率以近似總報酬。
+    """
+    inputs = load_projection_inputs(user_id)
+    annual_returns = load_blended_annual_returns(weights)
+    if annual_returns.empty:
+        return {}
+    return run_historical_backtest(inputs, annual_returns.index.to_numpy(), annual_returns.to_numpy(),
+                                   return_adjustment=inputs['dividend_yield'])
     
 # --- [v4.1] 台灣退休金計算引擎 ---
 class RetirementCalculator:
@@ -781,6 +961,12 @@ class RetirementCalculator:
             80: 8.557468828, 81: 7.649444957, 82: 7.649444957, 83: 6.731003328, 84: 5.802024418, 85: 5.802024418
         }
         # --- [數據更新結束] ---
+
+        # [v5.5.0 新增] 預先轉為排序後的陣列，供向量化插值使用
+        self.annuity_ages = np.array(sorted(self.annuity_factor_table), dtype=float)
+        self.annuity_factors = np.array([self.annuity_factor_table[a] for a in sorted(self.annuity_factor_table)])
+        self.life_expectancy_ages = np.array(sorted(self.life_expectancy_table), dtype=float)
+        self.life_expectancies = np.array([self.life_expectancy_table[a] for a in sorted(self.life_expectancy_table)], dtype=float)
     
     def validate_inputs(self, **kwargs) -> List[str]:
         """
@@ -824,47 +1010,25 @@ class RetirementCalculator:
         根據出生年計算法定可請領勞保年金的年齡
         1956年以前為60歲，之後每年遞增1歲，至1961年後皆為65歲
         """
-        if birth_year <= 1956:
-            return 60
-        elif birth_year == 1957:
-            return 61
-        elif birth_year == 1958:
-            return 62
-        elif birth_year == 1959:
-            return 63
-        elif birth_year == 1960:
-            return 64
-        else:
-            return 65
+        return int(self.legal_retirement_age_batch(birth_year))
+
+    def legal_retirement_age_batch(self, birth_year) -> np.ndarray:
+        """[v5.5.0 新增] legal_retirement_age 的向量化版本，birth_year 可為陣列。"""
+        return np.clip(60 + (np.asarray(birth_year, dtype=int) - 1956), 60, 65)
 
     def get_annuity_factor(self, retirement_age: int) -> float:
         """
-        取得年金現值因子，支援插值計算
+        取得年金現值因子，支援插值計算 (超出表格範圍時使用邊界值)
         """
-        if retirement_age in self.annuity_factor_table:
-            return self.annuity_factor_table[retirement_age]
-        
-        # 如果年齡超出表格範圍，使用邊界值
-        if retirement_age < min(self.annuity_factor_table.keys()):
-            return self.annuity_factor_table[min(self.annuity_factor_table.keys())]
-        if retirement_age > max(self.annuity_factor_table.keys()):
-            return self.annuity_factor_table[max(self.annuity_factor_table.keys())]
-        
-        # 線性插值計算
-        ages = sorted(self.annuity_factor_table.keys())
-        for i in range(len(ages) - 1):
-            if ages[i] < retirement_age < ages[i + 1]:
-                age1, age2 = ages[i], ages[i + 1]
-                factor1, factor2 = self.annuity_factor_table[age1], self.annuity_factor_table[age2]
-                # 線性插值
-                factor = factor1 + (factor2 - factor1) * (retirement_age - age1) / (age2 - age1)
-                print(f"📊 使用插值計算年金現值因子：{factor:.2f}（介於{age1}歲:{factor1:.2f}與{age2}歲:{factor2:.2f}之間）")
-                return factor
-        
-        # 備用方案：使用最接近的年齡
-        closest = min(self.annuity_factor_table.keys(), key=lambda x: abs(x - retirement_age))
-        print(f"⚠️ 使用最接近年齡 {closest} 的年金現值因子：{self.annuity_factor_table[closest]:.2f}")
-        return self.annuity_factor_table[closest]
+        return float(self.get_annuity_factor_batch(retirement_age))
+
+    def get_annuity_factor_batch(self, retirement_age) -> np.ndarray:
+        """[v5.5.0 新增] 以 np.interp 一次對多個年齡做線性插值 (超出表格範圍時使用邊界值)。"""
+        return np.interp(np.asarray(retirement_age, dtype=float), self.annuity_ages, self.annuity_factors)
+
+    def get_life_expectancy_batch(self, age) -> np.ndarray:
+        """[v5.5.0 新增] 依簡易生命表以線性插值取得平均餘命 (超出表格範圍時使用邊界值)。"""
+        return np.interp(np.asarray(age, dtype=float), self.life_expectancy_ages, self.life_expectancies)
 
     def adjust_for_inflation(self, amount: float, years: int, inflation_rate: Optional[float] = None) -> float:
         """
@@ -886,7 +1050,8 @@ class RetirementCalculator:
                                          employer_rate: float, employee_rate: float,
                                          years_to_retirement: int, annual_return_rate: float,
                                          retirement_age: int, current_contributed_years: int,
-                                         salary_growth_rate: float = 0.0, verbose: bool = True) -> Dict:
+                                         salary_growth_rate: float = 0.0, verbose: bool = True,
+                                         include_details: bool = False) -> Dict:
         """
         精確計算勞退個人專戶退休金累積與預估月領金額
 
@@ -901,6 +1066,7 @@ class RetirementCalculator:
             current_contributed_years (int): 已提繳年數（過去）
             salary_growth_rate (float): 薪資年成長率（%），預設為 0
             verbose (bool): 是否輸出詳細說明
+            include_details (bool): 是否建立逐年提繳明細 (contribution_details)，僅供 UI 顯示時使用
 
         Returns:
             dict: 包含是否可月領、預估總額與月領金額等資訊
@@ -937,56 +1103,114 @@ class RetirementCalculator:
         if years_to_retirement < 0 or monthly_salary <= 0:
             return result
 
-        actual_rate = max(annual_return_rate, self.min_guaranteed_return)
-        total_contribution_rate = (employer_rate + employee_rate) / 100
-        future_value = current_principal
+        # [v5.5.0 修正] 以封閉式向量化計算取代逐年迴圈；逐年明細僅在 include_details=True 時建立
+        batch = self.calculate_labor_pension_batch(
+            current_principal, monthly_salary, employer_rate + employee_rate, years_to_retirement,
+            annual_return_rate, retirement_age, current_contributed_years, salary_growth_rate
+        )
+        result['final_amount'] = batch['final_amount'].item() # 這是退休當下的帳戶價值
+        result['lump_sum'] = batch['lump_sum'].item() # 一次領的金額以請領日為準
+        result['real_value'] = batch['real_value'].item()
+        if include_details:
+            result['contribution_details'] = self.labor_pension_contribution_details(
+                current_principal, monthly_salary, employer_rate + employee_rate,
+                years_to_retirement, annual_return_rate, salary_growth_rate
+            )
+
+        # 判斷月領資格：年資≥15年 且 年滿60歲 (請領年齡必定為60歲，故只需判斷年資)
+        if batch['can_monthly_payment'].item():
+            result['can_monthly_payment'] = True
+            result['monthly_pension'] = batch['monthly_pension'].item()
+            result['monthly_years'] = self.get_annuity_factor(pension_claim_age) # 使用 60 歲的因子
 
-        # 階段一：計算到「退休日」為止的本金與收益累積
-        contribution_details = []
-        for year in range(1, years_to_retirement + 1):
-            future_salary = monthly_salary * ((1 + salary_growth_rate / 100) ** (year - 1))
-            capped_salary = min(future_salary, self.max_labor_pension_salary)
-            annual_contribution = capped_salary * total_contribution_rate * 12
-            
-            contribution_details.append({
-                'year': year,
-                'monthly_salary': future_salary,
-                'capped_salary': capped_salary,
-                'annual_contribution': annual_contribution,
-                'account_balance_before': future_value,
-                'investment_return': future_value * (actual_rate / 100)
-            })
-            
-            future_value = future_value * (1 + actual_rate / 100) + annual_contribution
-        
-        result['final_amount'] = future_value # 這是退休當下的帳戶價值
-        result['contribution_details'] = contribution_details
-        
-        # --- [v5.0.0 修正] ---
-        # 階段二：如果退休年齡早於請領年齡，模擬後續幾年的純投資收益
-        if retirement_age < pension_claim_age:
-            years_of_growth_only = pension_claim_age - retirement_age
-            for year in range(years_of_growth_only):
-                future_value *= (1 + actual_rate / 100)
-        
-        # 最終用於計算月退俸的，是「請領日」當下的帳戶價值
-        value_at_claim_age = future_value
-        result['lump_sum'] = value_at_claim_age # 一次領的金額也是以請領日為準
+        return result
 
-        # 計算實質購買力 (以請領日的價值計算)
-        years_to_claim_age = years_to_retirement + max(0, pension_claim_age - retirement_age)
-        result['real_value'] = self.adjust_for_inflation(value_at_claim_age, years_to_claim_age)
+    def _labor_pension_paths(self, current_principal, monthly_salary, contribution_rate, n_years: int,
+                             annual_return_rate, salary_growth_rate) -> Dict[str, np.ndarray]:
+        """
+        [v5.5.0 新增] 逐年提繳與帳戶餘額路徑 (最後一軸為年度 1..n_years)。
+        年末餘額以累積乘積求解 B_k = G_k * (B_0 + Σ_{j≤k} c_j / G_j)，G_k = Π (1 + r)。
+        所有參數皆可為可廣播的陣列；比率以百分比表示。
+        """
+        principal = np.asarray(current_principal, dtype=float)[..., None]
+        salary = np.asarray(monthly_salary, dtype=float)[..., None]
+        rate = np.asarray(contribution_rate, dtype=float)[..., None] / 100
+        actual_rate = np.maximum(np.asarray(annual_return_rate, dtype=float), self.min_guaranteed_return)[..., None] / 100
+        growth = np.asarray(salary_growth_rate, dtype=float)[..., None] / 100
+
+        years = np.arange(1, n_years + 1)
+        future_salary = salary * (1 + growth) ** (years - 1)
+        capped_salary = np.minimum(future_salary, self.max_labor_pension_salary)
+        annual_contribution = capped_salary * rate * 12
+
+        cumulative_growth = np.cumprod(np.broadcast_to(1 + actual_rate, np.broadcast_shapes(actual_rate.shape, years.shape)), axis=-1)
+        balance_end = cumulative_growth * (principal + np.cumsum(annual_contribution / cumulative_growth, axis=-1))
+        return {
+            "future_salary": future_salary, "capped_salary": capped_salary,
+            "annual_contribution": annual_contribution, "balance_end": balance_end,
+            "actual_rate": actual_rate[..., 0],
+        }
 
-        # 判斷月領資格：年資≥15年 且 年滿60歲
-        total_years = current_contributed_years + years_to_retirement
-        if total_years >= 15: # 請領年齡必定為60歲，故只需判斷年資
-            result['can_monthly_payment'] = True
-            factor = self.get_annuity_factor(pension_claim_age) # 使用 60 歲的因子
-            monthly_pension = value_at_claim_age / factor / 12
-            result['monthly_pension'] = monthly_pension
-            result['monthly_years'] = factor
+    def calculate_labor_pension_batch(self, current_principal, monthly_salary, contribution_rate,
+                                      years_to_retirement, annual_return_rate, retirement_age,
+                                      current_contributed_years, salary_growth_rate=0.0) -> Dict[str, np.ndarray]:
+        """
+        [v5.5.0 新增] 勞退個人專戶累積的批次 (向量化) 版本。
+        報酬率、薪資、年數等參數皆可為陣列，一次回傳所有組合的結果 (形狀為各參數廣播後的形狀)。
 
-        return result
+        Args:
+            contribution_rate: 雇主 + 自願提繳率合計 (%)
+            其餘參數同 calculate_labor_pension_accurate
+
+        Returns:
+            dict: final_amount, lump_sum, real_value, monthly_pension, can_monthly_payment (皆為 np.ndarray)
+        """
+        pension_claim_age = 60
+        n = np.maximum(np.asarray(years_to_retirement, dtype=int), 0)
+        principal = np.asarray(current_principal, dtype=float)
+        max_years = int(n.max()) if n.size else 0
+
+        paths = self._labor_pension_paths(current_principal, monthly_salary, contribution_rate, max(max_years, 1),
+                                          annual_return_rate, salary_growth_rate)
+        shape = np.broadcast_shapes(paths["balance_end"].shape[:-1], n.shape, principal.shape,
+                                    np.shape(retirement_age), np.shape(current_contributed_years))
+        balance_end = np.broadcast_to(paths["balance_end"], shape + (paths["balance_end"].shape[-1],))
+        idx = np.broadcast_to(np.maximum(n - 1, 0), shape)[..., None]
+        final_amount = np.where(np.broadcast_to(n, shape) > 0,
+                                np.take_along_axis(balance_end, idx, axis=-1)[..., 0],
+                                np.broadcast_to(principal, shape))
+
+        # 退休年齡早於請領年齡時，後續幾年只有投資收益
+        growth_only_years = np.maximum(0, pension_claim_age - np.asarray(retirement_age))
+        lump_sum = final_amount * (1 + paths["actual_rate"]) ** growth_only_years
+        years_to_claim_age = n + growth_only_years
+        real_value = lump_sum / ((1 + self.default_inflation_rate / 100) ** years_to_claim_age)
+
+        can_monthly_payment = np.broadcast_to(np.asarray(current_contributed_years) + n >= 15, lump_sum.shape)
+        monthly_pension = np.where(can_monthly_payment, lump_sum / self.get_annuity_factor(pension_claim_age) / 12, 0.0)
+        return {
+            "final_amount": final_amount, "lump_sum": lump_sum, "real_value": real_value,
+            "monthly_pension": monthly_pension, "can_monthly_payment": can_monthly_payment,
+        }
+
+    def labor_pension_contribution_details(self, current_principal: float, monthly_salary: float,
+                                           contribution_rate: float, years_to_retirement: int,
+                                           annual_return_rate: float, salary_growth_rate: float = 0.0) -> List[Dict]:
+        """[v5.5.0 新增] 建立勞退個人專戶的逐年提繳明細表 (僅在 UI 需要顯示時呼叫)。"""
+        if years_to_retirement <= 0:
+            return []
+        paths = self._labor_pension_paths(current_principal, monthly_salary, contribution_rate, years_to_retirement,
+                                          annual_return_rate, salary_growth_rate)
+        balance_before = np.concatenate([[float(current_principal)], paths["balance_end"][:-1]])
+        details = pd.DataFrame({
+            'year': np.arange(1, years_to_retirement + 1),
+            'monthly_salary': paths["future_salary"],
+            'capped_salary': paths["capped_salary"],
+            'annual_contribution': paths["annual_contribution"],
+            'account_balance_before': balance_before,
+            'investment_return': balance_before * float(paths["actual_rate"]),
+        })
+        return details.to_dict('records')
 
     def calculate_labor_insurance_pension(self, avg_salary: float, insurance_years: int, 
                                           claim_age: int, birth_year: int, verbose: bool = True) -> Dict:
@@ -1051,6 +1275,38 @@ class RetirementCalculator:
         return result
 
 
+    def calculate_labor_insurance_batch(self, avg_salary, insurance_years, claim_age, birth_year) -> Dict[str, np.ndarray]:
+        """
+        [v5.5.0 新增] calculate_labor_insurance_pension 的向量化版本，所有參數皆可為陣列。
+
+        Returns:
+            dict: legal_age, eligible, monthly_pension, formula_a, formula_b, delay_retirement_bonus
+        """
+        avg_salary = np.asarray(avg_salary, dtype=float)
+        insurance_years = np.asarray(insurance_years, dtype=float)
+        legal_age = self.legal_retirement_age_batch(birth_year)
+        eligible = (avg_salary > 0) & (insurance_years >= 15)
+
+        capped_salary = np.minimum(avg_salary, self.max_labor_insurance_salary)
+        formula_a = np.where(
+            insurance_years <= 15,
+            capped_salary * insurance_years * 0.00775 + 3000,
+            capped_salary * 15 * 0.00775 + capped_salary * (insurance_years - 15) * 0.0155 + 3000
+        )
+        formula_b = capped_salary * insurance_years * 0.0155
+        base_pension = np.maximum(formula_a, formula_b)
+
+        delay_years = np.maximum(0, np.asarray(claim_age) - legal_age)
+        delay_bonus = base_pension * np.minimum(delay_years * 0.04, 0.20)
+        return {
+            "legal_age": legal_age,
+            "eligible": eligible,
+            "monthly_pension": np.where(eligible, base_pension + delay_bonus, 0.0),
+            "formula_a": np.where(eligible, formula_a, 0.0),
+            "formula_b": np.where(eligible, formula_b, 0.0),
+            "delay_retirement_bonus": np.where(eligible, delay_bonus, 0.0),
+        }
+
     def calculate_replacement_ratio_suggestions(self, replacement_ratio: float, 
                                               current_salary: float, years_to_retirement: int) -> Dict:
         """
@@ -1099,17 +1355,27 @@ class RetirementCalculator:
         敏感度分析：不同報酬率下的退休金變化
         """
         return_rates = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
-        results = {}
-        
-        for rate in return_rates:
-            params = base_params.copy()
-            params['annual_return_rate'] = rate
-            result = self.calculate_labor_pension_accurate(**params, verbose=False)
-            results[f"{rate}%"] = {
-                'final_amount': result['final_amount'],
-                'monthly_pension': result['monthly_pension'] if result['can_monthly_payment'] else 0,
-                'real_value': result['real_value']
+
+        # [v5.5.0 修正] 一次以向量化批次計算所有報酬率，不再逐一重跑完整迴圈與明細
+        validation_errors = self.validate_inputs(**{key: base_params[key] for key in [
+            'monthly_salary', 'years_to_retirement', 'employer_rate', 'employee_rate', 'current_contributed_years']})
+        if validation_errors or base_params['years_to_retirement'] < 0 or base_params['monthly_salary'] <= 0:
+            batch = {key: np.zeros(len(return_rates)) for key in ['final_amount', 'monthly_pension', 'real_value']}
+        else:
+            batch = self.calculate_labor_pension_batch(
+                base_params['current_principal'], base_params['monthly_salary'],
+                base_params['employer_rate'] + base_params['employee_rate'], base_params['years_to_retirement'],
+                np.array(return_rates), base_params['retirement_age'], base_params['current_contributed_years'],
+                base_params.get('salary_growth_rate', 0.0)
+            )
+        results = {
+            f"{rate}%": {
+                'final_amount': float(batch['final_amount'][i]),
+                'monthly_pension': float(batch['monthly_pension'][i]),
+                'real_value': float(batch['real_value'][i])
             }
+            for i, rate in enumerate(return_rates)
+        }
         
         if verbose:
             print("\n📊【敏感度分析】報酬率對退休金的影響")
@@ -1224,12 +1490,77 @@ def trigger_scraper() -> bool:
         return False
 
 
+@st.cache_data(ttl=3600)
+def load_model_score_archive():
+    """
+    [v5.5.0 新增] 以單次查詢讀取整個每日評分歸檔 (model_score_archive，每年一份文件)。
+
+    Returns:
+        pd.DataFrame: 以日期為索引，欄位為總分、情境、倉位、各因子分數、VIX 與各市場訊號 ('{市場}|{訊號}'，0/1)。
+                      各列依自身的欄位名稱對齊，某日不存在的欄位為 NaN。
+    """
+    db, _ = init_firebase()
+    try:
+        frames = []
+        for doc in db.collection('model_score_archive').stream():
+            archive = doc.to_dict()
+            rows = archive.get('rows', {})
+            # 每列為 {欄位: 數值}，欄位以名稱對齊而非位置
+            if rows:
+                frames.append(pd.DataFrame.from_dict(rows, orient='index'))
+        if not frames:
+            return pd.DataFrame()
+        history = pd.concat(frames)
+        history.index = pd.to_datetime(history.index)
+        return history.sort_index()
+    except Exception as e:
+        st.error(f"讀取評分歸檔時發生錯誤: {e}")
+        return pd.DataFrame()
+
+# --- [v5.5.0 新增] 精簡序列解碼 (對應 backend/scraper-function/series_codec.py) ---
+def decode_series_arrays(encoded):
+    """
+    將後端 encode_series 產生的精簡序列解碼為 NumPy 陣列。
+
+    Returns:
+        (dates: datetime64[D] 陣列, values: float 陣列)
+    """
+    n = int(encoded.get('n', 0))
+    if n == 0:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype=float)
+    values = np.frombuffer(base64.b64decode(encoded['values']), dtype=np.dtype(encoded.get('dtype', 'f8')).newbyteorder('<'), count=n)
+    start = np.datetime64(encoded['start'], 'D')
+    step = encoded.get('step')
+    if step is None:
+        deltas = np.frombuffer(base64.b64decode(encoded['deltas']), dtype='<i4', count=n)
+        dates = start + np.cumsum(deltas).astype('timedelta64[D]')
+    elif step.startswith('D'):
+        dates = start + (np.arange(n) * int(step[1:])).astype('timedelta64[D]')
+    else:
+        months = start.astype('datetime64[M]') + np.arange(n) * int(step[2:])
+        dates = months.astype('datetime64[D]') if step.startswith('MS') else (months + 1).astype('datetime64[D]') - 1
+    return dates, values.astype(float)
+
+def decode_series(encoded, name='Value'):
+    """
+    將精簡序列 (或舊版 {'YYYY-MM-DD': value} 對照表) 轉為依日期遞增的 pd.Series。
+    """
+    if not encoded:
+        return pd.Series(dtype=float, name=name)
+    if 'values' not in encoded:  # 舊版格式
+        series = pd.Series(encoded, dtype=float, name=name)
+        series.index = pd.to_datetime(series.index)
+        return series.sort_index()
+    dates, values = decode_series_arrays(encoded)
+    return pd.Series(values, index=pd.DatetimeIndex(dates), name=name)
+
 # --- [v5.4.0 修正] ---
 @st.cache_data(ttl=900)
 def load_latest_model_data():
     """
     [v5.4.0] 從 Firestore 讀取最新的模型數據包 (daily_model_data)。
     會先嘗試讀取今天的數據，如果失敗則讀取最新的一份。
+    [v5.5.0 修正] 只讀取摘要文件 (訊號與評分)，並附上 'doc_id' 供 load_model_detail 讀取明細。
     """
     db, _ = init_firebase()
     try:
@@ -1240,7 +1571,7 @@ def load_latest_model_data():
         doc = doc_ref.get()
         if doc.exists:
             print(f"  > [Utils] 成功讀取到今日 ({doc_id}) 的模型數據。")
-            return doc.to_dict()
+            return {**doc.to_dict(), "doc_id": doc.id}
         else:
             # 如果今天的文件不存在，嘗試讀取最新的一份
             print(f"  > [Utils] 未找到今日數據，嘗試讀取最新的一份...")
@@ -1248,10 +1579,84 @@ def load_latest_model_data():
             docs = list(query.stream())
             if docs:
                 print(f"  > [Utils] 成功讀取到最新的一份歷史數據: {docs[0].id}")
-                return docs[0].to_dict()
+                return {**docs[0].to_dict(), "doc_id": docs[0].id}
             return None # 如果集合完全是空的
             
     except Exception as e:
         st.error(f"讀取模型數據時發生錯誤: {e}")
         return None
 # --- [新增結束] ---
+
+@st.cache_data(ttl=900)
+def load_model_detail(doc_id, family):
+    """
+    [v5.5.0 新增] 依需要讀取單一類別的模型原始數據 (kdj / fred / dbnomics / corporate_financials)。
+    舊版文件沒有明細子集合時，改從摘要文件內嵌的 raw_data 取出。
+    """
+    db, _ = init_firebase()
+    try:
+        doc_ref = db.collection('daily_model_data').document(doc_id)
+        detail = doc_ref.collection('details').document(family).get()
+        if detail.exists:
+            return detail.to_dict().get('data', {})
+        legacy = doc_ref.get()
+        return legacy.to_dict().get('data', {}).get('raw_data', {}).get(family, {}) if legacy.exists else {}
+    except Exception as e:
+        st.error(f"讀取模型明細數據 ({family}) 時發生錯誤: {e}")
+        return {}
+
+# --- [v5.5.0 新增] J值+VIX 訊號回測 ---
+# 與 backend/scraper-function 的 market_tickers 相同 (依頁面顯示順序)
+JVIX_MARKETS = {"標普500指數": "^GSPC", "納斯達克100指數": "^IXIC", "費城半導體指數": "^SOX", "台股加權指數": "^TWII"}
+JVIX_VIX_TICKER = "^VIX"
+
+@st.cache_data(ttl=21600)
+def load_market_price_history(tickers: Tuple[str, ...]) -> pd.DataFrame:
+    """
+    讀取多個市場的日線 OHLC (欄位為 (欄位, ticker) 的 MultiIndex，同 yf.download)。
+    優先讀取後端價格儲存 (series_store/prices__{ticker})，缺少的市場才以 yfinance 下載十年資料。
+    """
+    db, _ = init_firebase()
+    frames, missing = {}, []
+    for ticker in tickers:
+        try:
+            doc = db.collection('series_store').document(f"prices__{ticker}").get()
+            if doc.exists:
+                data = doc.to_dict()
+                frames[ticker] = pd.DataFrame(data.get('columns', {}), index=pd.to_datetime(data.get('dates', [])), dtype=float)
+                continue
+        except Exception as e:
+            logging.warning(f"讀取 {ticker} 價格儲存失敗: {e}")
+        missing.append(ticker)
+    if missing:
+        downloaded = yf.download(missing, period="10y", auto_adjust=True, progress=False, group_by='column')
+        if not downloaded.empty:
+            if not isinstance(downloaded.columns, pd.MultiIndex):
+                downloaded.columns = pd.MultiIndex.from_product([downloaded.columns, missing[:1]])
+            downloaded.index = pd.to_datetime(downloaded.index).tz_localize(None)
+            for ticker in missing:
+                if ticker in downloaded.columns.get_level_values(1):
+                    frames[ticker] = downloaded.xs(ticker, axis=1, level=1)[['Open', 'High', 'Low', 'Close']].dropna(how='all')
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1, sort=True).swaplevel(axis=1).sort_index(axis=1)
+
+@st.cache_data(ttl=21600)
+def get_jvix_signal_inputs() -> Dict:
+    """準備 J值+VIX 回測所需的每日 J 值 (週/月)、VIX 與收盤價；價格缺漏時回傳空 dict。"""
+    prices = load_market_price_history(tuple(JVIX_MARKETS.values()) + (JVIX_VIX_TICKER,))
+    if prices.empty or JVIX_VIX_TICKER not in prices['Close'].columns:
+        return {}
+    return prepare_signal_inputs(prices, JVIX_MARKETS, JVIX_VIX_TICKER)
+
+def get_jvix_backtest(j_threshold: float = 20, vix_threshold: float = 25,
+                      horizons_months: Tuple[int, ...] = (1, 3, 6, 12), episodes_only: bool = True) -> Dict:
+    """以指定門檻回測 J值+VIX 訊號 (所有市場、週/月訊號一次計算)。"""
+    inputs = get_jvix_signal_inputs()
+    return run_jvix_backtest(inputs, j_threshold, vix_threshold, horizons_months, episodes_only) if inputs else {}
+
+def get_jvix_threshold_grid(j_thresholds, vix_thresholds, horizon_months: int = 3,
+                            signal_name: str = "mid_term_pullback", episodes_only: bool = True) -> Dict:
+    """一次掃描所有 (J 門檻, VIX 門檻) 組合的訊號表現。"""
+    inputs = get_jvix_signal_inputs()
+    return run_jvix_threshold_grid(inputs, j_thresholds, vix_thresholds, horizon_months, signal_name, episodes_only) if inputs else {}